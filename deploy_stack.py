@@ -1,28 +1,57 @@
-import contextlib
+import hashlib
 import os
 import shutil
+import struct
 import subprocess
 import time
 import zipfile
-from datetime import datetime
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from os.path import abspath, join, relpath
 from pathlib import Path
-from typing import Dict, List, Any, Union, Optional, Tuple, Literal
+from typing import Deque, Dict, Iterator, List, Any, Union, Optional, Tuple, Literal
 import argparse
 import sys
 import boto3
-from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
 
 from botocore.exceptions import WaiterError, ClientError
 
 AWS_REGION = "us-west-2"
 BASE_DIRECTORY = abspath(join(abspath(__file__), ".."))
-DEPLOY_PACKAGE_DIR = join(BASE_DIRECTORY, "deploy_package")
+BUILD_CACHE_DIR = join(BASE_DIRECTORY, ".build_cache")
+DEPENDENCIES_CACHE_DIR = join(BUILD_CACHE_DIR, "dependencies")
+CODE_DIRECTORIES = ["lambdas", "models", "utils"]
+# Lambda adds this directory of a layer to the python path
+LAYER_PYTHON_DIRECTORY = "python"
 BYTES_IN_MB = 1024**2
 
+# zip entries get a fixed timestamp (1980-01-01 00:00, the earliest a zip can hold) and permissions,
+# so identical trees produce identical zips
+ZIP_DOS_DATE = (1 << 5) | 1
+ZIP_DOS_TIME = 0
+ZIP_FILE_MODE = 0o644
+ZIP_CREATE_SYSTEM_UNIX = 3
+ZIP_UTF8_FLAG = 0x800
+# without zip64 extensions, a zip holds less than 64K entries and 4GB
+ZIP_MAX_ENTRIES = 0xFFFF
+ZIP_MAX_OFFSET = 0xFFFFFFFF
+HASH_LENGTH = 16
+
+# files that are already compressed, or tiny, are stored rather than deflated
+DEFAULT_STORE_EXTENSIONS = (".zip", ".gz", ".bz2", ".xz", ".whl", ".jar", ".png", ".jpg", ".jpeg")
+DEFAULT_MIN_DEFLATE_BYTES = 256
+DEFAULT_COMPRESSION_LEVEL = 6
+COMPRESSION_WORKERS = os.cpu_count() or 4
+# S3 requires every part but the last to be at least 5MB
+UPLOAD_PART_BYTES = 8 * BYTES_IN_MB
+UPLOAD_CONCURRENCY = 8
+
 USED_AWS_SERVICES = sorted(
     [
+        "apigatewaymanagementapi",
         "dynamodb",
         "lambda",
     ]
@@ -33,7 +62,8 @@ def deploy_cloudformation_template(
     stack_name: str,
     template_file_path: str,
     pair_name: str,
-    now_ms: int,
+    package_hashes: Optional[Dict[str, str]] = None,
+    parameters: Optional[Dict[str, str]] = None,
 ) -> None:
     cloudformation_client = boto3.client("cloudformation", region_name=AWS_REGION)
     print(f"Deploying template [{stack_name}]")
@@ -45,7 +75,7 @@ def deploy_cloudformation_template(
         should_create = True
     print("should create = " + str(should_create))
 
-    stack_parameters: Dict[str, Any] = {"PairName": pair_name, "CodePackageDate":str(now_ms)}
+    stack_parameters: Dict[str, Any] = {"PairName": pair_name, **(package_hashes or {}), **(parameters or {})}
     formatted_parameters: List[Dict[str, Union[str, bool]]] = [
         {"ParameterKey": key, "ParameterValue": value} for key, value in stack_parameters.items()
     ]
@@ -86,12 +116,17 @@ def _update_stack(
     template_file_path: str,
     formatted_parameters: List[Dict[str, Union[str, bool]]],
 ) -> None:
+    template = _fetch_template(template_file_path)
+
+    # creating a change set takes a while even when there is nothing to change
+    if _is_stack_up_to_date(cloudformation_client, stack_name, template, formatted_parameters):
+        print(f"Stack [{stack_name}] is up to date")
+        return
+
     print(f"Creating Change Sets [{stack_name}]")
 
     _delete_change_sets(cloudformation_client, stack_name)
 
-    template = _fetch_template(template_file_path)
-
     if not (
         change_set_name := _create_change_set(
             cloudformation_client=cloudformation_client,
@@ -106,6 +141,28 @@ def _update_stack(
     _exec_change_set(cloudformation_client, change_set_name, stack_name)
 
 
+def _is_stack_up_to_date(
+    cloudformation_client: boto3.client,
+    stack_name: str,
+    template: str,
+    formatted_parameters: List[Dict[str, Union[str, bool]]],
+) -> bool:
+    stack = cloudformation_client.describe_stacks(StackName=stack_name)["Stacks"][0]
+    if not stack["StackStatus"].endswith("_COMPLETE") or stack["StackStatus"].startswith("ROLLBACK"):
+        return False
+
+    deployed_parameters = {
+        parameter["ParameterKey"]: parameter["ParameterValue"] for parameter in stack.get("Parameters", [])
+    }
+    # the stack may have parameters the caller leaves to their defaults, so only the passed ones are compared
+    if any(deployed_parameters.get(parameter["ParameterKey"]) != parameter["ParameterValue"]
+           for parameter in formatted_parameters):
+        return False
+
+    deployed_template = cloudformation_client.get_template(StackName=stack_name, TemplateStage="Original")
+    return deployed_template["TemplateBody"] == template
+
+
 def _delete_change_sets(cloudformation_client: boto3.client, stack_name: str) -> None:
     kwargs = {"StackName": stack_name}
     response = cloudformation_client.list_change_sets(**kwargs)
@@ -218,43 +275,101 @@ def _get_stack_status(stack_name_to_check: str) -> Optional[str]:
     return stack_status
 
 
-def deploy_code_package(pair_name: str, now_ms: int) -> None:
+@dataclass(frozen=True)
+class CompressionPolicy:
+    """
+    Decides which files are deflated and which are stored as they are.
+    Files that are already compressed, or too small for deflating to pay off, are stored,
+     and so is any file deflating would not make smaller.
+    """
+    store_extensions: Tuple[str, ...] = DEFAULT_STORE_EXTENSIONS
+    min_deflate_bytes: int = DEFAULT_MIN_DEFLATE_BYTES
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL
+
+    def should_deflate(self, archive_name: str, size: int) -> bool:
+        return size >= self.min_deflate_bytes and not archive_name.lower().endswith(self.store_extensions)
+
+
+def deploy_code_package(pair_name: str, policy: CompressionPolicy = CompressionPolicy()) -> Dict[str, str]:
+    """
+    Builds the dependencies layer and the code package, and uploads each of them
+     unless a package with the same content was already uploaded.
+    The dependencies are only rebuilt when the requirements change, and the code package holds just our own code.
+    :param pair_name: The name of the pair, which names the code bucket
+    :param policy: Decides which of the packages' files are deflated
+    :return: The stack parameters naming the packages' S3 keys- the hash of each package's content
+    """
     bucket_name = f"huji-lightricks-pitkiot-code-{pair_name}-bucket"
-    key = f"{pair_name}-{now_ms}-code-package.zip"
     config = Config(connect_timeout=10, read_timeout=10, retries={"total_max_attempts": 20})
     s3_client = boto3.client("s3", region_name=AWS_REGION, config=config)
+    start = time.perf_counter()
+
+    print("Installing dependencies")
+    dependencies_directory = _install_dependencies()
+    dependencies_hash = os.path.basename(dependencies_directory)
+    layer_files = [
+        (f"{LAYER_PYTHON_DIRECTORY}/{archive_name}", full_path)
+        for archive_name, full_path in _package_files(dependencies_directory)
+    ]
+    _upload_package(s3_client, bucket_name, _dependencies_layer_key(pair_name, dependencies_hash), layer_files,
+                    policy)
 
-    print("Creating code package")
-    _create_code_package()
+    code_files = [file for directory in CODE_DIRECTORIES for file in _package_files(BASE_DIRECTORY, directory)]
+    code_package_hash = _hash_files(code_files)
+    _upload_package(s3_client, bucket_name, _code_package_key(pair_name, code_package_hash), code_files, policy)
 
-    print("Removing unused Botocore service packages")
-    _remove_unused_botocore_services()
+    print(f"Packages ready after {time.perf_counter() - start:.1f} seconds")
+    return {"DependenciesHash": dependencies_hash, "CodePackageHash": code_package_hash}
 
-    print("Zipping and uploading code package")
-    _zip_and_upload(s3_client, bucket_name, key, now_ms)
 
-    print("Cleanup")
-    _cleanup()
+def _upload_package(
+    boto_s3_client: boto3.client,
+    s3_bucket_name: str,
+    key: str,
+    files: List[Tuple[str, str]],
+    policy: CompressionPolicy,
+) -> None:
+    if _is_uploaded(boto_s3_client, s3_bucket_name, key):
+        print(f"Package {key} is already uploaded")
+        return
 
+    print(f"Zipping and uploading package {key}")
+    _zip_and_upload(boto_s3_client, s3_bucket_name, key, files, policy)
 
-def _create_code_package() -> None:
-    try:
-        shutil.rmtree(DEPLOY_PACKAGE_DIR)
-    except FileNotFoundError:
-        pass
 
-    print("Copying code into deploy package")
-    Path(join(DEPLOY_PACKAGE_DIR, "lambdas")).mkdir(parents=True, exist_ok=True)
-    _copy_directory(join(BASE_DIRECTORY, "lambdas"), join(DEPLOY_PACKAGE_DIR, "lambdas"))
+def _code_package_key(pair_name: str, package_hash: str) -> str:
+    return f"{pair_name}-{package_hash}-code-package.zip"
 
-    Path(join(DEPLOY_PACKAGE_DIR, "models")).mkdir(parents=True, exist_ok=True)
-    _copy_directory(join(BASE_DIRECTORY, "models"), join(DEPLOY_PACKAGE_DIR, "models"))
 
-    Path(join(DEPLOY_PACKAGE_DIR, "utils")).mkdir(parents=True, exist_ok=True)
-    _copy_directory(join(BASE_DIRECTORY, "utils"), join(DEPLOY_PACKAGE_DIR, "utils"))
+def _dependencies_layer_key(pair_name: str, dependencies_hash: str) -> str:
+    return f"{pair_name}-{dependencies_hash}-dependencies-layer.zip"
 
-    print("Installing Dependencies")
 
+def _dependencies_hash() -> str:
+    # the installed dependencies depend on the requirements, the interpreter they were installed for,
+    # and the botocore services kept
+    digest = hashlib.sha256()
+    with open(join(BASE_DIRECTORY, "requirements.txt"), "rb") as requirements_file:
+        digest.update(requirements_file.read())
+    digest.update(f"python{sys.version_info.major}.{sys.version_info.minor}".encode())
+    digest.update(",".join(USED_AWS_SERVICES).encode())
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def _install_dependencies() -> str:
+    """
+    Installs the dependencies into the build cache, unless they were already installed for the same requirements.
+    :return: The directory the dependencies are installed in
+    """
+    dependencies_directory = join(DEPENDENCIES_CACHE_DIR, _dependencies_hash())
+    if os.path.isdir(dependencies_directory):
+        print(f"Using cached dependencies {relpath(dependencies_directory, BASE_DIRECTORY)}")
+        return dependencies_directory
+
+    # install next to the cache entry and move it in place once done, so an interrupted install is never reused
+    partial_directory = f"{dependencies_directory}.partial"
+    Path(DEPENDENCIES_CACHE_DIR).mkdir(parents=True, exist_ok=True)
+    shutil.rmtree(partial_directory, ignore_errors=True)
     subprocess.check_call(
         [
             sys.executable,
@@ -264,13 +379,24 @@ def _create_code_package() -> None:
             "--requirement",
             join(BASE_DIRECTORY, "requirements.txt"),
             "--target",
-            DEPLOY_PACKAGE_DIR,
+            partial_directory,
         ]
     )
 
+    print("Removing unused Botocore service packages")
+    _remove_unused_botocore_services(partial_directory)
+
+    # dependencies installed for older requirements will not be used again
+    for entry in os.listdir(DEPENDENCIES_CACHE_DIR):
+        if join(DEPENDENCIES_CACHE_DIR, entry) != partial_directory:
+            shutil.rmtree(join(DEPENDENCIES_CACHE_DIR, entry))
+
+    os.replace(partial_directory, dependencies_directory)
+    return dependencies_directory
 
-def _remove_unused_botocore_services() -> None:
-    botocore_services_directory = join(DEPLOY_PACKAGE_DIR, "botocore", "data")
+
+def _remove_unused_botocore_services(dependencies_directory: str) -> None:
+    botocore_services_directory = join(dependencies_directory, "botocore", "data")
     dirs_to_remove = [
         directory
         for directory in os.listdir(botocore_services_directory)
@@ -286,84 +412,227 @@ def _remove_unused_botocore_services() -> None:
         shutil.rmtree(join(botocore_services_directory, directory))
 
 
-def _copy_directory(source_directory_path: str, target_directory_path: str) -> None:
-    for item in os.listdir(source_directory_path):
-        source_sub = os.path.join(source_directory_path, item)
-        dest_sub = os.path.join(target_directory_path, item)
-        if os.path.isdir(source_sub):
-            shutil.copytree(src=source_sub, dst=dest_sub, symlinks=False, ignore=None)
-        else:
-            shutil.copy2(source_sub, dest_sub)
-
+def _package_files(base_directory_path: str, directory: str = "") -> List[Tuple[str, str]]:
+    """
+    Lists the files to package from a directory, in a stable order.
+    Our own code is packaged without its local bytecode caches, which depend on the interpreter that wrote them.
+    :param base_directory_path: The directory the archive names are relative to
+    :param directory: A subdirectory of the base directory to list, or the whole base directory by default
+    :return: The archive name and full path of each file
+    """
+    files = []
+    for directory_path, directory_names, filenames in os.walk(join(base_directory_path, directory), followlinks=True):
+        if directory:
+            directory_names[:] = [name for name in directory_names if name != "__pycache__"]
+        for filename in filenames:
+            full_path = join(directory_path, filename)
+            files.append((Path(relpath(full_path, base_directory_path)).as_posix(), full_path))
+    return sorted(files)
+
+
+def _hash_files(files: List[Tuple[str, str]]) -> str:
+    digest = hashlib.sha256()
+    for archive_name, full_path in files:
+        digest.update(archive_name.encode())
+        digest.update(b"\0")
+        with open(full_path, "rb") as file:
+            digest.update(hashlib.sha256(file.read()).digest())
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def _is_uploaded(boto_s3_client: boto3.client, s3_bucket_name: str, key: str) -> bool:
+    try:
+        boto_s3_client.head_object(Bucket=s3_bucket_name, Key=key)
+    except ClientError as error:
+        if error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return True
+
+
+@dataclass
+class _ZipEntry:
+    archive_name: bytes
+    flag_bits: int
+    compress_type: int
+    crc: int
+    file_size: int
+    compress_size: int
+    data: bytes
+    header_offset: int = 0
+
+
+def _compress_file(archive_name: str, full_path: str, policy: CompressionPolicy) -> _ZipEntry:
+    with open(full_path, "rb") as file:
+        content = file.read()
+
+    compress_type, data = zipfile.ZIP_STORED, content
+    if policy.should_deflate(archive_name, len(content)):
+        # zip entries hold raw deflate streams, without zlib's header and checksum
+        compressor = zlib.compressobj(policy.compression_level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(content) + compressor.flush()
+        if len(deflated) < len(content):
+            compress_type, data = zipfile.ZIP_DEFLATED, deflated
 
-def _zip_and_upload(
-    boto_s3_client: boto3.client, s3_bucket_name: str, key: str, now_ms: int
-) -> None:
-    zip_file_path = join(BASE_DIRECTORY, "deploy_package.zip")
-    _zip_directory(zip_file_path, DEPLOY_PACKAGE_DIR)
-    print(f"ZIP file size: {int(os.path.getsize(zip_file_path) / BYTES_IN_MB)} MB")
-
-    config = TransferConfig(
-        multipart_threshold=BYTES_IN_MB,
-        max_concurrency=20,
-        multipart_chunksize=int(BYTES_IN_MB / 3),
-    )
-    boto_s3_client.upload_file(
-        Filename=zip_file_path,
-        Bucket=s3_bucket_name,
-        Key=key,
-        Config=config,
+    try:
+        encoded_name, flag_bits = archive_name.encode("ascii"), 0
+    except UnicodeEncodeError:
+        encoded_name, flag_bits = archive_name.encode("utf-8"), ZIP_UTF8_FLAG
+
+    return _ZipEntry(encoded_name, flag_bits, compress_type, zlib.crc32(content), len(content), len(data), data)
+
+
+def _compressed_entries(
+    files: List[Tuple[str, str]], policy: CompressionPolicy, executor: ThreadPoolExecutor, window: int
+) -> Iterator[_ZipEntry]:
+    """
+    Compresses the files in parallel, yielding them in their original order.
+    At most a window of files is compressed ahead of the consumer, so memory use does not grow with the package.
+    """
+    pending: Deque[Future] = deque()
+    for archive_name, full_path in files:
+        pending.append(executor.submit(_compress_file, archive_name, full_path, policy))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _local_file_header(entry: _ZipEntry) -> bytes:
+    extract_version = 20 if entry.compress_type == zipfile.ZIP_DEFLATED else 10
+    return struct.pack(
+        zipfile.structFileHeader, zipfile.stringFileHeader, extract_version, 0, entry.flag_bits,
+        entry.compress_type, ZIP_DOS_TIME, ZIP_DOS_DATE, entry.crc, entry.compress_size, entry.file_size,
+        len(entry.archive_name), 0,
+    ) + entry.archive_name
+
+
+def _central_directory(entries: List[_ZipEntry], offset: int) -> bytes:
+    records = []
+    for entry in entries:
+        extract_version = 20 if entry.compress_type == zipfile.ZIP_DEFLATED else 10
+        records.append(struct.pack(
+            zipfile.structCentralDir, zipfile.stringCentralDir, extract_version, ZIP_CREATE_SYSTEM_UNIX,
+            extract_version, 0, entry.flag_bits, entry.compress_type, ZIP_DOS_TIME, ZIP_DOS_DATE, entry.crc,
+            entry.compress_size, entry.file_size, len(entry.archive_name), 0, 0, 0, 0, ZIP_FILE_MODE << 16,
+            entry.header_offset,
+        ) + entry.archive_name)
+    central_directory = b"".join(records)
+    end_record = struct.pack(
+        zipfile.structEndArchive, zipfile.stringEndArchive, 0, 0, len(entries), len(entries),
+        len(central_directory), offset, 0,
     )
+    return central_directory + end_record
+
+
+class _StreamingUpload:
+    """
+    Uploads a stream of bytes to S3 as it is written, in parts uploaded concurrently.
+    Uploads that end up smaller than a single part are sent with a single PutObject instead.
+    """
+    def __init__(self, boto_s3_client: boto3.client, s3_bucket_name: str, key: str,
+                 executor: ThreadPoolExecutor, part_bytes: int = UPLOAD_PART_BYTES):
+        self.client = boto_s3_client
+        self.bucket = s3_bucket_name
+        self.key = key
+        self.executor = executor
+        self.part_bytes = part_bytes
+        self.buffer = bytearray()
+        self.size = 0
+        self.upload_id: Optional[str] = None
+        self.parts: List[Future] = []
+
+    def write(self, data: bytes) -> None:
+        self.buffer += data
+        self.size += len(data)
+        while len(self.buffer) >= self.part_bytes:
+            part = bytes(self.buffer[:self.part_bytes])
+            del self.buffer[:self.part_bytes]
+            self._upload_part(part)
+
+    def complete(self) -> None:
+        if self.upload_id is None:
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+            return
+
+        if self.buffer:
+            self._upload_part(bytes(self.buffer))
+        parts = [{"PartNumber": number, "ETag": part.result()} for number, part in enumerate(self.parts, start=1)]
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={"Parts": parts}
+        )
 
+    def abort(self) -> None:
+        for part in self.parts:
+            part.cancel()
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
 
-def _zip_directory(output_file_path: str, base_directory_path: str) -> None:
-    with open(output_file_path, "wb") as raw_output_file:
-        with zipfile.ZipFile(
-            file=raw_output_file, mode="w", compression=zipfile.ZIP_DEFLATED
-        ) as zip_file:
-            with contextlib.closing(zip_file) as raw_zip_file:
-                for directory_path, _, filenames in os.walk(base_directory_path, followlinks=True):
-                    for filename in filenames:
-                        full_path = join(directory_path, filename)
-                        relative_path = relpath(full_path, base_directory_path)
-                        raw_zip_file.write(full_path, relative_path)
+    def _upload_part(self, data: bytes) -> None:
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)["UploadId"]
 
+        part_number = len(self.parts) + 1
+        self.parts.append(self.executor.submit(self._send_part, part_number, data))
 
-def _cleanup() -> None:
-    os.remove(join(BASE_DIRECTORY, "deploy_package.zip"))
-    shutil.rmtree(DEPLOY_PACKAGE_DIR)
+    def _send_part(self, part_number: int, data: bytes) -> str:
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=part_number, Body=data
+        )
+        return response["ETag"]
 
 
-def get_lambdas_urls(stack_name_to_check: str) \
-        -> Tuple[Optional[str], Optional[str], Optional[str], Optional[str],
-                 Optional[str], Optional[str], Optional[str]]:
+def _zip_and_upload(
+    boto_s3_client: boto3.client,
+    s3_bucket_name: str,
+    key: str,
+    files: List[Tuple[str, str]],
+    policy: CompressionPolicy,
+) -> None:
+    """
+    Zips the files straight into a multipart upload- files are compressed in parallel,
+     and each part is uploaded as soon as enough of the zip was written, while the next files are compressed.
+    Entries get a fixed timestamp and permissions, so identical files produce an identical zip.
+    """
+    if len(files) >= ZIP_MAX_ENTRIES:
+        raise ValueError(f"Package {key} has {len(files)} files, more than a zip without zip64 can hold")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=COMPRESSION_WORKERS) as compression_executor, \
+            ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as upload_executor:
+        upload = _StreamingUpload(boto_s3_client, s3_bucket_name, key, upload_executor)
+        try:
+            entries = []
+            window = COMPRESSION_WORKERS * 4
+            for entry in _compressed_entries(files, policy, compression_executor, window):
+                entry.header_offset = upload.size
+                upload.write(_local_file_header(entry))
+                upload.write(entry.data)
+                # the central directory only needs the entry's metadata
+                entry.data = b""
+                entries.append(entry)
+                if upload.size > ZIP_MAX_OFFSET:
+                    raise ValueError(f"Package {key} is larger than a zip without zip64 can hold")
+
+            upload.write(_central_directory(entries, upload.size))
+            upload.complete()
+
+        except BaseException:
+            upload.abort()
+            raise
+
+    print(f"ZIP file size: {upload.size / BYTES_IN_MB:.2f} MB, "
+          f"zipped and uploaded in {time.perf_counter() - start:.1f} seconds")
+
+
+def get_lambdas_urls(stack_name_to_check: str) -> Dict[str, str]:
     cloudformation = boto3.resource("cloudformation", region_name=AWS_REGION)
     stack = cloudformation.Stack(stack_name_to_check)
-    game_creator_url = None
-    player_adder_url = None
-    status_setter_url = None
-    status_getter_url = None
-    players_getter_url = None
-    word_adder_url = None
-    words_getter_url = None
-    for output in stack.outputs:
-        if output["OutputKey"] == "GameCreatorLambdaURL":
-            game_creator_url = output["OutputValue"]
-        if output["OutputKey"] == "PlayerAdderLambdaURL":
-            player_adder_url = output["OutputValue"]
-        if output["OutputKey"] == "StatusSetterLambdaURL":
-            status_setter_url = output["OutputValue"]
-        if output["OutputKey"] == "StatusGetterLambdaURL":
-            status_getter_url = output["OutputValue"]
-        if output["OutputKey"] == "PlayersGetterLambdaURL":
-            players_getter_url = output["OutputValue"]
-        if output["OutputKey"] == "WordAdderLambdaURL":
-            word_adder_url = output["OutputValue"]
-        if output["OutputKey"] == "WordsGetterLambdaURL":
-            words_getter_url = output["OutputValue"]
-
-    return game_creator_url, player_adder_url, status_setter_url, status_getter_url, players_getter_url, word_adder_url,\
-        words_getter_url
+    return {
+        output["OutputKey"]: output["OutputValue"]
+        for output in stack.outputs
+        if output["OutputKey"].endswith(("LambdaURL", "ApiURL"))
+    }
 
 
 def main() -> None:
@@ -377,38 +646,80 @@ def main() -> None:
         type=str,
         metavar="PAIR",
     )
+    parser.add_argument(
+        "--store-extensions",
+        nargs="*",
+        default=list(DEFAULT_STORE_EXTENSIONS),
+        help="Extensions of already compressed files, which are stored in the packages without deflating",
+        metavar="EXTENSION",
+    )
+    parser.add_argument(
+        "--min-deflate-bytes",
+        default=DEFAULT_MIN_DEFLATE_BYTES,
+        help="Files smaller than this are stored in the packages without deflating",
+        type=int,
+    )
+    parser.add_argument(
+        "--compression-level",
+        default=DEFAULT_COMPRESSION_LEVEL,
+        choices=range(1, 10),
+        help="The deflate compression level, from 1 (fastest) to 9 (smallest)",
+        type=int,
+    )
+    parser.add_argument(
+        "--word-storage",
+        default="set",
+        choices=("set", "items"),
+        help="Where new games keep their words- set, in a single item per game, or items, in an item per word",
+        type=str,
+    )
+    parser.add_argument(
+        "--materialized-views",
+        default="false",
+        choices=("true", "false"),
+        help="Whether the getters serve the games' views kept by the view materializer, rather than building them",
+        type=str,
+    )
+    parser.add_argument(
+        "--pin-pool-shards",
+        default=0,
+        help="The number of items the pool of free PINs is split into, 0 for no pool",
+        type=int,
+    )
 
     args = parser.parse_args()
 
-    now_ms = int(datetime.now().timestamp() * 1000)
     try:
         # deploy an S3 bucket to store the code package
         deploy_cloudformation_template(
             pair_name=args.pair_name,
-            now_ms=now_ms,
             stack_name="huji-lightricks-pitkiot-buckets",
             template_file_path="./cloudformation/code_bucket.yaml",
         )
 
-        # upload code package to S3 code bucket
-        deploy_code_package(pair_name=args.pair_name, now_ms=now_ms)
+        # upload the dependencies layer and code package to S3 code bucket, unless they are already there
+        policy = CompressionPolicy(
+            store_extensions=tuple(extension.lower() for extension in args.store_extensions),
+            min_deflate_bytes=args.min_deflate_bytes,
+            compression_level=args.compression_level,
+        )
+        package_hashes = deploy_code_package(pair_name=args.pair_name, policy=policy)
 
         deploy_cloudformation_template(
             pair_name=args.pair_name,
-            now_ms=now_ms,
+            package_hashes=package_hashes,
+            parameters={
+                "WordStorage": args.word_storage,
+                "MaterializedViews": args.materialized_views,
+                "PinPoolShards": str(args.pin_pool_shards),
+            },
             stack_name="huji-lightricks-pitkiot-resources",
             template_file_path="./cloudformation/pitkiot.yaml",
         )
 
-        game_creator_url, player_adder_url, status_setter_url, status_getter_url, players_getter_url,\
-            word_adder_url, words_getter_url = get_lambdas_urls("huji-lightricks-pitkiot-resources")
-        print(f"Game creator lambda URL: {game_creator_url}")
-        print(f"Player Adder lambda URL: {player_adder_url}")
-        print(f"Status setter lambda URL: {status_setter_url}")
-        print(f"Status getter lambda URL: {status_getter_url}")
-        print(f"Players getter lambda URL: {players_getter_url}")
-        print(f"Word adder lambda URL: {word_adder_url}")
-        print(f"Words getter lambda URL: {words_getter_url}")
+        lambdas_urls = get_lambdas_urls("huji-lightricks-pitkiot-resources")
+        for output_key, url in sorted(lambdas_urls.items()):
+            print(f"{output_key}: {url}")
 
     except ValueError as error:
         print("FATAL ERROR")
@@ -0,0 +1,22 @@
+from typing import Dict, Any
+
+from utils.metrics import instrumented
+
+
+@instrumented("change_recorder")
+def handler(event: Dict[str, Any], _: Any) -> Dict[str, Any]:
+    """
+    Lambda handler for the change_recorder lambda, which consumes the stream of the game's table.
+    Expected input: A batch of DynamoDB stream records of the game's table, with their new images.
+    Expected output: The records whose changes could not be recorded, as batchItemFailures holding
+     the sequence number of each such game's first failed record, so the batch is retried from there.
+     Every other change is appended to its game's change log and pushed to the game's connected clients.
+     Records of other items than the games' headers are skipped.
+    """
+    records = event.get('Records') or []
+    if not records:
+        return {'batchItemFailures': []}
+
+    from models.change_recorder import record_changes
+
+    return {'batchItemFailures': [{'itemIdentifier': sequence_number} for sequence_number in record_changes(records)]}
@@ -0,0 +1,76 @@
+import time
+from typing import Dict, Any
+
+from utils.metrics import instrumented
+from utils.long_poll import requested_wait, wait_for_change
+from utils.pagination import parse_page
+from utils.request_pipeline import GAME_ID, Parameter, Request, RequestError, json_response, route
+
+SINCE = Parameter("since", "The version the changes should follow must be provided")
+CHANGES_GONE = "The changes since this version are no longer kept, please read the whole game"
+
+
+@instrumented("changes_getter")
+@route("GET", "/changes", query=[GAME_ID, SINCE])
+def handler(request: Request, context: Any) -> Dict[str, Any]:
+    """
+    Lambda handler for the changes_getter lambda.
+    Expected input: An event containing a REST API request, with a GET method, a gameId query parameter
+     and a since query parameter, the version of the game the caller has last seen.
+     The request may also contain a limit query parameter, the maximal number of changes to return.
+     For long-polling, the request may also contain a waitSeconds query parameter. The response is then delayed
+     until the game changes after the given version, or until waitSeconds pass.
+    Expected output: A JSON-formatted response containing the changes that followed the given version, in order,
+     each with its seq (the version it gave the game), kind and data, and the version the changes bring the caller to.
+     The log trails the game by the stream's delay, so the game's latest changes may only be returned by a later
+     request. If the changes are no longer kept, e.g. once the game has ended, a 410 status code is returned,
+     and the caller should read the whole game instead.
+     In case of an error, a status code and an informative message will be returned.
+    """
+    # Get game ID, version and long-poll parameters from url
+    game_id, since = request.query['gameId'], request.query['since']
+    try:
+        since = int(since)
+    except ValueError:
+        since = -1
+    if since < 0:
+        raise RequestError(400, f"since must be a non-negative integer, got {request.query['since']}")
+
+    try:
+        wait = requested_wait(request.query, context)
+        limit = parse_page(request.query).limit
+
+    except ValueError as e:
+        raise RequestError(400, str(e))
+
+    from models.change_log import change_entry, read_changes
+    from models.game_cache import game_cache
+
+    # the game's version tells whether there are changes to read, so the log is only read once there are
+    deadline = time.monotonic() + wait
+    game = wait_for_change(
+        lambda: game_cache.get_game(game_id),
+        lambda current: int(current.version or 0) > since,
+        wait,
+    )
+
+    version = int(game.version or 0)
+    if version <= since:
+        return json_response(200, {'changes': [], 'version': version})
+
+    # the change recorder appends the changes from the stream of the game's table, so the game's latest changes
+    # may not be in its log yet
+    events = wait_for_change(lambda: read_changes(game, since, limit), bool, max(deadline - time.monotonic(), 0.0))
+    if not events:
+        # the changes of games created before the log was introduced may never be logged
+        if not game.change_log:
+            raise RequestError(410, CHANGES_GONE)
+        return json_response(200, {'changes': [], 'version': since})
+
+    # the log holds an event for every version of the game, so a missing event was compacted or expired
+    if events[0].seq != since + 1:
+        raise RequestError(410, CHANGES_GONE)
+
+    changes = [change_entry(event) for event in events]
+
+    return json_response(200, {'changes': changes, 'version': changes[-1]['seq']})
@@ -1,57 +1,55 @@
-import json
-
+import time
 from typing import Dict, Any
-from uuid import uuid4
-from hashlib import sha256
 
-from models.game_session import GameSession
+from models.game_rules import ADDING_PLAYERS
 from utils.lambda_exception_handler import LambdaExceptionHandler
-import pynamodb.exceptions
-from pynamodb.exceptions import PynamoDBException
+from utils.metrics import instrumented
+from utils.request_pipeline import Field, Request, json_response, route
 
 
-def handler(event: Dict[str, Any], _: Any) -> Dict[str, Any]:
+@instrumented("game_creator")
+@route("POST", "/", body=[Field("nickName", "Nickname must be provided to create a game")])
+def handler(request: Request, _: Any) -> Dict[str, Any]:
     """
     Lambda handler for the game_creator lambda.
-    Expected input: An event containing a REST API request, with a POST method and no body.
+    Expected input: An event containing a REST API request, with a POST method
+     and a JSON-formatted body containing a nickName field.
     Expected output: A JSON-formatted response containing a game ID.
      In case of an error, a status code and an informative message will be returned.
     """
+    nickname = request.body['nickName']
 
-    # check REST method
-    method = event.get('requestContext', {}).get('http', {}).get('method', '')
-    if method != "POST":
-        return LambdaExceptionHandler.handle_error(405, "Only POST request allowed")
-
-    # Get nickname from body
-    nickname = json.loads(event.get('body', {})).get('nickName', '')
-    if not nickname:
-        return LambdaExceptionHandler.handle_error(400, "Nickname must be provided to create a game")
-
-    # create game ID
-    game_id = sha256(str(uuid4()).encode('utf-8')).hexdigest()[:4]
+    from models.change_log import GAME_CREATED, describe_change, new_change_log
+    from models.expiry import expiry
+    from models.game_cache import game_cache
+    from models.game_content import GameContent
+    from models.game_session import GameSession
+    from models.game_word import new_partition
+    from models.pin_allocator import pin_allocator, PinAllocationError
 
     # create game object
     game = GameSession()
-    game.game_id = game_id
-    game.status = "adding_players"
+    game.status = ADDING_PLAYERS
     game.players = [nickname]
-
+    game.version = 1
+    game.word_count = 0
+    game.words_partition = new_partition()
+    game.change_log = new_change_log()
+    game.created_at = int(time.time() * 1000)
+    game.expires_at = expiry()
+    # the change recorder starts the game's change log with its creation
+    game.last_change = describe_change(GAME_CREATED, {'nickName': nickname, 'status': game.status})
+
+    # save the game under a free game ID
     try:
-        game.save()
-
-    except GameSession.DoesNotExist:
-        return LambdaExceptionHandler.handle_error(404, 'Given PIN does not belong to an existing game')
-
-    except pynamodb.exceptions.PynamoDBConnectionError:
-        return LambdaExceptionHandler.handle_error(503, 'Failed to connect. Please try again')
+        game_id = pin_allocator.create_game(game, GameContent(expires_at=expiry()))
 
-    except PynamoDBException as e:
-        return LambdaExceptionHandler.handle_error(500, 'Internal Server Error')
+    except PinAllocationError:
+        return LambdaExceptionHandler.handle_error(503, 'No free game PIN was found. Please try again')
 
-    print(f"game added: id- {game_id}, admin nickName- {nickname}")
+    # the game's first words are then added without reading where it keeps them
+    game_cache.remember_words_partition(game_id, game.words_partition)
+    print(f"game added: id- {game_id}, admin nickName- {nickname}, "
+          f"PIN collisions- {pin_allocator.collisions}, PIN retries- {pin_allocator.retries}")
 
-    return {
-        'statusCode': 201,
-        'body': json.dumps({'gameId': game_id})
-    }
+    return json_response(201, {'gameId': game_id})
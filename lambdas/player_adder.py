@@ -1,14 +1,14 @@
-import json
 from typing import Dict, Any
 
-import pynamodb
-from pynamodb.exceptions import PynamoDBException
-
-from models.game_session import GameSession
+from models.game_rules import ADDING_PLAYERS, GAME_ENDED
 from utils.lambda_exception_handler import LambdaExceptionHandler
+from utils.metrics import instrumented
+from utils.request_pipeline import GAME_ID, Field, Request, route
 
 
-def handler(event: Dict[str, Any], _: Any) -> Dict[str, Any]:
+@instrumented("player_adder")
+@route("PUT", "/players", query=[GAME_ID], body=[Field("nickName", 'Nickname must be provided to add a player')])
+def handler(request: Request, _: Any) -> Dict[str, Any]:
     """
     Lambda handler for the player_adder lambda.
     Expected input: An event containing a REST API request, with a PUT method, a gameId query parameter
@@ -16,61 +16,56 @@ def handler(event: Dict[str, Any], _: Any) -> Dict[str, Any]:
     Expected output: An empty REST response.
      In case of an error, a status code and an informative message will be returned.
     """
-    # check REST method
-    method = event.get('requestContext', {}).get('http', {}).get('method', '')
-    if method != "PUT":
-        return LambdaExceptionHandler.handle_error(405, "Only PUT request allowed")
+    game_id, nickname = request.query['gameId'], request.body['nickName']
 
-    # Get game ID from url, nickname from body
-    game_id = event.get("queryStringParameters", {}).get("gameId")
-    nickname = json.loads(event.get('body', {})).get('nickName', '')
+    import pynamodb.exceptions
 
-    if not game_id:
-        return LambdaExceptionHandler.handle_error(400, "Failed to process game PIN")
+    from models.change_log import PLAYER_ADDED, change_action
+    from models.expiry import expiry, not_expired
+    from models.game_cache import game_cache
+    from models.game_session import GameSession
 
-    if not nickname:
-        return LambdaExceptionHandler.handle_error(400, 'Nickname must be provided to add a player')
+    # add nickname to players in a single conditional update- the game must exist and not have expired,
+    # be accepting players and not already contain the nickname. The update also records the change,
+    # which the change recorder appends to the game's change log
+    game = GameSession(game_id)
+    condition = GameSession.game_id.exists() & not_expired(GameSession.expires_at) & \
+        (GameSession.status == ADDING_PLAYERS) & ~GameSession.players.contains(nickname)
+    actions = [GameSession.players.add({nickname}), GameSession.version.add(1), GameSession.expires_at.set(expiry()),
+               change_action(PLAYER_ADDED, {'nickName': nickname})]
 
-    # get current players list from DB, check nickname uniqueness, and add nickname to players
     try:
-        game = GameSession.get(hash_key=game_id)
+        game.update(actions=actions, condition=condition)
 
-    except GameSession.DoesNotExist:
-        return LambdaExceptionHandler.handle_error(404, 'Given PIN does not belong to an existing game')
+    except pynamodb.exceptions.UpdateError as e:
+        if LambdaExceptionHandler.is_condition_failure(e):
+            return _rejection_response(game_id, nickname)
+        raise
 
-    except pynamodb.exceptions.PynamoDBConnectionError:
-        return LambdaExceptionHandler.handle_error(503, 'Failed to connect. Please try again')
+    game_cache.invalidate(game_id)
 
-    except PynamoDBException as e:
-        return LambdaExceptionHandler.handle_error(500, 'Internal Server Error')
+    return {
+        'statusCode': 200
+    }
 
-    status = game.status
-    players = game.players
 
-    if status == "game_ended":
+def _rejection_response(game_id: str, nickname: str) -> Dict[str, Any]:
+    """
+    Builds the error response for a player addition whose condition failed.
+    Only reached on the failure path, so the extra read does not slow down successful joins.
+    """
+    from models.expiry import get_unexpired
+    from models.game_session import GameSession
+
+    game = get_unexpired(GameSession, game_id, consistent_read=True, attributes_to_get=['game_id', 'status', 'players'])
+
+    if game.status == GAME_ENDED:
         return LambdaExceptionHandler.handle_error(409, "The game with this PIN has ended")
 
-    if status != "adding_players":
+    if game.status != ADDING_PLAYERS:
         return LambdaExceptionHandler.handle_error(409, "Can't currently add players to the game")
 
-    if nickname in players:
+    if nickname in (game.players or set()):
         return LambdaExceptionHandler.handle_error(409, "This nickname is already in use")
 
-    players.add(nickname)
-    game.players = players
-
-    try:
-        game.save()
-
-    except GameSession.DoesNotExist:
-        return LambdaExceptionHandler.handle_error(404, 'Given PIN does not belong to an existing game')
-
-    except pynamodb.exceptions.PynamoDBConnectionError:
-        return LambdaExceptionHandler.handle_error(503, 'Failed to connect. Please try again')
-
-    except PynamoDBException as e:
-        return LambdaExceptionHandler.handle_error(500, 'Internal Server Error')
-
-    return {
-        'statusCode': 200
-    }
+    return LambdaExceptionHandler.handle_error(409, "The game has changed, please try again")
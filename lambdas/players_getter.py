@@ -1,49 +1,51 @@
-import json
 from typing import Dict, Any
 
-import pynamodb
-from pynamodb.exceptions import PynamoDBException
+from utils.metrics import instrumented
+from utils.long_poll import requested_wait, wait_for_change, parse_known_version
+from utils.pagination import MAX_PAGE_LIMIT, Page, paginate, parse_page
+from utils.request_pipeline import GAME_ID, Request, RequestError, json_response, route, serialized_response
 
-from models.game_session import GameSession
-from utils.lambda_exception_handler import LambdaExceptionHandler
 
-
-def handler(event: Dict[str, Any], _: Any) -> Dict[str, Any]:
+@instrumented("players_getter")
+@route("GET", "/players", query=[GAME_ID])
+def handler(request: Request, context: Any) -> Dict[str, Any]:
     """
         Lambda handler for the players_getter lambda.
         Expected input: An event containing a REST API request, with a GET method and a gameId query parameter.
-        Expected output: A JSON-formatted response containing a players list.
+         For long-polling, the request may also contain the knownVersion the caller has last seen and a waitSeconds
+         query parameter. The response is then delayed until the game's version changes, or until waitSeconds pass.
+         The request may also contain a limit query parameter, the maximal number of players to return,
+         and a cursor query parameter, the nextCursor of the previous page.
+        Expected output: A JSON-formatted response containing a page of the players list, in alphabetical order,
+         the nextCursor of the following page, null if this page is the last, and the game's version.
          In case of an error, a status code and an informative message will be returned.
     """
-    # check REST method
-    method = event.get('requestContext', {}).get('http', {}).get('method', '')
-
-    if method != "GET":
-        return LambdaExceptionHandler.handle_error(405, "Only GET request allowed")
-
-    # Get game ID from url
-    game_id = event.get("queryStringParameters", {}).get("gameId")
-    if not game_id:
-        return LambdaExceptionHandler.handle_error(400, "Failed to process game PIN")
-
-    # get current players list from DB
+    # Get game ID, long-poll parameters and page from url
+    game_id = request.query['gameId']
     try:
-        game = GameSession.get(hash_key=game_id)
-
-    except GameSession.DoesNotExist:
-        return LambdaExceptionHandler.handle_error(404, 'Given PIN does not belong to an existing game')
+        known_version = parse_known_version(request.query)
+        wait = requested_wait(request.query, context)
+        page = parse_page(request.query)
 
-    except pynamodb.exceptions.PynamoDBConnectionError:
-        return LambdaExceptionHandler.handle_error(503, 'Failed to connect. Please try again')
+    except ValueError as e:
+        raise RequestError(400, str(e))
 
-    except PynamoDBException as e:
-        return LambdaExceptionHandler.handle_error(500, 'Internal Server Error')
+    from models.game_cache import game_cache
+    from models.game_view import LOBBY, MATERIALIZED_VIEWS
 
-    players = list(game.players)
+    # a request for the first page that does not wait is served the game's materialized lobby as is, if there is one
+    if MATERIALIZED_VIEWS and not wait and page == Page(MAX_PAGE_LIMIT, None):
+        body = game_cache.get_view(game_id, LOBBY)
+        if body is not None:
+            return serialized_response(200, body)
 
-    return {
-        'statusCode': 200,
-        'body': json.dumps({'players': players})
-    }
+    # get current players list from the container's cache or DB, waiting for the game to change if asked to
+    game = wait_for_change(
+        lambda: game_cache.get_game(game_id),
+        lambda current: known_version is None or int(current.version or 0) != known_version,
+        wait,
+    )
 
+    players, cursor = paginate(game.players or (), page)
 
+    return json_response(200, {'players': players, 'nextCursor': cursor, 'version': int(game.version or 0)})
@@ -0,0 +1,54 @@
+from typing import Dict, Any
+
+from models.game_rules import GAME_ENDED
+from utils.lambda_exception_handler import LambdaExceptionHandler
+from utils.metrics import instrumented
+from utils.request_pipeline import error_response
+
+CONNECT = "$connect"
+
+
+@instrumented("push_connector")
+def handler(event: Dict[str, Any], _: Any) -> Dict[str, Any]:
+    """
+    Lambda handler for the push_connector lambda, which serves the routes of the game's WebSocket API.
+    Expected input: An event of a WebSocket API route. A $connect event must contain a gameId query parameter,
+     the game whose changes the connection listens to. Other routes, including $disconnect, are accepted as is.
+    Expected output: An empty response, which lets the connection open.
+     Once open, the connection gets every change to the game as the changes getter returns it.
+     In case of an error, a status code and an informative message will be returned, and the connection is refused.
+    """
+    request_context = event.get('requestContext') or {}
+    route_key, connection_id = request_context.get('routeKey'), request_context.get('connectionId')
+    if not route_key or not connection_id:
+        return LambdaExceptionHandler.handle_error(400, "Only WebSocket API events are supported")
+
+    # a disconnection does not name its game, so gone connections are removed by the next push to them
+    if route_key != CONNECT:
+        return {
+            'statusCode': 200
+        }
+
+    game_id = (event.get('queryStringParameters') or {}).get('gameId')
+    if not game_id:
+        return LambdaExceptionHandler.handle_error(400, "Failed to process game PIN")
+
+    from pynamodb.exceptions import PynamoDBException
+
+    from models.broadcaster import broadcaster
+    from models.game_cache import game_cache
+
+    # a missing game is refused with 404, and failures to reach DynamoDB with 503, like the endpoints' errors
+    try:
+        game = game_cache.get_game(game_id)
+        if game.status == GAME_ENDED:
+            return LambdaExceptionHandler.handle_error(409, "The game with this PIN has ended")
+
+        broadcaster.register(game, connection_id)
+
+    except PynamoDBException as e:
+        return error_response(e)
+
+    return {
+        'statusCode': 200
+    }
@@ -0,0 +1,47 @@
+from typing import Dict, Any
+
+from lambdas import changes_getter, game_creator, player_adder, players_getter, score_adder, scoreboard_getter, \
+    snapshot_getter, status_getter, status_setter, word_adder, word_drawer, word_returner, words_getter
+from utils.lambda_exception_handler import LambdaExceptionHandler
+from utils.metrics import instrumented
+from utils.request_pipeline import Handler, routes
+
+# maps each path to the handlers of the REST methods it supports, as each handler declares its route
+ROUTES: Dict[str, Dict[str, Handler]] = routes([
+    game_creator.handler,
+    player_adder.handler,
+    players_getter.handler,
+    status_setter.handler,
+    status_getter.handler,
+    word_adder.handler,
+    words_getter.handler,
+    snapshot_getter.handler,
+    word_drawer.handler,
+    word_returner.handler,
+    score_adder.handler,
+    scoreboard_getter.handler,
+    changes_getter.handler,
+])
+
+
+@instrumented("router")
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Lambda handler for the router lambda, which serves all of the game's endpoints from a single function.
+    Expected input: An event containing a REST API request for one of the paths in ROUTES.
+    Expected output: The response of the handler serving the request's method and path.
+     In case of an error, a status code and an informative message will be returned.
+    """
+    method = event.get('requestContext', {}).get('http', {}).get('method', '')
+    path = event.get('rawPath') or event.get('requestContext', {}).get('http', {}).get('path', '')
+
+    # paths are matched with or without a trailing slash
+    methods = ROUTES.get(path.rstrip('/') or '/')
+    if methods is None:
+        return LambdaExceptionHandler.handle_error(404, f"Unknown path {path}")
+
+    route_handler = methods.get(method)
+    if route_handler is None:
+        return LambdaExceptionHandler.handle_error(405, f"Only {' or '.join(methods)} request allowed")
+
+    return route_handler(event, context)
@@ -0,0 +1,111 @@
+from functools import partial
+from typing import Dict, Any, List, TYPE_CHECKING
+
+from models.game_rules import IN_GAME, GAME_ENDED, turn_player
+from utils.lambda_exception_handler import LambdaExceptionHandler
+from utils.metrics import instrumented
+from utils.request_pipeline import GAME_ID, Field, Request, RequestError, json_response, route
+
+if TYPE_CHECKING:
+    from pynamodb.expressions.condition import Condition
+    from pynamodb.expressions.update import Action
+    from pynamodb.transactions import TransactWrite
+
+MAX_POINTS_PER_REQUEST = 100
+
+
+@instrumented("score_adder")
+@route("PUT", "/score", query=[GAME_ID], body=[Field("nickName", 'Nickname must be provided to score')])
+def handler(request: Request, _: Any) -> Dict[str, Any]:
+    """
+    Lambda handler for the score_adder lambda.
+    Expected input: An event containing a REST API request, with a PUT method, a gameId query parameter
+     and a JSON-formatted body containing the nickName of the player whose turn it is, and a points field
+     holding the points their team scored and/or an endTurn field set to true to pass the turn to the next player.
+    Expected output: A JSON-formatted response containing the game's turn and the player whose turn it is.
+     In case of an error, a status code and an informative message will be returned.
+    """
+    game_id, nickname = request.query['gameId'], request.body['nickName']
+    points, end_turn = request.body.get('points', 0), request.body.get('endTurn', False)
+
+    if not isinstance(points, int) or isinstance(points, bool) or not 0 <= points <= MAX_POINTS_PER_REQUEST:
+        raise RequestError(400, f"Points must be a whole number between 0 and {MAX_POINTS_PER_REQUEST}")
+
+    if not isinstance(end_turn, bool):
+        raise RequestError(400, "endTurn must be true or false")
+
+    if not points and not end_turn:
+        raise RequestError(400, "Body must contain points or endTurn field")
+
+    import pynamodb.exceptions
+
+    from models.change_log import SCORE_CHANGED, change_action
+    from models.expiry import expiry, get_unexpired, not_expired
+    from models.game_cache import game_cache
+    from models.game_session import GameSession, commit_transaction
+
+    # the turn's team and player follow from the game's teams and turn, so they are read first
+    game = get_unexpired(GameSession, game_id, consistent_read=True,
+                         attributes_to_get=['game_id', 'status', 'teams', 'turn'])
+
+    if game.status == GAME_ENDED:
+        return LambdaExceptionHandler.handle_error(409, "The game with this PIN has ended")
+
+    if game.status != IN_GAME:
+        return LambdaExceptionHandler.handle_error(409, "The game has not started yet")
+
+    teams, turn = [team.players for team in game.teams], int(game.turn or 0)
+    team, player = turn_player(teams, turn)
+    if player != nickname:
+        return LambdaExceptionHandler.handle_error(409, "It is not this player's turn")
+
+    # add the points to the team's score as an atomic counter, in a single conditional update-
+    # the turn must not have passed since it was read, so the points go to the team that scored them
+    condition = GameSession.game_id.exists() & not_expired(GameSession.expires_at) & \
+        (GameSession.status == IN_GAME) & (GameSession.turn == turn)
+    actions = [GameSession.version.add(1), GameSession.expires_at.set(expiry())]
+    if points:
+        actions.append(GameSession.teams[team].score.add(points))
+
+    if end_turn:
+        # the next player may only draw words once the turn is theirs
+        turn += 1
+        _, player = turn_player(teams, turn)
+
+    # the update also records the change, which the change recorder appends to the game's change log
+    actions.append(change_action(SCORE_CHANGED, {'team': team, 'points': points, 'turn': turn, 'activePlayer': player}))
+
+    try:
+        if end_turn:
+            commit_transaction(partial(_end_turn, game_id, actions, condition, player))
+        else:
+            GameSession(game_id).update(actions=actions, condition=condition)
+
+    except (pynamodb.exceptions.UpdateError, pynamodb.exceptions.TransactWriteError) as e:
+        if LambdaExceptionHandler.is_condition_failure(e) or any(LambdaExceptionHandler.failed_conditions(e)):
+            return LambdaExceptionHandler.handle_error(409, "The turn has changed, please try again")
+        raise
+
+    game_cache.invalidate(game_id)
+
+    return json_response(200, {'turn': turn, 'activePlayer': player})
+
+
+def _end_turn(game_id: str, actions: List["Action"], condition: "Condition", next_player: str,
+              transaction: "TransactWrite") -> None:
+    """
+    Scores and passes the turn to the next player, as part of the given transaction.
+    """
+    from models.expiry import expiry
+    from models.game_content import GameContent
+    from models.game_session import GameSession
+
+    transaction.update(
+        GameSession(game_id),
+        actions=actions + [GameSession.turn.add(1)],
+        condition=condition,
+    )
+    transaction.update(
+        GameContent.of(game_id),
+        actions=[GameContent.active_player.set(next_player), GameContent.expires_at.set(expiry())],
+    )
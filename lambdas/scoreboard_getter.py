@@ -0,0 +1,46 @@
+from typing import Dict, Any
+
+from utils.metrics import instrumented
+from utils.long_poll import requested_wait, wait_for_change, parse_known_version
+from utils.request_pipeline import GAME_ID, Request, RequestError, json_response, route, serialized_response
+
+
+@instrumented("scoreboard_getter")
+@route("GET", "/scoreboard", query=[GAME_ID])
+def handler(request: Request, context: Any) -> Dict[str, Any]:
+    """
+    Lambda handler for the scoreboard_getter lambda.
+    Expected input: An event containing a REST API request, with a GET method and a gameId query parameter.
+     For long-polling, the request may also contain the knownVersion the caller has last seen and a waitSeconds
+     query parameter. The response is then delayed until the game's version changes, or until waitSeconds pass.
+    Expected output: A JSON-formatted response containing the game's teams with their players and scores,
+     the number of turns played, the team and player whose turn it is, and the game's version.
+     Before the game starts it has no teams, and no one's turn.
+     In case of an error, a status code and an informative message will be returned.
+    """
+    # Get game ID and long-poll parameters from url
+    game_id = request.query['gameId']
+    try:
+        known_version = parse_known_version(request.query)
+        wait = requested_wait(request.query, context)
+
+    except ValueError as e:
+        raise RequestError(400, str(e))
+
+    from models.game_cache import game_cache
+    from models.game_view import MATERIALIZED_VIEWS, SCOREBOARD, scoreboard_view
+
+    # a request that does not wait is served the game's materialized scoreboard as is, if there is one
+    if MATERIALIZED_VIEWS and not wait:
+        body = game_cache.get_view(game_id, SCOREBOARD)
+        if body is not None:
+            return serialized_response(200, body)
+
+    # the scoreboard is kept on the game's small header item, so it is read from the container's cache or DB
+    game = wait_for_change(
+        lambda: game_cache.get_game(game_id),
+        lambda current: known_version is None or int(current.version or 0) != known_version,
+        wait,
+    )
+
+    return json_response(200, scoreboard_view(game))
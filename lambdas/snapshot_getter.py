@@ -0,0 +1,42 @@
+from typing import Dict, Any
+
+from utils.etag import game_etag, etag_matches
+from utils.metrics import instrumented
+from utils.request_pipeline import GAME_ID, Request, json_response, route
+
+
+@instrumented("snapshot_getter")
+@route("GET", "/snapshot", query=[GAME_ID])
+def handler(request: Request, _: Any) -> Dict[str, Any]:
+    """
+    Lambda handler for the snapshot_getter lambda.
+    Expected input: An event containing a REST API request, with a GET method and a gameId query parameter.
+     An If-None-Match header holding the ETag of a previous response may be sent.
+    Expected output: A JSON-formatted response containing the game's status, players, words and version,
+     with an ETag header derived from the game's creation time and version.
+     If the If-None-Match header matches the game's current ETag, an empty response with status 304.
+     In case of an error, a status code and an informative message will be returned.
+    """
+    game_id = request.query['gameId']
+
+    from models.game_cache import game_cache
+
+    # get the game's small header item from the container's cache or DB,
+    # and only read its words if the client's copy is out of date
+    game = game_cache.get_game(game_id)
+
+    etag = game_etag(game.created_at, game.version)
+    if etag_matches(request.event, etag):
+        return {
+            'statusCode': 304,
+            'headers': {'ETag': etag}
+        }
+
+    words = game_cache.get_words(game_id)
+
+    return json_response(200, {
+        'status': game.status,
+        'players': list(game.players or []),
+        'words': list(words),
+        'version': int(game.version or 0),
+    }, headers={'ETag': etag})
@@ -1,45 +1,54 @@
-import json
 from typing import Dict, Any
-import pynamodb
-from pynamodb.exceptions import PynamoDBException
 
-from models.game_session import GameSession
-from utils.lambda_exception_handler import LambdaExceptionHandler
+from utils.metrics import instrumented
+from utils.long_poll import requested_wait, wait_for_change, parse_known_version
+from utils.request_pipeline import GAME_ID, Request, RequestError, json_response, route, serialized_response
 
 
-def handler(event: Dict[str, Any], _: Any) -> Dict[str, Any]:
+@instrumented("status_getter")
+@route("GET", "/status", query=[GAME_ID])
+def handler(request: Request, context: Any) -> Dict[str, Any]:
     """
         Lambda handler for the status_getter lambda.
         Expected input: An event containing a REST API request, with a GET method and a gameId query parameter.
-        Expected output: A JSON-formatted response containing a status.
+         For long-polling, the request may also contain the knownStatus and/or knownVersion the caller has last seen,
+         and a waitSeconds query parameter. The response is then delayed until the game differs from them,
+         or until waitSeconds pass.
+        Expected output: A JSON-formatted response containing a status, the game's version,
+         and the numbers of players and words in the game.
          In case of an error, a status code and an informative message will be returned.
         """
-    # check REST method
-    method = event.get('requestContext', {}).get('http', {}).get('method', '')
-    if method != "GET":
-        return LambdaExceptionHandler.handle_error(405, "Only GET request allowed")
-
-    # Get game ID from url
-    game_id = event.get("queryStringParameters", {}).get("gameId")
-    if not game_id:
-        return LambdaExceptionHandler.handle_error(400, "Failed to process game PIN")
-
-    # get current status from DB
+    # Get game ID and long-poll parameters from url
+    game_id = request.query['gameId']
+    known_status = request.query.get("knownStatus")
     try:
-        game = GameSession.get(hash_key=game_id)
-
-    except GameSession.DoesNotExist:
-        return LambdaExceptionHandler.handle_error(404, 'Given PIN does not belong to an existing game')
-
-    except pynamodb.exceptions.PynamoDBConnectionError:
-        return LambdaExceptionHandler.handle_error(503, 'Failed to connect. Please try again')
-
-    except PynamoDBException as e:
-        return LambdaExceptionHandler.handle_error(500, 'Internal Server Error')
-
-    status = game.status
-
-    return {
-        'statusCode': 200,
-        'body': json.dumps({'status': status})
-    }
+        known_version = parse_known_version(request.query)
+        wait = requested_wait(request.query, context)
+
+    except ValueError as e:
+        raise RequestError(400, str(e))
+
+    from models.game_cache import game_cache
+    from models.game_session import GameSession
+    from models.game_view import COUNTS, MATERIALIZED_VIEWS, counts_view
+
+    # a request that does not wait is served the game's materialized counts as they are, if there are any
+    if MATERIALIZED_VIEWS and not wait:
+        body = game_cache.get_view(game_id, COUNTS)
+        if body is not None:
+            return serialized_response(200, body)
+
+    def has_changed(game: GameSession) -> bool:
+        if known_status is None and known_version is None:
+            return True
+        return (known_status is not None and game.status != known_status) or \
+            (known_version is not None and int(game.version or 0) != known_version)
+
+    # get current status from the container's cache or DB, waiting for it to change if asked to
+    game = wait_for_change(
+        lambda: game_cache.get_game(game_id),
+        has_changed,
+        wait,
+    )
+
+    return json_response(200, counts_view(game))
@@ -1,78 +1,171 @@
-import json
-from typing import Dict, Any
+import random
+from functools import partial
+from typing import Dict, Any, List, TYPE_CHECKING
 
-import pynamodb
-from pynamodb.exceptions import PynamoDBException
-
-from models.game_session import GameSession
+from models.game_rules import STATUS_TRANSITIONS, GAME_STATUSES, ADDING_WORDS, IN_GAME, GAME_ENDED, MIN_PLAYERS, \
+    MIN_WORDS, assign_teams, turn_player
 from utils.lambda_exception_handler import LambdaExceptionHandler
+from utils.metrics import instrumented
+from utils.request_pipeline import GAME_ID, Field, Request, RequestError, route
+
+if TYPE_CHECKING:
+    from pynamodb.expressions.condition import Condition
+    from pynamodb.expressions.update import Action
+    from pynamodb.transactions import TransactWrite
 
 
-def handler(event: Dict[str, Any], _: Any) -> Dict[str, Any]:
+@instrumented("status_setter")
+@route("PUT", "/status", query=[GAME_ID], body=[Field("status", "Body must contain status field")])
+def handler(request: Request, _: Any) -> Dict[str, Any]:
     """
     Lambda handler for the status_setter lambda.
     Expected input: An event containing a REST API request, with a PUT method, a gameId query parameter
      and a JSON-formatted body containing a status field.
-     status field must be one of: adding_players, adding_words, in_game, game_ended.
+     status field must be one of: adding_players, adding_words, in_game, game_ended,
+     and the game may only move forward: adding_players -> adding_words -> in_game -> game_ended.
+     A game that has not ended yet may be moved to game_ended at any point.
+     Moving a game to in_game shuffles its words into a deck, and splits its players into teams.
     Expected output: An empty REST response.
      In case of an error, a status code and an informative message will be returned.
     """
-    # check REST method
-    method = event.get('requestContext', {}).get('http', {}).get('method', '')
-    if method != "PUT":
-        return LambdaExceptionHandler.handle_error(405, "Only PUT request allowed")
-
-    # Get game ID from url, status from body
-    game_id = event.get("queryStringParameters", {}).get("gameId")
-    status = json.loads(event.get('body', {})).get('status', '')
-
-    if not game_id:
-        return LambdaExceptionHandler.handle_error(400, "Failed to process game PIN")
+    game_id, status = request.query['gameId'], request.body['status']
 
-    if not status:
-        return LambdaExceptionHandler.handle_error(400, "Body must contain status field")
+    if status not in GAME_STATUSES:
+        raise RequestError(400, f"Status must be one of: {', '.join(GAME_STATUSES)}")
 
-    # get game session from DB and set the status
-    try:
-        game = GameSession.get(hash_key=game_id)
-
-    except GameSession.DoesNotExist:
-        return LambdaExceptionHandler.handle_error(404, 'Given PIN does not belong to an existing game')
+    if status not in STATUS_TRANSITIONS:
+        raise RequestError(400, f"A game can't be moved back to {status}")
 
-    except pynamodb.exceptions.PynamoDBConnectionError:
-        return LambdaExceptionHandler.handle_error(503, 'Failed to connect. Please try again')
+    import pynamodb.exceptions
+    from pynamodb.expressions.condition import size
 
-    except PynamoDBException as e:
-        return LambdaExceptionHandler.handle_error(500, 'Internal Server Error')
+    from models.change_log import STATUS_CHANGED, change_action
+    from models.expiry import expiry, not_expired, GAME_TTL_SECONDS, ENDED_GAME_TTL_SECONDS
+    from models.game_cache import game_cache
+    from models.game_content import GameContent
+    from models.game_session import GameSession, commit_transaction
 
-    if game.status == "game_ended":
-        return LambdaExceptionHandler.handle_error(409, 'The game with this PIN has ended')
+    # set the status in a conditional update of the game's small header item- the game must not have expired,
+    # currently be in a status this one may follow, and have enough players and words for the new status
+    condition = GameSession.game_id.exists() & not_expired(GameSession.expires_at) & \
+        GameSession.status.is_in(*STATUS_TRANSITIONS[status])
 
     # prevent game with less than 2 players (which is not enough for 2 teams)
-    if len(game.players) < 2:
-        return LambdaExceptionHandler.handle_error(400, 'Game must have a least 2 players')
+    if status in (ADDING_WORDS, IN_GAME):
+        condition &= size(GameSession.players) >= MIN_PLAYERS
 
     # prevent starting game with less than 5 words
-    if status == "in_game":  # only relevant when starting game
-        if (not game.words) or (len(game.words) < 5):
-            return LambdaExceptionHandler.handle_error(400, 'Game must have a least 5 words')
+    if status == IN_GAME:
+        condition &= GameSession.word_count >= MIN_WORDS
 
-    game.status = status
+    # an ended game is only kept long enough for its players to see it has ended
+    ttl = expiry(ENDED_GAME_TTL_SECONDS if status == GAME_ENDED else GAME_TTL_SECONDS)
 
-    try:
-        game.save()
+    # the update also records the change, which the change recorder appends to the game's change log
+    actions = [GameSession.status.set(status), GameSession.version.add(1), GameSession.expires_at.set(ttl),
+               change_action(STATUS_CHANGED, {'status': status})]
+
+    # keep the game's words for as long as the game, and drop the deck of an ended game
+    content_actions = [GameContent.expires_at.set(ttl)]
+    if status == GAME_ENDED:
+        content_actions += [GameContent.deck.remove(), GameContent.deck_size.remove(), GameContent.drawn.remove(),
+                            GameContent.active_player.remove()]
 
-    except GameSession.DoesNotExist:
-        return LambdaExceptionHandler.handle_error(404, 'Given PIN does not belong to an existing game')
+    # the game's content is updated in the same transaction as its header, so the status never changes without it
+    try:
+        if status == IN_GAME:
+            # the game's words are frozen into a shuffled deck as the game starts
+            commit_transaction(partial(_start_game, game_id, actions, condition))
+        else:
+            commit_transaction(partial(_set_status, game_id, actions, condition, content_actions))
 
-    except pynamodb.exceptions.PynamoDBConnectionError:
-        return LambdaExceptionHandler.handle_error(503, 'Failed to connect. Please try again')
+    except pynamodb.exceptions.TransactWriteError as e:
+        if any(LambdaExceptionHandler.failed_conditions(e)):
+            return _rejection_response(game_id, status)
+        raise
 
-    except PynamoDBException as e:
-        return LambdaExceptionHandler.handle_error(500, 'Internal Server Error')
+    game_cache.invalidate(game_id)
 
     return {
             'statusCode': 200
         }
 
 
+def _set_status(game_id: str, actions: List["Action"], condition: "Condition", content_actions: List["Action"],
+                transaction: "TransactWrite") -> None:
+    """
+    Updates a game's header and content as part of the given transaction.
+    """
+    from models.game_content import GameContent
+    from models.game_session import GameSession
+
+    transaction.update(GameSession(game_id), actions=actions, condition=condition)
+    transaction.update(GameContent.of(game_id), actions=content_actions)
+
+
+def _start_game(game_id: str, actions: List["Action"], condition: "Condition", transaction: "TransactWrite") -> None:
+    """
+    Moves a game to in_game as part of the given transaction, freezing its words into a shuffled deck
+     and splitting its players into teams, which take turns from the first team's first player.
+    The players and words are read before the transaction, so it only commits if neither changed since.
+    """
+    from pynamodb.expressions.condition import size
+
+    from models.expiry import expiry
+    from models.game_content import GameContent
+    from models.game_session import GameSession, Team
+    from models.game_word import read_words
+
+    try:
+        game = GameSession.get(hash_key=game_id, consistent_read=True,
+                               attributes_to_get=['game_id', 'players', 'words_partition'])
+        players = list(game.players or ())
+        deck = list(read_words(game_id, game.words_partition, consistent_read=True))
+
+    except (GameSession.DoesNotExist, GameContent.DoesNotExist):
+        players, deck = [], []
+
+    random.shuffle(deck)
+    teams = assign_teams(players)
+    content_actions = [GameContent.deck.set(deck), GameContent.deck_size.set(len(deck)), GameContent.drawn.set({}),
+                       GameContent.expires_at.set(expiry())]
+    # with too few players for every team the transaction's condition fails, so there is no first player to set
+    if all(teams):
+        content_actions.append(GameContent.active_player.set(turn_player(teams, 0)[1]))
+
+    transaction.update(
+        GameSession(game_id),
+        actions=actions + [GameSession.teams.set([Team(players=team, score=0) for team in teams]),
+                           GameSession.turn.set(0)],
+        condition=condition & (size(GameSession.players) == len(players)) & (GameSession.word_count == len(deck)),
+    )
+    transaction.update(
+        GameContent.of(game_id),
+        actions=content_actions,
+    )
+
+
+def _rejection_response(game_id: str, status: str) -> Dict[str, Any]:
+    """
+    Builds the error response for a status change whose condition failed.
+    Only reached on the failure path, so the extra read does not slow down successful status changes.
+    """
+    from models.expiry import get_unexpired
+    from models.game_session import GameSession
+
+    game = get_unexpired(GameSession, game_id, consistent_read=True,
+                         attributes_to_get=['game_id', 'status', 'players', 'word_count'])
+
+    if game.status == GAME_ENDED:
+        return LambdaExceptionHandler.handle_error(409, 'The game with this PIN has ended')
+
+    if status in (ADDING_WORDS, IN_GAME) and len(game.players or ()) < MIN_PLAYERS:
+        return LambdaExceptionHandler.handle_error(400, 'Game must have a least 2 players')
+
+    if status == IN_GAME and (game.word_count or 0) < MIN_WORDS:
+        return LambdaExceptionHandler.handle_error(400, 'Game must have a least 5 words')
+
+    if game.status not in STATUS_TRANSITIONS[status]:
+        return LambdaExceptionHandler.handle_error(409, f"Can't move the game from {game.status} to {status}")
+
+    return LambdaExceptionHandler.handle_error(409, "The game has changed, please try again")
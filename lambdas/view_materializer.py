@@ -0,0 +1,21 @@
+from typing import Dict, Any
+
+from utils.metrics import instrumented
+
+
+@instrumented("view_materializer")
+def handler(event: Dict[str, Any], _: Any) -> Dict[str, Any]:
+    """
+    Lambda handler for the view_materializer lambda, which consumes the stream of the game's table.
+    Expected input: A batch of DynamoDB stream records of the game's table, with their new images.
+    Expected output: The records whose games' views could not be updated, as batchItemFailures holding
+     the sequence number of each such game's first record in the batch, so the batch is retried from there.
+     Records of other items than the games' headers are skipped.
+    """
+    records = event.get('Records') or []
+    if not records:
+        return {'batchItemFailures': []}
+
+    from models.game_view import materialize
+
+    return {'batchItemFailures': [{'itemIdentifier': sequence_number} for sequence_number in materialize(records)]}
@@ -1,77 +1,192 @@
-import json
-from typing import Dict, Any
+from functools import partial
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
 
-import pynamodb
-from pynamodb.exceptions import PynamoDBException
-
-from models.game_session import GameSession
+from models.game_rules import ADDING_WORDS, GAME_ENDED
 from utils.lambda_exception_handler import LambdaExceptionHandler
+from utils.metrics import instrumented
+from utils.request_pipeline import GAME_ID, Field, Request, RequestError, json_response, route
+
+if TYPE_CHECKING:
+    from pynamodb.transactions import TransactWrite
+
+    from models.game_session import GameSession
 
+MAX_WORDS_PER_REQUEST = 50
+MAX_WORD_LENGTH = 100
+# every failed attempt drops the words found to be duplicates, so retries are only needed under concurrent additions
+MAX_ADDITION_ATTEMPTS = 3
 
-def handler(event: Dict[str, Any], _: Any) -> Dict[str, Any]:
+
+@instrumented("word_adder")
+@route("PUT", "/words", query=[GAME_ID], body=[Field("word", None), Field("words", None, List[str])])
+def handler(request: Request, _: Any) -> Dict[str, Any]:
     """
     Lambda handler for the word_adder lambda.
     Expected input: An event containing a REST API request, with a PUT method, a gameId query parameter
-     and a JSON-formatted body containing a word field.
-    Expected output: An empty REST response.
+     and a JSON-formatted body containing either a word field, or a words field holding a list of words.
+    Expected output: A JSON-formatted response containing the list of words that were added,
+     and the list of words the game already had.
      In case of an error, a status code and an informative message will be returned.
     """
-    # check REST method
-    method = event.get('requestContext', {}).get('http', {}).get('method', '')
+    # Get game ID from url, words from body
+    game_id = request.query['gameId']
+    words = request.body.get('words')
+    if words is None:
+        words = [request.body['word']] if request.body.get('word') else []
+
+    if not words:
+        raise RequestError(400, "Body must contain word or words field")
 
-    if method != "PUT":
-        return LambdaExceptionHandler.handle_error(405, "Only PUT request allowed")
+    if not all(words):
+        raise RequestError(400, "Words must be a list of non-empty strings")
 
-    # Get game ID from url, nickname from body
-    game_id = event.get("queryStringParameters", {}).get("gameId")
-    word = json.loads(event.get('body', {})).get('word', '')
-    if not game_id:
-        return LambdaExceptionHandler.handle_error(400, "Failed to process game PIN")
+    if len(words) > MAX_WORDS_PER_REQUEST:
+        raise RequestError(400, f"At most {MAX_WORDS_PER_REQUEST} words can be added at once")
 
-    if not word:
-        return LambdaExceptionHandler.handle_error(400, "Body must contain word field")
+    if any(len(word) > MAX_WORD_LENGTH for word in words):
+        raise RequestError(400, f"Words must be at most {MAX_WORD_LENGTH} characters long")
 
-    # add word to DB words list
-    try:
-        game = GameSession.get(hash_key=game_id)
+    import pynamodb.exceptions
 
-    except GameSession.DoesNotExist:
-        return LambdaExceptionHandler.handle_error(404, 'Given PIN does not belong to an existing game')
+    from models.game_cache import game_cache
+    from models.game_session import commit_transaction
+    from models.game_word import read_words
 
-    except pynamodb.exceptions.PynamoDBConnectionError:
-        return LambdaExceptionHandler.handle_error(503, 'Failed to connect. Please try again')
+    # the game's header tells whether it keeps its words in its content item or as separate items. Rather than
+    # reading it first, the words are added where the container last saw the game keep them, and the header's
+    # condition checks that they are still kept there
+    partition = game_cache.words_partition(game_id)
 
-    except PynamoDBException as e:
-        return LambdaExceptionHandler.handle_error(500, 'Internal Server Error')
+    # drop repeated words, keeping the order they were sent in
+    new_words = list(dict.fromkeys(words))
+    duplicates: List[str] = []
 
-    status = game.status
+    # add the words to the game's words in a single conditional transaction- the game must exist, not have expired
+    # and be accepting words, and none of the words may already be in the game, so the word count stays exact.
+    # if some words are already in the game, they are reported as duplicates and the rest are added
+    for _ in range(MAX_ADDITION_ATTEMPTS):
+        add_words = partial(_add_word_items, partition) if partition else _add_words
+        try:
+            commit_transaction(partial(add_words, game_id, new_words))
+            break
 
-    if status == "game_ended":
-        return LambdaExceptionHandler.handle_error(409, "Game session with this PIN has ended")
+        except pynamodb.exceptions.TransactWriteError as e:
+            failed = LambdaExceptionHandler.failed_conditions(e)
+            if not any(failed):
+                raise
 
-    words = game.words
+        # PynamoDB lists a transaction's puts before its updates, and the game's header is updated last
+        if failed[-1]:
+            game = _read_header(game_id)
+            if game.status != ADDING_WORDS or game.words_partition == partition:
+                return _rejection_response(game)
 
-    if status != "adding_words":
-        return LambdaExceptionHandler.handle_error(409, "Can't currently add words to the game")
+            # the words were added where the game does not keep them, e.g. the container has not seen it yet
+            partition = game.words_partition
+            game_cache.remember_words_partition(game_id, partition)
+            continue
+
+        if partition:
+            # each word has its own item, whose put failed if the word is already in the game
+            existing_words = {word for word, put_failed in zip(new_words, failed) if put_failed}
+
+        else:
+            try:
+                existing_words = read_words(game_id, None, consistent_read=True)
+
+            except pynamodb.exceptions.DoesNotExist:
+                existing_words = set()
+
+        duplicates += [word for word in new_words if word in existing_words]
+        new_words = [word for word in new_words if word not in existing_words]
+        if not new_words:
+            break
 
-    if not words:
-        words = {word}
     else:
-        words.add(word)
-    game.words = words
+        return LambdaExceptionHandler.handle_error(409, "The game has changed, please try again")
+
+    game_cache.invalidate(game_id)
+
+    return json_response(200, {'added': new_words, 'duplicates': duplicates})
+
+
+def _add_words(game_id: str, words: List[str], transaction: "TransactWrite") -> None:
+    """
+    Adds the given new words to a game, as part of the given transaction.
+    """
+    from models.expiry import expiry
+    from models.game_content import GameContent
+
+    condition = ~GameContent.words.contains(words[0])
+    for word in words[1:]:
+        condition &= ~GameContent.words.contains(word)
 
-    try:
-        game.save()
+    transaction.update(
+        GameContent.of(game_id),
+        actions=[GameContent.words.add(set(words)), GameContent.expires_at.set(expiry())],
+        condition=condition,
+    )
+    _count_words(game_id, None, words, transaction)
 
-    except GameSession.DoesNotExist:
-        return LambdaExceptionHandler.handle_error(404, 'Given PIN does not belong to an existing game')
 
-    except pynamodb.exceptions.PynamoDBConnectionError:
-        return LambdaExceptionHandler.handle_error(503, 'Failed to connect. Please try again')
+def _add_word_items(partition: str, game_id: str, words: List[str], transaction: "TransactWrite") -> None:
+    """
+    Adds the given new words to a game that keeps its words as separate items, as part of the given transaction.
+    Each word writes only its own item, so the cost of adding a word does not grow with the game.
+    """
+    from models.expiry import expiry
+    from models.game_word import GameWord
+
+    for word in words:
+        transaction.save(GameWord(partition, word, expires_at=expiry()), condition=GameWord.word.does_not_exist())
+    _count_words(game_id, partition, words, transaction)
+
+
+def _count_words(game_id: str, partition: Optional[str], words: List[str], transaction: "TransactWrite") -> None:
+    """
+    Adds the given new words to the word count of a game that is accepting words, as part of the given transaction.
+    The game must still keep its words where they are being added.
+    The update also records the change, which the change recorder appends to the game's change log.
+    Called after the words are added to the transaction, so the header is its last item.
+    """
+    from models.change_log import WORDS_ADDED, change_action
+    from models.expiry import expiry, not_expired
+    from models.game_session import GameSession
+
+    condition = GameSession.game_id.exists() & not_expired(GameSession.expires_at) & \
+        (GameSession.status == ADDING_WORDS)
+    condition &= (GameSession.words_partition == partition) if partition else \
+        GameSession.words_partition.does_not_exist()
+
+    transaction.update(
+        GameSession(game_id),
+        actions=[GameSession.word_count.add(len(words)), GameSession.version.add(1),
+                 GameSession.expires_at.set(expiry()), change_action(WORDS_ADDED, {'words': words})],
+        condition=condition,
+    )
+
 
-    except PynamoDBException as e:
-        return LambdaExceptionHandler.handle_error(500, 'Internal Server Error')
+def _read_header(game_id: str) -> "GameSession":
+    """
+    Reads the header of a game whose word addition failed its condition.
+    Only reached on the failure path, so the extra read does not slow down successful additions.
+    :raises GameSession.DoesNotExist: if there is no such game, or it has expired
+    """
+    from models.expiry import get_unexpired
+    from models.game_session import GameSession
+
+    return get_unexpired(GameSession, game_id, consistent_read=True,
+                         attributes_to_get=['game_id', 'status', 'words_partition'])
+
+
+def _rejection_response(game: "GameSession") -> Dict[str, Any]:
+    """
+    Builds the error response for a word addition whose condition failed, from the game's current header.
+    """
+    if game.status == GAME_ENDED:
+        return LambdaExceptionHandler.handle_error(409, "Game session with this PIN has ended")
+
+    if game.status != ADDING_WORDS:
+        return LambdaExceptionHandler.handle_error(409, "Can't currently add words to the game")
 
-    return {
-        'statusCode': 200
-    }
+    return LambdaExceptionHandler.handle_error(409, "The game has changed, please try again")
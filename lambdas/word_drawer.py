@@ -0,0 +1,91 @@
+from typing import Dict, Any
+
+from models.game_rules import IN_GAME, GAME_ENDED
+from utils.lambda_exception_handler import LambdaExceptionHandler
+from utils.metrics import instrumented
+from utils.request_pipeline import GAME_ID, Field, Request, json_response, route
+
+
+@instrumented("word_drawer")
+@route("PUT", "/deck/draw", query=[GAME_ID], body=[Field("nickName", 'Nickname must be provided to draw a word')])
+def handler(request: Request, _: Any) -> Dict[str, Any]:
+    """
+    Lambda handler for the word_drawer lambda.
+    Expected input: An event containing a REST API request, with a PUT method, a gameId query parameter
+     and a JSON-formatted body containing the nickName of the player drawing a word, whose turn it must be.
+    Expected output: A JSON-formatted response containing the word drawn from the top of the game's deck,
+     and the number of words remaining in the deck.
+     In case of an error, a status code and an informative message will be returned.
+    """
+    game_id, nickname = request.query['gameId'], request.body['nickName']
+
+    import pynamodb.exceptions
+    from pynamodb.constants import ATTRIBUTES, UPDATED_OLD
+    from pynamodb.expressions.condition import size
+
+    from models.expiry import expiry, not_expired
+    from models.game_content import GameContent
+    from models.game_session import GameSession
+
+    # a draw is activity in the game, so the game's header is kept from expiring. It is extended before the draw,
+    # which can't be part of a transaction since it returns the drawn word, so a failure leaves no word drawn
+    try:
+        GameSession._get_connection().update_item(
+            game_id, actions=[GameSession.expires_at.set(expiry())],
+            condition=GameSession.game_id.exists() & not_expired(GameSession.expires_at))
+
+    except pynamodb.exceptions.UpdateError as e:
+        if LambdaExceptionHandler.is_condition_failure(e):
+            return _rejection_response(game_id, nickname)
+        raise
+
+    # pop the top word of the deck in a single conditional update- the game must not have expired, it must be
+    # the player's turn and the deck must not be empty. Two draws at once are serialized by DynamoDB,
+    # so they never get the same word. The word is handed to the player by noting it in drawn,
+    # from where only they may return it
+    condition = GameContent.deck.exists() & (size(GameContent.deck) > 0) & not_expired(GameContent.expires_at) & \
+        (GameContent.active_player == nickname)
+    actions = [GameContent.deck[0].remove(), GameContent.drawn[nickname].set(GameContent.deck[0]),
+               GameContent.deck_size.add(-1), GameContent.expires_at.set(expiry())]
+
+    try:
+        response = GameContent._get_connection().update_item(GameContent.key(game_id), actions=actions,
+                                                             condition=condition, return_values=UPDATED_OLD)
+
+    except pynamodb.exceptions.UpdateError as e:
+        if LambdaExceptionHandler.is_condition_failure(e):
+            return _rejection_response(game_id, nickname)
+        raise
+
+    # only the updated attributes are returned, as they were before the update- the drawn word and the deck's size
+    old = response[ATTRIBUTES]
+    word = old['deck']['L'][0]['S']
+    remaining = int(old['deck_size']['N']) - 1
+
+    return json_response(200, {'word': word, 'remaining': remaining})
+
+
+def _rejection_response(game_id: str, nickname: str) -> Dict[str, Any]:
+    """
+    Builds the error response for a draw whose condition failed.
+    Only reached on the failure path, so the extra reads do not slow down successful draws.
+    """
+    from models.expiry import get_unexpired
+    from models.game_content import GameContent
+    from models.game_session import GameSession
+
+    game = get_unexpired(GameSession, game_id, consistent_read=True, attributes_to_get=['game_id', 'status'])
+
+    if game.status == GAME_ENDED:
+        return LambdaExceptionHandler.handle_error(409, "The game with this PIN has ended")
+
+    if game.status != IN_GAME:
+        return LambdaExceptionHandler.handle_error(409, "The game has not started yet")
+
+    content = get_unexpired(GameContent, GameContent.key(game_id), consistent_read=True,
+                            attributes_to_get=['game_id', 'active_player'])
+
+    if content.active_player != nickname:
+        return LambdaExceptionHandler.handle_error(409, "It is not this player's turn")
+
+    return LambdaExceptionHandler.handle_error(409, "There are no words left in the deck")
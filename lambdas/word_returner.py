@@ -0,0 +1,68 @@
+from typing import Dict, Any
+
+from models.game_rules import IN_GAME, GAME_ENDED
+from utils.lambda_exception_handler import LambdaExceptionHandler
+from utils.metrics import instrumented
+from utils.request_pipeline import GAME_ID, Field, Request, json_response, route
+
+# setting a list element past the end of the list appends it, so returning a word writes only that word
+# and the update's response holds no part of the deck. An item is at most 400KB, so no deck reaches this index
+BOTTOM_OF_DECK = 400 * 1024
+
+
+@instrumented("word_returner")
+@route("PUT", "/deck/return", query=[GAME_ID], body=[Field("nickName", 'Nickname must be provided to return a word'),
+                                                     Field("word", 'Body must contain word field')])
+def handler(request: Request, _: Any) -> Dict[str, Any]:
+    """
+    Lambda handler for the word_returner lambda.
+    Expected input: An event containing a REST API request, with a PUT method, a gameId query parameter
+     and a JSON-formatted body containing the nickName of a player, and the word they drew last.
+     The word is skipped- it is put back at the bottom of the game's deck, to be drawn again later.
+    Expected output: A JSON-formatted response containing the number of words remaining in the deck.
+     In case of an error, a status code and an informative message will be returned.
+    """
+    game_id, nickname, word = request.query['gameId'], request.body['nickName'], request.body['word']
+
+    import pynamodb.exceptions
+    from pynamodb.constants import ATTRIBUTES, UPDATED_NEW
+
+    from models.expiry import expiry, not_expired
+    from models.game_content import GameContent
+
+    # put the word back in a single conditional update- the game must not have expired,
+    # and the word must be the one the player drew last, so it is returned once and only by them
+    condition = GameContent.deck.exists() & not_expired(GameContent.expires_at) & \
+        (GameContent.drawn[nickname] == word)
+    actions = [GameContent.deck[BOTTOM_OF_DECK].set(word), GameContent.drawn[nickname].remove(),
+               GameContent.deck_size.add(1), GameContent.expires_at.set(expiry())]
+
+    try:
+        response = GameContent._get_connection().update_item(GameContent.key(game_id), actions=actions,
+                                                             condition=condition, return_values=UPDATED_NEW)
+
+    except pynamodb.exceptions.UpdateError as e:
+        if LambdaExceptionHandler.is_condition_failure(e):
+            return _rejection_response(game_id)
+        raise
+
+    return json_response(200, {'remaining': int(response[ATTRIBUTES]['deck_size']['N'])})
+
+
+def _rejection_response(game_id: str) -> Dict[str, Any]:
+    """
+    Builds the error response for a return whose condition failed.
+    Only reached on the failure path, so the extra read does not slow down successful returns.
+    """
+    from models.expiry import get_unexpired
+    from models.game_session import GameSession
+
+    game = get_unexpired(GameSession, game_id, consistent_read=True, attributes_to_get=['game_id', 'status'])
+
+    if game.status == GAME_ENDED:
+        return LambdaExceptionHandler.handle_error(409, "The game with this PIN has ended")
+
+    if game.status != IN_GAME:
+        return LambdaExceptionHandler.handle_error(409, "The game has not started yet")
+
+    return LambdaExceptionHandler.handle_error(409, "This word was not drawn by this player")
@@ -1,46 +1,40 @@
-import json
 from typing import Dict, Any
 
-import pynamodb
-from pynamodb.exceptions import PynamoDBException
+from utils.metrics import instrumented
+from utils.pagination import next_cursor, paginate, parse_page
+from utils.request_pipeline import GAME_ID, Request, RequestError, json_response, route
 
-from models.game_session import GameSession
-from utils.lambda_exception_handler import LambdaExceptionHandler
 
-
-def handler(event: Dict[str, Any], _: Any) -> Dict[str, Any]:
+@instrumented("words_getter")
+@route("GET", "/words", query=[GAME_ID])
+def handler(request: Request, _: Any) -> Dict[str, Any]:
     """
     Lambda handler for the words_getter lambda.
-    Expected input: An event containing a REST API request, with a GET method and no body.
-    Expected output: A JSON-formatted response containing a words list.
+    Expected input: An event containing a REST API request, with a GET method and a gameId query parameter.
+     The request may also contain a limit query parameter, the maximal number of words to return,
+     and a cursor query parameter, the nextCursor of the previous page.
+    Expected output: A JSON-formatted response containing a page of the words list, in alphabetical order,
+     and the nextCursor of the following page, null if this page is the last.
      In case of an error, a status code and an informative message will be returned.
     """
-    # check REST method
-    method = event.get('requestContext', {}).get('http', {}).get('method', '')
-    if method != "GET":
-        return LambdaExceptionHandler.handle_error(405, "Only GET request allowed")
-
-    # Get game ID from url
-    game_id = event.get("queryStringParameters", {}).get("gameId")
-    if not game_id:
-        return LambdaExceptionHandler.handle_error(400, "Failed to process game PIN")
-
-    # get current words list from DB
+    # Get game ID and page from url
+    game_id = request.query['gameId']
     try:
-        game = GameSession.get(hash_key=game_id)
-
-    except GameSession.DoesNotExist:
-        return LambdaExceptionHandler.handle_error(404, 'Given PIN does not belong to an existing game')
+        page = parse_page(request.query)
 
-    except pynamodb.exceptions.PynamoDBConnectionError:
-        return LambdaExceptionHandler.handle_error(503, 'Failed to connect. Please try again')
+    except ValueError as e:
+        raise RequestError(400, str(e))
 
-    except PynamoDBException as e:
-        return LambdaExceptionHandler.handle_error(500, 'Internal Server Error')
+    from models.game_cache import game_cache
+    from models.game_word import read_word_page
 
-    words = list(game.words)
+    # the words of a game that keeps them as separate items are read a page at a time,
+    # the words of any other game from the container's cache or DB
+    partition = game_cache.get_game(game_id).words_partition
+    if partition:
+        words, has_more = read_word_page(partition, page.after, page.limit)
+        cursor = next_cursor(words, has_more)
+    else:
+        words, cursor = paginate(game_cache.get_words(game_id), page)
 
-    return {
-        'statusCode': 200,
-        'body': json.dumps({'words': words})
-    }
+    return json_response(200, {'words': words, 'nextCursor': cursor})
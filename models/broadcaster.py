@@ -0,0 +1,144 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from pynamodb.attributes import UnicodeAttribute, TTLAttribute
+from pynamodb.exceptions import PynamoDBException
+from pynamodb.models import Model
+
+from models.change_log import ChangeEvent, change_entry, log_key
+from models.expiry import expiry
+from models.game_session import GameSession
+from utils import json_codec
+from utils.push_transport import PushTransport, current_transport
+
+# a game's connections are sent to in parallel, so a push takes about as long as a single post
+PUSH_MAX_WORKERS = int(os.environ.get("PUSH_MAX_WORKERS", "16"))
+
+
+class Connection(Model):
+    """
+    A client connected to a game's push channel. A game's channel is the partition of its change log,
+     so the clients of a game whose PIN was reused never get the new game's changes.
+    Connections are registered when they open, and removed once a push finds them gone or the game ends-
+     a disconnection does not name the connection's game. expires_at follows the game's expiry.
+    """
+    class Meta:
+        region = os.environ["AWS_DEFAULT_REGION"]
+        table_name = "huji-lightricks-pitkiot-connections"
+    channel = UnicodeAttribute(hash_key=True)
+    connection_id = UnicodeAttribute(range_key=True)
+    expires_at = TTLAttribute(null=True)
+
+
+class Broadcaster:
+    """
+    Pushes each change to a game to all the clients connected to it, as the same entry the changes getter returns,
+     so a client that missed a push (its seq skips one) catches up through the changes getter.
+    Pushing is best-effort- the change is already committed, so failures are only logged.
+    """
+    def __init__(self, max_workers: int = PUSH_MAX_WORKERS):
+        self.max_workers = max_workers
+        self.pushes = 0
+        self.gone = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def register(self, game: GameSession, connection_id: str) -> None:
+        """
+        :param game: The header of the game the connection listens to
+        :param connection_id: The connection's ID
+        """
+        Connection(log_key(game), connection_id, expires_at=expiry()).save()
+
+    def connections(self, game: GameSession) -> List[str]:
+        """
+        :param game: A game's header
+        :return: The IDs of the connections listening to the game
+        """
+        return [connection.connection_id for connection in Connection.query(log_key(game))]
+
+    def publish(self, game: GameSession, event: ChangeEvent) -> int:
+        """
+        Pushes a change to the clients connected to its game, and removes those found to be gone.
+        Nothing is read unless a transport is in use.
+        :param game: The changed game's header
+        :param event: The change's event
+        :return: The number of clients the change was pushed to
+        """
+        transport = current_transport()
+        if transport is None:
+            return 0
+
+        try:
+            connection_ids = self.connections(game)
+            if not connection_ids:
+                return 0
+
+            # the message is serialized once, however many clients get it
+            message = json_codec.dumps(change_entry(event))
+            delivered = self._map(lambda connection_id: self._send(transport, connection_id, message), connection_ids)
+            gone = [connection_id for connection_id, sent in zip(connection_ids, delivered) if not sent]
+            self._remove(game, gone)
+
+        except PynamoDBException as e:
+            print(f"failed to push change {event.seq} of game {game.game_id}: {e}")
+            return 0
+
+        self.pushes += len(connection_ids) - len(gone)
+        self.gone += len(gone)
+        return len(connection_ids) - len(gone)
+
+    def close(self, game: GameSession) -> None:
+        """
+        Disconnects the clients of a game that has ended, after its last change was pushed to them.
+        :param game: The ended game's header
+        """
+        transport = current_transport()
+        if transport is None:
+            return
+
+        try:
+            connection_ids = self.connections(game)
+            self._map(lambda connection_id: self._disconnect(transport, connection_id), connection_ids)
+            self._remove(game, connection_ids)
+
+        except PynamoDBException as e:
+            print(f"failed to close the push channel of game {game.game_id}: {e}")
+
+    def _map(self, send: Callable[[str], bool], connection_ids: List[str]) -> List[bool]:
+        if len(connection_ids) == 1:
+            return [send(connection_ids[0])]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return list(self._executor.map(send, connection_ids))
+
+    @staticmethod
+    def _send(transport: PushTransport, connection_id: str, message: str) -> bool:
+        # a connection that failed for any other reason may still be there, so it is kept for the next push
+        try:
+            return transport.send(connection_id, message)
+
+        except Exception as e:
+            print(f"failed to push to connection {connection_id}: {e}")
+            return True
+
+    @staticmethod
+    def _disconnect(transport: PushTransport, connection_id: str) -> bool:
+        try:
+            transport.disconnect(connection_id)
+
+        except Exception as e:
+            print(f"failed to disconnect connection {connection_id}: {e}")
+        return True
+
+    @staticmethod
+    def _remove(game: GameSession, connection_ids: List[str]) -> None:
+        if not connection_ids:
+            return
+        with Connection.batch_write() as batch:
+            for connection_id in connection_ids:
+                batch.delete(Connection(log_key(game), connection_id))
+
+
+# shared by the handlers of a container, so its senders are reused across invocations
+broadcaster = Broadcaster()
@@ -0,0 +1,153 @@
+import os
+import uuid
+from typing import Any, Dict, List, Optional
+
+from pynamodb.attributes import UnicodeAttribute, NumberAttribute, TTLAttribute
+from pynamodb.exceptions import PutError
+from pynamodb.expressions.update import Action
+from pynamodb.models import Model
+
+from models.expiry import expiry
+from models.game_session import GameSession
+from utils import json_codec
+from utils.lambda_exception_handler import LambdaExceptionHandler
+
+# the kinds of changes a game's log records
+GAME_CREATED = "game_created"
+PLAYER_ADDED = "player_added"
+WORDS_ADDED = "words_added"
+STATUS_CHANGED = "status_changed"
+SCORE_CHANGED = "score_changed"
+
+# events are never updated after they are written, so they outlive any game instead of following its expiry.
+# The log of an ended game is compacted right away
+CHANGE_TTL_SECONDS = int(os.environ.get("CHANGE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+
+
+class ChangeEvent(Model):
+    """
+    An event in a game's append-only change log, describing a single change to the game.
+    Its seq is the version the change gave the game, so the log holds an event for every version of the game,
+     and a client that has seen version N catches up by reading the events after N.
+    Events are appended by the change recorder from the stream of the game's table, so the log trails the game
+     by the stream's delay, but it never has gaps- the stream delivers the changes to a game in order.
+    data is stored already serialized, as the change's JSON-formatted details.
+    """
+    class Meta:
+        region = os.environ["AWS_DEFAULT_REGION"]
+        table_name = "huji-lightricks-pitkiot-changes"
+    log = UnicodeAttribute(hash_key=True)
+    seq = NumberAttribute(range_key=True)
+    kind = UnicodeAttribute()
+    data = UnicodeAttribute()
+    expires_at = TTLAttribute(null=True)
+
+
+def new_change_log() -> str:
+    """
+    :return: A partition for a new game's change log. It is unique, so a reused PIN never shares a log
+    """
+    return uuid.uuid4().hex
+
+
+def change_event(game: GameSession, seq: int, kind: str, data: Dict[str, Any]) -> ChangeEvent:
+    """
+    :param game: The changed game's header
+    :param seq: The version the change gave the game
+    :param kind: The kind of the change
+    :param data: The change's details
+    :return: The change's event
+    """
+    return ChangeEvent(log_key(game), seq, kind=kind, data=json_codec.dumps(data),
+                       expires_at=expiry(CHANGE_TTL_SECONDS))
+
+
+def log_key(game: GameSession) -> str:
+    """
+    :param game: A game's header
+    :return: The partition of the game's change log. Games created before the log was introduced use their PIN
+    """
+    return game.change_log or game.game_id
+
+
+def describe_change(kind: str, data: Dict[str, Any]) -> str:
+    """
+    :param kind: The kind of a change to a game
+    :param data: The change's details
+    :return: The change, as kept in the last_change attribute of the game's header
+    """
+    return json_codec.dumps({'kind': kind, 'data': data})
+
+
+def change_action(kind: str, data: Dict[str, Any]) -> Action:
+    """
+    Every change to a game is a single write of its header, which increments the game's version and records
+     the change in last_change. The stream then delivers the header to the change recorder, which appends the change
+     to the game's log, so changes never contend over the log.
+    :param kind: The kind of the change
+    :param data: The change's details
+    :return: The action recording the change, to be added to the actions of the change's update of the header
+    """
+    return GameSession.last_change.set(describe_change(kind, data))
+
+
+def last_event(game: GameSession) -> Optional[ChangeEvent]:
+    """
+    :param game: A game's header, as a change left it
+    :return: The event of the change that gave the game its version, or None if the header records no change
+    """
+    if not game.last_change:
+        return None
+    change = json_codec.loads(game.last_change)
+    return change_event(game, int(game.version or 0), change['kind'], change['data'])
+
+
+def append_event(event: ChangeEvent) -> bool:
+    """
+    Appends an event to its game's change log, unless the log already has it.
+    :param event: An event, as built from the game's header
+    :return: False if the log already had the event, e.g. as its stream record was delivered again
+    """
+    try:
+        event.save(condition=ChangeEvent.seq.does_not_exist())
+
+    except PutError as e:
+        if not LambdaExceptionHandler.is_condition_failure(e):
+            raise
+        return False
+
+    return True
+
+
+def change_entry(event: ChangeEvent) -> Dict[str, Any]:
+    """
+    :param event: An event of a game's change log
+    :return: The change as clients get it- its seq, kind and data
+    """
+    return {'seq': int(event.seq), 'kind': event.kind, 'data': json_codec.loads(event.data)}
+
+
+def read_changes(game: GameSession, since: int, limit: int) -> List[ChangeEvent]:
+    """
+    :param game: A game's header
+    :param since: The version of the game the caller has last seen
+    :param limit: The maximal number of events to read
+    :return: The events of the changes that followed the given version, in order
+    """
+    return list(ChangeEvent.query(log_key(game), range_key_condition=ChangeEvent.seq > since, limit=limit,
+                                  page_size=limit))
+
+
+def compact_log(game: GameSession, last_seq: int) -> int:
+    """
+    Deletes the events of a game's log that came before the given one, e.g. once the game has ended.
+    :param game: A game's header
+    :param last_seq: The seq of the first event to keep
+    :return: The number of events deleted
+    """
+    events = list(ChangeEvent.query(log_key(game), range_key_condition=ChangeEvent.seq < last_seq,
+                                    attributes_to_get=['log', 'seq']))
+    with ChangeEvent.batch_write() as batch:
+        for event in events:
+            batch.delete(event)
+    return len(events)
@@ -0,0 +1,89 @@
+from typing import Any, Dict, List
+
+from pynamodb.exceptions import PynamoDBException
+
+from models.broadcaster import broadcaster
+from models.change_log import STATUS_CHANGED, append_event, compact_log, last_event
+from models.game_session import GameSession, GAME_ENDED
+from models.game_view import REMOVE, is_header
+from models.game_word import extend_words
+from models.pin_allocator import pin_allocator
+
+
+def record_changes(records: List[Dict[str, Any]]) -> List[str]:
+    """
+    Appends the changes delivered by a batch of stream records to their games' change logs, and pushes each one
+     to the clients connected to its game. A status change also moves the expiry of the game's word items
+     to the game's. The PINs of games that ended or expired are returned to the PIN pool.
+    The records of each game are in order, and once a game's record fails its later records are left to the retry,
+     so each log is appended in order. A failed batch is retried from its first failed record, so records of games
+     that did succeed may arrive again- a change the log already has is neither appended nor pushed again.
+    :param records: A batch of records of the stream of the game's table, with their new images
+    :return: The sequence numbers of the first failed record of each game whose changes could not be recorded
+    """
+    failures: Dict[str, str] = {}
+    for record in records:
+        if not is_header(record):
+            continue
+        game_id = record['dynamodb']['Keys']['game_id']['S']
+        if game_id in failures:
+            continue
+
+        if record['eventName'] == REMOVE:
+            # an expired game is deleted, and its PIN is free again
+            _release(game_id)
+            continue
+
+        image = record['dynamodb'].get('NewImage')
+        if image is None:
+            # retrying a record the stream did not give an image won't give it one
+            print(f"record {record['dynamodb'].get('SequenceNumber')} of game {game_id} has no new image, skipped")
+            continue
+
+        try:
+            _record(GameSession.from_raw_data(image))
+
+        except PynamoDBException as e:
+            print(f"failed to record the changes of game {game_id}: {e}")
+            failures[game_id] = record['dynamodb']['SequenceNumber']
+
+    return list(failures.values())
+
+
+def _record(game: GameSession) -> None:
+    # games created before the log was introduced don't record their changes
+    event = last_event(game)
+    if event is None:
+        return
+
+    # a status change moves the game's expiry, which its word items follow. They are extended before the change is
+    # appended, so a failed extension is retried with the record
+    if event.kind == STATUS_CHANGED and game.words_partition:
+        extend_words(game.words_partition, game.expires_at)
+
+    if not append_event(event):
+        return
+
+    broadcaster.publish(game, event)
+
+    # an ended game can no longer change, so clients behind it only need the event that ended it,
+    # and any other client reads the final game instead. The log also expires on its own, so a failure is only logged
+    if game.status == GAME_ENDED and event.kind == STATUS_CHANGED:
+        try:
+            compact_log(game, event.seq)
+
+        except PynamoDBException as e:
+            print(f"failed to compact the change log of game {game.game_id}: {e}")
+
+        # an ended game's clients have nothing more to hear, and its PIN may be given to a new game
+        broadcaster.close(game)
+        _release(game.game_id)
+
+
+def _release(pin: str) -> None:
+    # the pool is only a hint, as PINs not in it are still drawn at random, so a failure is only logged
+    try:
+        pin_allocator.release(pin)
+
+    except PynamoDBException as e:
+        print(f"failed to release PIN {pin}: {e}")
@@ -0,0 +1,68 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Type, TypeVar
+
+from pynamodb.attributes import TTLAttribute
+from pynamodb.expressions.condition import Condition
+from pynamodb.models import Model
+
+# a game expires once it had no activity for this long, and DynamoDB deletes its items shortly after
+GAME_TTL_SECONDS = int(os.environ.get("GAME_TTL_SECONDS", str(24 * 60 * 60)))
+# an ended game can no longer change, so it is kept only long enough for its players to see the result
+ENDED_GAME_TTL_SECONDS = int(os.environ.get("ENDED_GAME_TTL_SECONDS", str(60 * 60)))
+
+M = TypeVar("M", bound=Model)
+
+
+def expiry(ttl_seconds: int = GAME_TTL_SECONDS) -> timedelta:
+    """
+    :param ttl_seconds: How long an item may stay without activity
+    :return: An expiry relative to now, to assign to an expires_at attribute
+    """
+    return timedelta(seconds=ttl_seconds)
+
+
+def is_expired(item: Model) -> bool:
+    """
+    DynamoDB deletes expired items lazily, up to a few days after they expire, so reads may still return them.
+    :param item: A game's item
+    :return: True if the item has expired. Items saved without an expiry never expire
+    """
+    expires_at = getattr(item, "expires_at", None)
+    return expires_at is not None and expires_at <= datetime.now(timezone.utc)
+
+
+def not_expired(attribute: TTLAttribute) -> Condition:
+    """
+    :param attribute: An expires_at attribute
+    :return: A condition that holds for items that have not expired
+    """
+    return attribute.does_not_exist() | (attribute > datetime.now(timezone.utc))
+
+
+def expired(attribute: TTLAttribute) -> Condition:
+    """
+    :param attribute: An expires_at attribute
+    :return: A condition that holds for items that have expired
+    """
+    return attribute <= datetime.now(timezone.utc)
+
+
+def get_unexpired(model: Type[M], hash_key: str, consistent_read: bool = False,
+                  attributes_to_get: Optional[List[str]] = None) -> M:
+    """
+    Gets an item, treating an expired item that was not deleted yet as missing.
+    :param model: The item's model class
+    :param hash_key: The item's key
+    :param consistent_read: Whether to use a strongly consistent read
+    :param attributes_to_get: The attributes to read, or None to read all of them
+    :return: The item
+    :raises model.DoesNotExist: if there is no such item, or it has expired
+    """
+    if attributes_to_get is not None:
+        attributes_to_get = [*attributes_to_get, 'expires_at']
+
+    item = model.get(hash_key=hash_key, consistent_read=consistent_read, attributes_to_get=attributes_to_get)
+    if is_expired(item):
+        raise model.DoesNotExist()
+    return item
@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Set
+
+from models.expiry import get_unexpired
+from models.game_session import GameSession
+from models.game_view import read_view
+from models.game_word import read_words
+
+GAME_CACHE_TTL_SECONDS = float(os.environ.get("GAME_CACHE_TTL_MS", "250")) / 1000
+GAME_CACHE_MAX_ENTRIES = int(os.environ.get("GAME_CACHE_MAX_ENTRIES", "256"))
+GAME_ATTRIBUTES = ['game_id', 'status', 'players', 'version', 'word_count', 'words_partition', 'teams', 'turn',
+                   'change_log', 'created_at']
+
+
+class _CacheEntry:
+    def __init__(self):
+        self.game: Optional[GameSession] = None
+        self.game_fetched_at = 0.0
+        self.words: Optional[Set[str]] = None
+        self.words_fetched_at = 0.0
+        self.views: Dict[str, str] = {}
+        self.views_fetched_at: Dict[str, float] = {}
+
+
+class GameCache:
+    """
+    A bounded, least-recently-used cache of games, shared by the getters of a container.
+    A game is served from the cache for a short TTL, which absorbs bursts of polls of the same game.
+    Ended games are no exception- their PIN may be given to a new game by another container,
+     whose cache is the only one invalidated.
+    The cached objects are shared between callers and must not be modified.
+    The cache also remembers where each game keeps its words, which never changes while the game lives,
+     so writers can use it without reading the game first.
+    The cache may be shared by threads, e.g. when handlers are called concurrently in one process.
+    """
+    def __init__(self, max_entries: int = GAME_CACHE_MAX_ENTRIES, ttl_seconds: float = GAME_CACHE_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._partitions: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_game(self, game_id: str) -> GameSession:
+        """
+        :param game_id: The ID of a game session
+        :return: The game's header item- status, players, version, word count, words partition, teams and turn
+        :raises GameSession.DoesNotExist: if there is no such game, or it has expired
+        """
+        with self._lock:
+            entry = self._entries.get(game_id)
+            if entry is not None and entry.game is not None and self._is_fresh(entry.game_fetched_at):
+                self._hit(game_id)
+                return entry.game
+            self.misses += 1
+
+        game = get_unexpired(GameSession, game_id, attributes_to_get=GAME_ATTRIBUTES)
+        with self._lock:
+            entry = self._entry(game_id)
+            entry.game = game
+            entry.game_fetched_at = self.clock()
+        self.remember_words_partition(game_id, game.words_partition)
+        return game
+
+    def words_partition(self, game_id: str) -> Optional[str]:
+        """
+        :param game_id: The ID of a game session
+        :return: The words partition this container last saw the game with, without reading the game, or None
+         if it kept its words in its content item or was not seen. The PIN may have been given to a new game since,
+         so a write using the partition must check it in its condition
+        """
+        with self._lock:
+            return self._partitions.get(game_id)
+
+    def remember_words_partition(self, game_id: str, partition: Optional[str]) -> None:
+        """
+        :param game_id: The ID of a game session
+        :param partition: The game's words partition, as read from its header
+        """
+        with self._lock:
+            self._partitions[game_id] = partition
+            self._partitions.move_to_end(game_id)
+            while len(self._partitions) > self.max_entries:
+                self._partitions.popitem(last=False)
+
+    def get_words(self, game_id: str) -> Set[str]:
+        """
+        :param game_id: The ID of a game session
+        :return: The game's words
+        :raises GameSession.DoesNotExist: if there is no such game, or it has expired
+        :raises GameContent.DoesNotExist: if the game's content item is missing, or it has expired
+        """
+        with self._lock:
+            entry = self._entries.get(game_id)
+            if entry is not None and entry.words is not None and self._is_fresh(entry.words_fetched_at):
+                self._hit(game_id)
+                return entry.words
+            self.misses += 1
+
+        # the game's header tells where it keeps its words
+        words = read_words(game_id, self.get_game(game_id).words_partition)
+        with self._lock:
+            entry = self._entry(game_id)
+            entry.words = words
+            entry.words_fetched_at = self.clock()
+        return words
+
+    def get_view(self, game_id: str, view: str) -> Optional[str]:
+        """
+        :param game_id: The ID of a game session
+        :param view: The name of one of the game's materialized views
+        :return: The serialized view, or None if the game's views were not materialized (yet)
+        """
+        with self._lock:
+            entry = self._entries.get(game_id)
+            if entry is not None and view in entry.views and self._is_fresh(entry.views_fetched_at[view]):
+                self._hit(game_id)
+                return entry.views[view]
+            self.misses += 1
+
+        body = read_view(game_id, view)
+        if body is None:
+            return None
+        with self._lock:
+            entry = self._entry(game_id)
+            entry.views[view] = body
+            entry.views_fetched_at[view] = self.clock()
+        return body
+
+    def invalidate(self, game_id: str) -> None:
+        """
+        Drops a game from the cache, e.g. after it was changed in this container.
+        :param game_id: The ID of a game session
+        """
+        with self._lock:
+            self._entries.pop(game_id, None)
+
+    def clear(self) -> None:
+        """
+        Drops all games from the cache and resets its counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._partitions.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: The cache's hit and miss counters, and the number of cached games
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+    def _is_fresh(self, fetched_at: float) -> bool:
+        return self.clock() - fetched_at < self.ttl_seconds
+
+    def _hit(self, game_id: str) -> None:
+        self.hits += 1
+        self._entries.move_to_end(game_id)
+
+    def _entry(self, game_id: str) -> _CacheEntry:
+        entry = self._entries.get(game_id)
+        if entry is None:
+            entry = self._entries[game_id] = _CacheEntry()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(game_id)
+        return entry
+
+
+# shared by the handlers of a container
+game_cache = GameCache()
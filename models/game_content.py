@@ -0,0 +1,45 @@
+import os
+
+from pynamodb.attributes import UnicodeAttribute, UnicodeSetAttribute, TTLAttribute, ListAttribute, MapAttribute, \
+    NumberAttribute
+from pynamodb.models import Model
+
+CONTENT_KEY_SUFFIX = "#content"
+
+
+class GameContent(Model):
+    """
+    The bulky part of a game session- its words.
+    It is stored apart from the game's GameSession item, so reading a game's status does not pay for its words.
+    Once the game starts, deck holds its words in a shuffled order, and each player draws the next word from it.
+     drawn maps each player to the word they drew last, so only they can return it to the deck.
+     active_player is the player whose turn it is, the only one who may draw. It is kept in step with the
+     game's turn, so a draw is checked against it in the same single update that draws the word.
+    Its expires_at is kept in step with the game's, so both items expire together.
+    """
+    class Meta:
+        region = os.environ["AWS_DEFAULT_REGION"]
+        table_name = "huji-lightricks-pitkiot"
+    game_id = UnicodeAttribute(hash_key=True)
+    words = UnicodeSetAttribute(null=True)
+    deck = ListAttribute(of=UnicodeAttribute, null=True)
+    deck_size = NumberAttribute(null=True)
+    drawn = MapAttribute(null=True)
+    active_player = UnicodeAttribute(null=True)
+    expires_at = TTLAttribute(null=True)
+
+    @staticmethod
+    def key(game_id: str) -> str:
+        """
+        :param game_id: The ID of a game session
+        :return: The key of the game's content item
+        """
+        return f"{game_id}{CONTENT_KEY_SUFFIX}"
+
+    @classmethod
+    def of(cls, game_id: str) -> "GameContent":
+        """
+        :param game_id: The ID of a game session
+        :return: An empty content object keyed by the game's content key
+        """
+        return cls(cls.key(game_id))
@@ -0,0 +1,45 @@
+import random
+from typing import Iterable, List, Tuple
+
+ADDING_PLAYERS = "adding_players"
+ADDING_WORDS = "adding_words"
+IN_GAME = "in_game"
+GAME_ENDED = "game_ended"
+
+# maps each status a game can be moved to, to the statuses it may be moved from
+STATUS_TRANSITIONS = {
+    ADDING_WORDS: (ADDING_PLAYERS,),
+    IN_GAME: (ADDING_WORDS,),
+    GAME_ENDED: (ADDING_PLAYERS, ADDING_WORDS, IN_GAME),
+}
+GAME_STATUSES = (ADDING_PLAYERS, ADDING_WORDS, IN_GAME, GAME_ENDED)
+
+# a game needs enough players for 2 teams, and enough words to play a round
+MIN_PLAYERS = 2
+MIN_WORDS = 5
+# the players are split into this many teams when the game starts
+TEAM_COUNT = 2
+
+
+def assign_teams(players: Iterable[str], team_count: int = TEAM_COUNT) -> List[List[str]]:
+    """
+    Splits the players into teams at random, whose sizes differ by at most one.
+    :param players: The game's players
+    :param team_count: The number of teams
+    :return: The teams, each listing its players in the order they take the team's turns
+    """
+    shuffled = list(players)
+    random.shuffle(shuffled)
+    return [shuffled[team::team_count] for team in range(team_count)]
+
+
+def turn_player(teams: List[List[str]], turn: int) -> Tuple[int, str]:
+    """
+    The teams take turns in order, and each team's players take its turns in order.
+    :param teams: The game's teams, each listing its players in turn order
+    :param turn: The number of turns played so far
+    :return: The index of the team whose turn it is, and its player taking the turn
+    """
+    team = turn % len(teams)
+    players = teams[team]
+    return team, players[(turn // len(teams)) % len(players)]
@@ -1,12 +1,53 @@
 import os
+import random
+import time
+from typing import Callable, Type
 
-from pynamodb.attributes import UnicodeAttribute, UnicodeSetAttribute
+from pynamodb.attributes import UnicodeAttribute, UnicodeSetAttribute, NumberAttribute, TTLAttribute, ListAttribute, \
+    MapAttribute
+from pynamodb.exceptions import TransactWriteError
 from pynamodb.models import Model
+from pynamodb.transactions import TransactWrite
+
+# the game's rules don't depend on DynamoDB, so handlers can validate requests without importing this module
+from models.game_rules import ADDING_PLAYERS, ADDING_WORDS, IN_GAME, GAME_ENDED, STATUS_TRANSITIONS, \
+    GAME_STATUSES, MIN_PLAYERS, MIN_WORDS, TEAM_COUNT  # noqa: F401
+from utils.lambda_exception_handler import LambdaExceptionHandler, TRANSACTION_CONFLICT
+from utils.metrics import instrument_dynamodb
+
+TRANSACTION_ATTEMPTS = 4
+TRANSACTION_RETRY_BASE_DELAY_SECONDS = 0.02
+
+
+# every DynamoDB call made while a handler runs is counted in its metrics. Every model is used along with the
+# game's header, so its module is the one place the models' connections are instrumented
+instrument_dynamodb()
+
+
+class Team(MapAttribute):
+    """
+    A team of a started game- its players, in the order they take the team's turns, and its score.
+    """
+    players = ListAttribute(of=UnicodeAttribute)
+    score = NumberAttribute(default=0)
 
 
 class GameSession(Model):
     """
-    A representation of a game session and its properties- players and words.
+    A representation of a game session and its properties- status, players and the number of words.
+    The words themselves are kept in the game's GameContent item, so this item stays small
+     and reading it costs the same no matter how many words the game has.
+    If words_partition is set, the game keeps its words as GameWord items under that partition instead,
+     so the number of words is not limited by the size of a single item.
+    Once the game starts, teams holds its teams in the order they take turns, and turn counts the turns played,
+     so the player whose turn it is follows from them (see game_rules.turn_player).
+    created_at is the game's creation time, in milliseconds. The PIN of an ended game is reused by new games,
+     so it tells apart the games that had the same PIN.
+    version is incremented by every change to the game, so clients can tell whether their copy is up to date.
+     Every change also sets last_change to its kind and details, from which the change recorder appends it to
+     the game's change log, kept under the change_log partition (see change_log.change_action), so clients can
+     catch up on the changes instead of reading the whole game.
+    expires_at is pushed forward by every change to the game, and DynamoDB deletes the game once it passes.
     """
     class Meta:
         region = os.environ["AWS_DEFAULT_REGION"]
@@ -14,4 +55,43 @@ class GameSession(Model):
     game_id = UnicodeAttribute(hash_key=True)
     status = UnicodeAttribute(null=True)
     players = UnicodeSetAttribute(null=True)
-    words = UnicodeSetAttribute(null=True)
+    version = NumberAttribute(null=True)
+    word_count = NumberAttribute(null=True)
+    words_partition = UnicodeAttribute(null=True)
+    teams = ListAttribute(of=Team, null=True)
+    turn = NumberAttribute(null=True)
+    change_log = UnicodeAttribute(null=True)
+    last_change = UnicodeAttribute(null=True)
+    created_at = NumberAttribute(null=True)
+    expires_at = TTLAttribute(null=True)
+
+
+def commit_transaction(build: Callable[[TransactWrite], None]) -> None:
+    """
+    Builds and commits a write transaction over the game's items, using the same connection as the models.
+    DynamoDB cancels transactions that run concurrently on the same item, so a conflicting transaction is
+     rebuilt and retried after a short random delay.
+    :param build: Adds the transaction's operations to the given transaction
+    :raises TransactWriteError: if the transaction was cancelled for any other reason, or kept conflicting
+    """
+    for attempt in range(TRANSACTION_ATTEMPTS):
+        try:
+            with TransactWrite(connection=GameSession._get_connection().connection) as transaction:
+                build(transaction)
+            return
+
+        except TransactWriteError as e:
+            conflicted = TRANSACTION_CONFLICT in LambdaExceptionHandler.cancellation_reasons(e)
+            if not conflicted or attempt == TRANSACTION_ATTEMPTS - 1:
+                raise
+            time.sleep(random.uniform(0, TRANSACTION_RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+def join_transactions(model: Type[Model]) -> None:
+    """
+    Lets commit_transaction write items of the given model, which may be kept in another table.
+    Transactions run on the connection of the game's header, so it is given the model's schema up front,
+     instead of describing the model's table on first use.
+    :param model: A model whose items are written in the game's transactions
+    """
+    GameSession._get_connection().connection.add_meta_table(model._get_connection().get_meta_table())
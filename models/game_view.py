@@ -0,0 +1,182 @@
+import os
+from typing import Any, Dict, List, Optional
+
+from pynamodb.attributes import UnicodeAttribute, NumberAttribute, TTLAttribute
+from pynamodb.exceptions import PutError, PynamoDBException
+from pynamodb.models import Model
+
+from models.expiry import is_expired
+from models.game_rules import turn_player
+from models.game_session import GameSession
+from utils import json_codec
+from utils.lambda_exception_handler import LambdaExceptionHandler
+from utils.pagination import MAX_PAGE_LIMIT, Page, paginate
+
+# with materialized views, requests for a game's current views are served from the views the stream keeps,
+# instead of being built from the game's header. The views trail the header by the stream's delay, so they are
+# off unless the deployment turns them on, and the template's MaterializedViews parameter defaults to off as well
+MATERIALIZED_VIEWS = os.environ.get("MATERIALIZED_VIEWS", "false").lower() == "true"
+
+# the views of a game, each the body of a getter's response
+LOBBY = "lobby"
+SCOREBOARD = "scoreboard"
+COUNTS = "counts"
+
+# the stream's event for an item that was deleted, e.g. by its expiry
+REMOVE = "REMOVE"
+
+
+class GameView(Model):
+    """
+    The views of a game, kept by the view materializer from the stream of the game's table.
+    Each view is already serialized as the body of a getter's response, so serving it builds nothing.
+    created_at and version tell which game, and which version of it, the views show. The PIN of an ended game is
+     reused by new games, so the views of a newer game always replace them, while a record of an older version
+     of the same game never does.
+    expires_at follows the game's expiry.
+    """
+    class Meta:
+        region = os.environ["AWS_DEFAULT_REGION"]
+        table_name = "huji-lightricks-pitkiot-views"
+    game_id = UnicodeAttribute(hash_key=True)
+    created_at = NumberAttribute(null=True)
+    version = NumberAttribute()
+    lobby = UnicodeAttribute()
+    scoreboard = UnicodeAttribute()
+    counts = UnicodeAttribute()
+    expires_at = TTLAttribute(null=True)
+
+
+def lobby_view(game: GameSession) -> Dict[str, Any]:
+    """
+    :param game: A game's header
+    :return: The game's players, as the players getter returns their first page, and the game's version
+    """
+    players, cursor = paginate(game.players or (), Page(MAX_PAGE_LIMIT, None))
+    return {'players': players, 'nextCursor': cursor, 'version': int(game.version or 0)}
+
+
+def scoreboard_view(game: GameSession) -> Dict[str, Any]:
+    """
+    :param game: A game's header
+    :return: The game's teams and scores, the turn and whose turn it is, and the game's version.
+     Before the game starts it has no teams, and no one's turn
+    """
+    teams = [team.players for team in game.teams or ()]
+    turn = int(game.turn or 0)
+    active_team, active_player = turn_player(teams, turn) if teams else (None, None)
+    return {
+        'teams': [{'players': team.players, 'score': int(team.score or 0)} for team in game.teams or ()],
+        'turn': turn,
+        'activeTeam': active_team,
+        'activePlayer': active_player,
+        'version': int(game.version or 0),
+    }
+
+
+def counts_view(game: GameSession) -> Dict[str, Any]:
+    """
+    :param game: A game's header
+    :return: The game's status, version, and numbers of players and words
+    """
+    return {
+        'status': game.status,
+        'version': int(game.version or 0),
+        'playerCount': len(game.players or ()),
+        'wordCount': int(game.word_count or 0),
+    }
+
+
+def build_view(game: GameSession) -> GameView:
+    """
+    :param game: A game's header
+    :return: The game's views, serialized
+    """
+    return GameView(
+        game.game_id,
+        created_at=int(game.created_at or 0),
+        version=int(game.version or 0),
+        lobby=json_codec.dumps(lobby_view(game)),
+        scoreboard=json_codec.dumps(scoreboard_view(game)),
+        counts=json_codec.dumps(counts_view(game)),
+        expires_at=game.expires_at,
+    )
+
+
+def read_view(game_id: str, view: str) -> Optional[str]:
+    """
+    :param game_id: The ID of a game session
+    :param view: The name of one of the game's views
+    :return: The serialized view, or None if the game's views were not materialized (yet)
+    """
+    try:
+        item = GameView.get(hash_key=game_id, attributes_to_get=[view, 'expires_at'])
+
+    except GameView.DoesNotExist:
+        return None
+
+    return None if is_expired(item) else getattr(item, view)
+
+
+def is_header(record: Dict[str, Any]) -> bool:
+    """
+    :param record: A record of the stream of the game's table
+    :return: True if the record describes a game's header, rather than another item of the game
+    """
+    return '#' not in record['dynamodb']['Keys']['game_id']['S']
+
+
+def materialize(records: List[Dict[str, Any]]) -> List[str]:
+    """
+    Updates the views of the games changed by a batch of stream records.
+    A game changed by several records of the batch is only written once, from its last record.
+    The records of each game are in order, but a failed batch is retried from its first failed record,
+     so records of games that did succeed may arrive again- a view is only replaced by a newer version of its game.
+    :param records: A batch of records of the stream of the game's table, with their new images
+    :return: The sequence numbers of the first record of each game whose views could not be updated
+    """
+    first: Dict[str, Dict[str, Any]] = {}
+    last: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        if not is_header(record):
+            continue
+        game_id = record['dynamodb']['Keys']['game_id']['S']
+        first.setdefault(game_id, record)
+        last[game_id] = record
+
+    failures = []
+    for game_id, record in last.items():
+        try:
+            _apply(game_id, record)
+
+        except PynamoDBException as e:
+            print(f"failed to materialize the views of game {game_id}: {e}")
+            failures.append(first[game_id]['dynamodb']['SequenceNumber'])
+
+    return failures
+
+
+def _apply(game_id: str, record: Dict[str, Any]) -> None:
+    # an expired or replaced game's views go with it
+    if record['eventName'] == REMOVE:
+        GameView(game_id).delete()
+        return
+
+    image = record['dynamodb'].get('NewImage')
+    if image is None:
+        # retrying a record the stream did not give an image won't give it one
+        print(f"record {record['dynamodb'].get('SequenceNumber')} of game {game_id} has no new image, skipped")
+        return
+
+    # the views are replaced by a newer version of their game, or by any version of a game that reused its PIN.
+    # Games created before created_at was kept count as created at 0
+    view = build_view(GameSession.from_raw_data(image))
+    condition = GameView.created_at.does_not_exist() | (GameView.created_at < view.created_at) | \
+        ((GameView.created_at == view.created_at) & (GameView.version < view.version))
+    try:
+        view.save(condition=condition)
+
+    except PutError as e:
+        # the views already show this version of the game, a newer one, or a newer game
+        if not LambdaExceptionHandler.is_condition_failure(e):
+            raise
@@ -0,0 +1,90 @@
+import os
+import uuid
+from datetime import datetime
+from typing import List, Optional, Set, Tuple
+
+from pynamodb.attributes import UnicodeAttribute, TTLAttribute
+from pynamodb.models import Model
+
+from models.expiry import get_unexpired
+from models.game_content import GameContent
+from models.game_session import join_transactions
+
+# where new games keep their words- "set", in their GameContent item, or "items", as a GameWord item per word
+WORD_STORAGE = os.environ.get("WORD_STORAGE", "set")
+WORD_ITEMS = "items"
+
+
+class GameWord(Model):
+    """
+    A single word of a game that keeps its words as separate items, for games too large for a single item.
+    All of a game's words share the game's partition and are sorted by their text, so they are read with a Query,
+     and adding a word writes only its own small item, no matter how many words the game has.
+    The partition is unique to the game rather than its PIN, so the words of an ended game whose PIN was
+     reused are never mixed into the new game's.
+    A word expires with the game it was added to, and is extended whenever the game's status changes.
+    """
+    class Meta:
+        region = os.environ["AWS_DEFAULT_REGION"]
+        table_name = "huji-lightricks-pitkiot-words"
+    partition = UnicodeAttribute(hash_key=True)
+    word = UnicodeAttribute(range_key=True)
+    expires_at = TTLAttribute(null=True)
+
+
+# words are added in the same transaction that counts them on the game's header
+join_transactions(GameWord)
+
+
+def new_partition() -> Optional[str]:
+    """
+    :return: The partition for the words of a new game, or None if new games keep their words in a single item
+    """
+    return uuid.uuid4().hex if WORD_STORAGE == WORD_ITEMS else None
+
+
+def read_words(game_id: str, partition: Optional[str], consistent_read: bool = False) -> Set[str]:
+    """
+    Reads a game's words from wherever the game keeps them.
+    :param game_id: The ID of a game session
+    :param partition: The game's words partition, or None if the game keeps its words in its content item
+    :param consistent_read: Whether to use strongly consistent reads
+    :return: The game's words
+    :raises GameContent.DoesNotExist: if the game keeps its words in its content item, and there is no such game
+     or it has expired
+    """
+    if partition:
+        return {item.word for item in GameWord.query(partition, consistent_read=consistent_read,
+                                                     attributes_to_get=['word'])}
+
+    content = get_unexpired(GameContent, GameContent.key(game_id), consistent_read=consistent_read,
+                            attributes_to_get=['game_id', 'words'])
+    return content.words or set()
+
+
+def read_word_page(partition: str, after: Optional[str], limit: int) -> Tuple[List[str], bool]:
+    """
+    Reads a page of the words of a game that keeps its words as separate items, in the order of their text.
+    Only the page's items are read, so the cost of a page does not grow with the game.
+    :param partition: The game's words partition
+    :param after: The word the page starts after, or None to start from the first word
+    :param limit: The maximal number of words in the page
+    :return: The page's words, and whether there are words after them
+    """
+    condition = GameWord.word > after if after is not None else None
+    words = [item.word for item in GameWord.query(partition, range_key_condition=condition, limit=limit + 1,
+                                                  page_size=limit + 1, attributes_to_get=['word'])]
+    return words[:limit], len(words) > limit
+
+
+def extend_words(partition: str, expires_at: datetime) -> None:
+    """
+    Moves the expiry of all the words of a game that keeps its words as separate items, to follow the game's.
+    The words are written again, so extending them twice to the same expiry changes nothing.
+    :param partition: The game's words partition
+    :param expires_at: The game's new expiry
+    """
+    words = GameWord.query(partition, consistent_read=True, attributes_to_get=['word'])
+    with GameWord.batch_write() as batch:
+        for item in words:
+            batch.save(GameWord(partition, item.word, expires_at=expires_at))
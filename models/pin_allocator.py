@@ -0,0 +1,169 @@
+import os
+import random
+from secrets import randbelow
+from typing import Optional
+
+import pynamodb.exceptions
+from pynamodb.attributes import UnicodeAttribute, ListAttribute
+from pynamodb.constants import ATTRIBUTES, UPDATED_OLD
+from pynamodb.expressions.condition import size
+from pynamodb.models import Model
+from pynamodb.transactions import TransactWrite
+
+from models.expiry import expired
+from models.game_cache import game_cache
+from models.game_content import GameContent
+from models.game_session import GameSession, GAME_ENDED, commit_transaction
+from utils.lambda_exception_handler import LambdaExceptionHandler
+
+PIN_LENGTH = 4
+PIN_SPACE = 16 ** PIN_LENGTH
+MAX_ALLOCATION_ATTEMPTS = int(os.environ.get("PIN_MAX_ALLOCATION_ATTEMPTS", "8"))
+# the shared pool of free PINs is split into this many items, so concurrent allocations rarely write the same one.
+# Without shards there is no pool, and every PIN is drawn at random
+PIN_POOL_SHARDS = int(os.environ.get("PIN_POOL_SHARDS", "0"))
+# a shard is a single item, whose size DynamoDB limits
+MAX_PINS_PER_SHARD = 4096
+POOL_KEY_PREFIX = "pins#"
+
+
+class PinAllocationError(Exception):
+    """
+    Raised when no free PIN was found within the allowed number of attempts.
+    """
+
+
+def random_pin() -> str:
+    """
+    :return: A uniformly random PIN from the whole PIN space
+    """
+    return format(randbelow(PIN_SPACE), f"0{PIN_LENGTH}x")
+
+
+class PinPoolShard(Model):
+    """
+    A shard of the pool of free PINs, shared by all containers. It is kept in the game's table, under a key
+     no game can have.
+    pins lists PINs whose games have ended or expired- the change recorder releases them from the stream of the
+     game's table, and the allocator pops them from the front. The pool is only a hint, as a released PIN may have
+     been taken by a random draw since, so the allocator's conditional write still decides whether a PIN is free.
+    """
+    class Meta:
+        region = os.environ["AWS_DEFAULT_REGION"]
+        table_name = "huji-lightricks-pitkiot"
+    game_id = UnicodeAttribute(hash_key=True)
+    pins = ListAttribute(of=UnicodeAttribute, null=True)
+
+
+class PinPool:
+    """
+    The pool of free PINs, kept in DynamoDB so PINs released by one container are handed out by any other.
+    Acquiring and releasing a PIN are each a single update of a random shard.
+    """
+    def __init__(self, shards: int):
+        self.shards = shards
+
+    def acquire(self) -> Optional[str]:
+        """
+        Pops the first PIN of a random shard, like a draw from a game's deck.
+        :return: A PIN whose game has ended or expired, or None if the shard is empty
+        """
+        condition = PinPoolShard.pins.exists() & (size(PinPoolShard.pins) > 0)
+        try:
+            response = PinPoolShard._get_connection().update_item(
+                self._shard_key(), actions=[PinPoolShard.pins[0].remove()], condition=condition,
+                return_values=UPDATED_OLD)
+
+        except pynamodb.exceptions.UpdateError as e:
+            if not LambdaExceptionHandler.is_condition_failure(e):
+                raise
+            return None
+
+        return response[ATTRIBUTES]['pins']['L'][0]['S']
+
+    def release(self, pin: str) -> None:
+        """
+        Appends a PIN to a random shard, unless the shard is full.
+        :param pin: The PIN of a game that has ended or expired
+        """
+        condition = PinPoolShard.pins.does_not_exist() | (size(PinPoolShard.pins) < MAX_PINS_PER_SHARD)
+        try:
+            PinPoolShard(self._shard_key()).update(
+                actions=[PinPoolShard.pins.set((PinPoolShard.pins | []).append([pin]))], condition=condition)
+
+        except pynamodb.exceptions.UpdateError as e:
+            if not LambdaExceptionHandler.is_condition_failure(e):
+                raise
+
+    def _shard_key(self) -> str:
+        return f"{POOL_KEY_PREFIX}{random.randrange(self.shards)}"
+
+
+class PinAllocator:
+    """
+    Allocates game PINs by creating the game with a conditional write, so a live game is never overwritten.
+    A PIN counts as free if no game uses it, or if its game has ended or expired.
+    With a pool, each attempt first tries a PIN the pool holds, so a heavily occupied PIN space does not exhaust
+     the attempts. Otherwise, and once the pool is empty, PINs are drawn at random from the whole PIN space.
+    """
+    def __init__(self, max_attempts: int = MAX_ALLOCATION_ATTEMPTS, pool: Optional[PinPool] = None):
+        self.max_attempts = max_attempts
+        self.pool = pool
+        self.allocations = 0
+        self.collisions = 0
+        self.retries = 0
+
+    def create_game(self, game: GameSession, content: GameContent) -> str:
+        """
+        Saves the given game and its content under a free PIN, replacing the items of an ended or expired game
+         with that PIN.
+        :param game: A game session without a game ID
+        :param content: The game's content, without a key
+        :return: The PIN the game was saved under
+        :raises PinAllocationError: if every attempt collided with a live game
+        :raises PynamoDBException: if saving the game failed for any other reason
+        """
+        condition = GameSession.game_id.does_not_exist() | (GameSession.status == GAME_ENDED) | \
+            expired(GameSession.expires_at)
+
+        def save_game(transaction: TransactWrite) -> None:
+            transaction.save(game, condition=condition)
+            transaction.save(content)
+
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self.retries += 1
+
+            game.game_id = self._next_pin()
+            content.game_id = GameContent.key(game.game_id)
+            try:
+                commit_transaction(save_game)
+
+            except pynamodb.exceptions.TransactWriteError as e:
+                if not any(LambdaExceptionHandler.failed_conditions(e)):
+                    raise
+                self.collisions += 1
+                continue
+
+            # the PIN may have belonged to an ended game, which this container may have cached
+            game_cache.invalidate(game.game_id)
+            self.allocations += 1
+            return game.game_id
+
+        raise PinAllocationError(f"No free PIN found after {self.max_attempts} attempts")
+
+    def release(self, pin: str) -> None:
+        """
+        Returns the PIN of a game that has ended or expired to the pool, if a pool is in use.
+        :param pin: The PIN to recycle
+        """
+        if self.pool is not None:
+            self.pool.release(pin)
+
+    def _next_pin(self) -> str:
+        pin = self.pool.acquire() if self.pool is not None else None
+        return pin or random_pin()
+
+
+# shared by the handlers of a container, while the PINs it pools are shared by all containers
+pin_allocator = PinAllocator(pool=PinPool(PIN_POOL_SHARDS) if PIN_POOL_SHARDS else None)
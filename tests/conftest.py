@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import boto3
+import pytest
+
+REGION = "us-west-2"
+TABLE_NAME = "huji-lightricks-pitkiot"
+WORDS_TABLE_NAME = "huji-lightricks-pitkiot-words"
+CHANGES_TABLE_NAME = "huji-lightricks-pitkiot-changes"
+CONNECTIONS_TABLE_NAME = "huji-lightricks-pitkiot-connections"
+VIEWS_TABLE_NAME = "huji-lightricks-pitkiot-views"
+MEMORY = "memory"
+LIVE = "live"
+# the deployed consumers of the table's stream usually get a change within a second
+STREAM_DELAY_SECONDS = 3
+
+# the lambdas and models are imported from the repository root, and read the region when imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("AWS_DEFAULT_REGION", REGION)
+
+from lambdas import change_recorder  # noqa: E402
+from models.broadcaster import Connection  # noqa: E402
+from models.change_log import ChangeEvent  # noqa: E402
+from models.game_cache import game_cache  # noqa: E402
+from models.game_content import GameContent  # noqa: E402
+from models.game_session import GameSession  # noqa: E402
+from models.game_view import GameView  # noqa: E402
+from models.game_word import GameWord  # noqa: E402
+from models.pin_allocator import PinPoolShard  # noqa: E402
+from tools.memory_backend import use_memory_backend, use_live_backend  # noqa: E402
+from utils.push_transport import InProcessTransport, use_transport  # noqa: E402
+
+MODELS = (GameSession, GameContent, GameWord, ChangeEvent, Connection, GameView, PinPoolShard)
+
+
+def pytest_addoption(parser):
+    parser.addoption("--backend", choices=(MEMORY, LIVE), default=MEMORY,
+                     help="memory- call the handlers directly, with the tables kept in memory (default). "
+                          "live- call the deployed lambdas, which use the DynamoDB table")
+
+
+@pytest.fixture(scope='session')
+def backend(request):
+    return request.config.getoption("--backend")
+
+
+@pytest.fixture(scope='session')
+def memory_connection():
+    connection = use_memory_backend(*MODELS)
+    connection.enable_stream(TABLE_NAME)
+    yield connection
+    use_live_backend(*MODELS)
+
+
+@pytest.fixture(scope='function')
+def table(request, backend):
+    if backend == LIVE:
+        return boto3.resource('dynamodb', region_name=REGION).Table(TABLE_NAME)
+
+    connection = request.getfixturevalue("memory_connection")
+    connection.reset()
+    return connection.table(TABLE_NAME)
+
+
+@pytest.fixture(scope='function')
+def words_table(request, backend, table):
+    # the memory tables were already reset by the table fixture
+    if backend == LIVE:
+        return boto3.resource('dynamodb', region_name=REGION).Table(WORDS_TABLE_NAME)
+    return request.getfixturevalue("memory_connection").table(WORDS_TABLE_NAME)
+
+
+@pytest.fixture(scope='function')
+def changes_table(request, backend, table):
+    # the memory tables were already reset by the table fixture
+    if backend == LIVE:
+        return boto3.resource('dynamodb', region_name=REGION).Table(CHANGES_TABLE_NAME)
+    return request.getfixturevalue("memory_connection").table(CHANGES_TABLE_NAME)
+
+
+@pytest.fixture(scope='function')
+def connections_table(request, backend, table):
+    # the memory tables were already reset by the table fixture
+    if backend == LIVE:
+        return boto3.resource('dynamodb', region_name=REGION).Table(CONNECTIONS_TABLE_NAME)
+    return request.getfixturevalue("memory_connection").table(CONNECTIONS_TABLE_NAME)
+
+
+@pytest.fixture(scope='function')
+def views_table(request, backend, table):
+    # the memory tables were already reset by the table fixture
+    if backend == LIVE:
+        return boto3.resource('dynamodb', region_name=REGION).Table(VIEWS_TABLE_NAME)
+    return request.getfixturevalue("memory_connection").table(VIEWS_TABLE_NAME)
+
+
+@pytest.fixture(scope='function')
+def stream(request, backend, table):
+    # the deployed change recorder consumes the table's stream on its own, while in memory the tests deliver it
+    def deliver():
+        if backend == LIVE:
+            time.sleep(STREAM_DELAY_SECONDS)
+            return
+
+        records = request.getfixturevalue("memory_connection").read_stream(TABLE_NAME)
+        if records:
+            assert change_recorder.handler({'Records': records}, None) == {'batchItemFailures': []}
+    return deliver
+
+
+@pytest.fixture(scope='function')
+def transport(backend, connections_table):
+    # the deployed lambdas push to real connections, so the pushes can only be seen when handlers run in memory
+    if backend == LIVE:
+        pytest.skip("pushes are only kept in memory by the memory backend")
+
+    transport = InProcessTransport()
+    use_transport(transport)
+    yield transport
+    use_transport(None)
+
+
+@pytest.fixture(scope='function', autouse=True)
+def clear_game_cache():
+    # handlers called directly share the cache of this process, so games must not leak between tests
+    game_cache.clear()
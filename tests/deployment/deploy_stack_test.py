@@ -0,0 +1,209 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import deploy_stack
+from deploy_stack import CompressionPolicy, _StreamingUpload
+
+BUCKET = "test-bucket"
+KEY = "test-key.zip"
+TEMPLATE = "Resources: {}\n"
+
+
+class StubS3Client:
+    # keeps the uploaded objects in memory, assembling multipart uploads from their parts once completed
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+        self.calls = []
+
+    def put_object(self, Bucket, Key, Body):
+        self.calls.append("put_object")
+        self.objects[(Bucket, Key)] = Body
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.calls.append("create_multipart_upload")
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append("complete_multipart_upload")
+        parts = self.uploads.pop(UploadId)
+        assert [part["PartNumber"] for part in MultipartUpload["Parts"]] == sorted(parts)
+        assert [part["ETag"] for part in MultipartUpload["Parts"]] == [f"etag-{number}" for number in sorted(parts)]
+        self.objects[(Bucket, Key)] = b"".join(parts[number] for number in sorted(parts))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(UploadId)
+        self.uploads.pop(UploadId)
+
+
+class StubCloudFormationClient:
+    # a deployed stack, which only answers the calls that tell whether it is up to date
+    def __init__(self, parameters, template=TEMPLATE, status="UPDATE_COMPLETE"):
+        self.parameters = parameters
+        self.template = template
+        self.status = status
+
+    def describe_stacks(self, StackName):
+        parameters = [{"ParameterKey": key, "ParameterValue": value} for key, value in self.parameters.items()]
+        return {"Stacks": [{"StackName": StackName, "StackStatus": self.status, "Parameters": parameters}]}
+
+    def get_template(self, StackName, TemplateStage):
+        return {"TemplateBody": self.template}
+
+
+def formatted(**parameters):
+    return [{"ParameterKey": key, "ParameterValue": value} for key, value in parameters.items()]
+
+
+@pytest.fixture(scope='function')
+def package_tree(tmp_path):
+    # a package with a compressible file, a tiny one and an already compressed one, in nested directories
+    (tmp_path / "lambdas").mkdir()
+    (tmp_path / "lambdas" / "handler.py").write_text("def handler(event, context):\n    return {}\n" * 50)
+    (tmp_path / "lambdas" / "__init__.py").write_text("")
+    (tmp_path / "models").mkdir()
+    (tmp_path / "models" / "data.gz").write_bytes(os.urandom(1024))
+    return tmp_path
+
+
+def zipped(files, policy=CompressionPolicy()):
+    client = StubS3Client()
+    deploy_stack._zip_and_upload(client, BUCKET, KEY, files, policy)
+    return client.objects[(BUCKET, KEY)]
+
+
+# ----------------------------------------------------- hashing -----------------------------------------------------
+def test_hash_files_is_stable(package_tree):
+    files = deploy_stack._package_files(str(package_tree))
+    assert [name for name, _ in files] == ["lambdas/__init__.py", "lambdas/handler.py", "models/data.gz"]
+    assert deploy_stack._hash_files(files) == deploy_stack._hash_files(deploy_stack._package_files(str(package_tree)))
+    assert len(deploy_stack._hash_files(files)) == deploy_stack.HASH_LENGTH
+
+
+def test_hash_files_follows_names_and_content(package_tree):
+    files = deploy_stack._package_files(str(package_tree))
+    original = deploy_stack._hash_files(files)
+
+    (package_tree / "lambdas" / "__init__.py").write_text("# changed\n")
+    changed = deploy_stack._hash_files(files)
+    assert changed != original
+
+    (package_tree / "lambdas" / "__init__.py").rename(package_tree / "lambdas" / "renamed.py")
+    assert deploy_stack._hash_files(deploy_stack._package_files(str(package_tree))) not in (original, changed)
+
+
+# ----------------------------------------------------- zipping -----------------------------------------------------
+def test_zip_is_byte_identical(package_tree):
+    files = deploy_stack._package_files(str(package_tree))
+    first = zipped(files)
+
+    # a later build of the same files, e.g. from another checkout, has other timestamps
+    for _, full_path in files:
+        os.utime(full_path, (1_000_000_000, 1_000_000_000))
+    assert zipped(files) == first
+
+
+def test_zip_holds_the_files(package_tree):
+    files = deploy_stack._package_files(str(package_tree))
+    with zipfile.ZipFile(io.BytesIO(zipped(files))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [name for name, _ in files]
+        for name, full_path in files:
+            with open(full_path, "rb") as file:
+                assert archive.read(name) == file.read()
+        compression = {info.filename: info.compress_type for info in archive.infolist()}
+
+    # only files deflating pays off for are deflated
+    assert compression == {"lambdas/__init__.py": zipfile.ZIP_STORED, "lambdas/handler.py": zipfile.ZIP_DEFLATED,
+                           "models/data.gz": zipfile.ZIP_STORED}
+
+
+def test_failed_zip_aborts_its_upload(package_tree):
+    client = StubS3Client()
+    files = deploy_stack._package_files(str(package_tree)) + [("missing.py", str(package_tree / "missing.py"))]
+    with pytest.raises(FileNotFoundError):
+        deploy_stack._zip_and_upload(client, BUCKET, KEY, files, CompressionPolicy())
+    assert not client.objects
+
+
+# ---------------------------------------------------- uploading ----------------------------------------------------
+def test_small_upload_is_a_single_put():
+    client = StubS3Client()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        upload = _StreamingUpload(client, BUCKET, KEY, executor, part_bytes=10)
+        upload.write(b"12345")
+        upload.write(b"678")
+        upload.complete()
+    assert client.calls == ["put_object"]
+    assert client.objects[(BUCKET, KEY)] == b"12345678"
+    assert upload.size == 8
+
+
+def test_large_upload_is_sent_in_parts():
+    client = StubS3Client()
+    data = os.urandom(95)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        upload = _StreamingUpload(client, BUCKET, KEY, executor, part_bytes=10)
+        for start in range(0, len(data), 7):
+            upload.write(data[start:start + 7])
+        upload.complete()
+
+    assert client.calls == ["create_multipart_upload", "complete_multipart_upload"]
+    assert len(upload.parts) == 10
+    assert client.objects[(BUCKET, KEY)] == data
+    assert upload.size == len(data)
+
+
+def test_aborted_upload_drops_its_parts():
+    client = StubS3Client()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        upload = _StreamingUpload(client, BUCKET, KEY, executor, part_bytes=10)
+        upload.write(os.urandom(25))
+        upload.abort()
+    assert client.aborted == ["upload-0"]
+    assert not client.uploads and not client.objects
+
+
+# ---------------------------------------------------- the stack ----------------------------------------------------
+def test_unchanged_stack_is_up_to_date():
+    client = StubCloudFormationClient({"PairName": "test", "CodePackage": "abc"})
+    assert deploy_stack._is_stack_up_to_date(client, "stack", TEMPLATE, formatted(PairName="test", CodePackage="abc"))
+
+
+def test_stack_with_defaulted_parameters_is_up_to_date():
+    # the deployed stack also has the parameters the caller leaves to their defaults
+    client = StubCloudFormationClient({"PairName": "test", "CodePackage": "abc", "MaterializedViews": "false"})
+    assert deploy_stack._is_stack_up_to_date(client, "stack", TEMPLATE, formatted(PairName="test", CodePackage="abc"))
+
+
+@pytest.mark.parametrize("parameters, template, status", [
+    ({"PairName": "test", "CodePackage": "def"}, TEMPLATE, "UPDATE_COMPLETE"),
+    ({"PairName": "test"}, TEMPLATE, "UPDATE_COMPLETE"),
+    ({"PairName": "test", "CodePackage": "abc"}, "Resources: {Changed: {}}\n", "UPDATE_COMPLETE"),
+    ({"PairName": "test", "CodePackage": "abc"}, TEMPLATE, "UPDATE_IN_PROGRESS"),
+    ({"PairName": "test", "CodePackage": "abc"}, TEMPLATE, "ROLLBACK_COMPLETE"),
+])
+def test_changed_stack_is_not_up_to_date(parameters, template, status):
+    client = StubCloudFormationClient(parameters, template, status)
+    assert not deploy_stack._is_stack_up_to_date(client, "stack", TEMPLATE,
+                                                 formatted(PairName="test", CodePackage="abc"))
+
+
+def test_unchanged_stack_is_not_updated(tmp_path, capsys):
+    template_file = tmp_path / "template.yaml"
+    template_file.write_text(TEMPLATE)
+    # the stub has no change set calls, so the update would fail if it created one
+    client = StubCloudFormationClient({"PairName": "test", "MaterializedViews": "false"})
+    deploy_stack._update_stack(client, "stack", str(template_file), formatted(PairName="test"))
+    assert "Stack [stack] is up to date" in capsys.readouterr().out
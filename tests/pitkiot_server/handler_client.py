@@ -0,0 +1,70 @@
+import json
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlencode, urlparse
+
+from requests.structures import CaseInsensitiveDict
+
+# the timeout the lambdas are deployed with, see cloudformation/pitkiot.yaml
+LAMBDA_TIMEOUT_MILLIS = 25000
+
+
+class LambdaContext:
+    """
+    A stand-in for the context the Lambda runtime passes to handlers.
+    """
+    def get_remaining_time_in_millis(self) -> int:
+        return LAMBDA_TIMEOUT_MILLIS
+
+
+class HandlerResponse:
+    """
+    A handler's response, with the parts of requests' Response interface the tests use.
+    """
+    def __init__(self, status_code: int, headers: Dict[str, str], text: str):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.text = text
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+
+class HandlerClient:
+    """
+    Sends requests straight to lambda handlers, wrapped in the events Lambda Function URLs deliver,
+     so the tests can run without deploying the lambdas. Its methods mirror the requests module's.
+    """
+    def __init__(self, handlers: Dict[str, Callable[[Dict[str, Any], Any], Dict[str, Any]]]):
+        self.handlers = {url.strip(): handler for url, handler in handlers.items()}
+
+    def request(self, method: str, url: str, params: Optional[Dict[str, str]] = None,
+                headers: Optional[Dict[str, str]] = None, data: Optional[str] = None) -> HandlerResponse:
+        path = urlparse(url.strip()).path or "/"
+        event: Dict[str, Any] = {
+            'version': '2.0',
+            'routeKey': '$default',
+            'rawPath': path,
+            'rawQueryString': urlencode(params or {}),
+            'headers': {name.lower(): value for name, value in (headers or {}).items()},
+            'requestContext': {'http': {'method': method, 'path': path}},
+            'isBase64Encoded': False,
+        }
+        # like Function URLs, leave out the parts the request does not have
+        if params:
+            event['queryStringParameters'] = dict(params)
+        if data is not None:
+            event['body'] = data
+
+        result = self.handlers[url.strip()](event, LambdaContext())
+        if 'statusCode' not in result:
+            return HandlerResponse(200, {'Content-Type': 'application/json'}, json.dumps(result))
+        return HandlerResponse(result['statusCode'], result.get('headers') or {}, result.get('body') or '')
+
+    def get(self, url: str, **kwargs) -> HandlerResponse:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> HandlerResponse:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> HandlerResponse:
+        return self.request("PUT", url, **kwargs)
@@ -1,9 +1,28 @@
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 import pytest
 import requests
+from boto3.dynamodb.types import TypeSerializer
 from botocore.config import Config
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+from pynamodb.exceptions import PutError, PynamoDBConnectionError, PynamoDBException, TransactWriteError
+
+from handler_client import HandlerClient
+from lambdas import game_creator, player_adder, status_setter, status_getter, players_getter, word_adder, \
+    words_getter, word_drawer, word_returner, score_adder, scoreboard_getter, changes_getter, push_connector, \
+    view_materializer, snapshot_getter, change_recorder
+from models import game_view
+from models.broadcaster import broadcaster
+from models.game_cache import GameCache, game_cache
+from models.pin_allocator import PinPool, pin_allocator
+from tools.import_times import handler_names, loads_dynamodb_on_rejection
+from utils.lambda_exception_handler import LambdaExceptionHandler
+from utils.metrics import instrument_dynamodb
+from utils.push_transport import ApiGatewayTransport
 
 # ------------------------------------------------- Test arguments -------------------------------------------------
 REGION = "us-west-2"
@@ -15,64 +34,115 @@ STATUS_GETTER_LAMBDA = "https://q4i3ok63vpncmuvgd3xmaw4of40ijbds.lambda-url.us-w
 PLAYERS_GETTER_LAMBDA = " https://y2ptad7vg7pl2raly7ebo7asti0hjojt.lambda-url.us-west-2.on.aws/players/"
 WORD_ADDER_LAMBDA = "https://o2e6gr76txdn4f5w3dtodgvmb40ckyqb.lambda-url.us-west-2.on.aws/words/"
 WORDS_GETTER_LAMBDA = " https://bn7hrwlgyyveylitohyguntmnu0rcfya.lambda-url.us-west-2.on.aws/words/"
+WORD_DRAWER_LAMBDA = "https://ENTER_WORD_DRAWER_LAMBDA_URL/deck/draw/"
+WORD_RETURNER_LAMBDA = "https://ENTER_WORD_RETURNER_LAMBDA_URL/deck/return/"
+SCORE_ADDER_LAMBDA = "https://ENTER_SCORE_ADDER_LAMBDA_URL/score/"
+SCOREBOARD_GETTER_LAMBDA = "https://ENTER_SCOREBOARD_GETTER_LAMBDA_URL/scoreboard/"
+CHANGES_GETTER_LAMBDA = "https://ENTER_CHANGES_GETTER_LAMBDA_URL/changes/"
+SNAPSHOT_GETTER_LAMBDA = "https://ENTER_SNAPSHOT_GETTER_LAMBDA_URL/snapshot/"
 
 # ---------------------------------------------------- Fixture -----------------------------------------------------
-# Set up the boto3 client for handling the DB
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
-table = dynamodb.Table(TABLE_NAME)
-
 # Set up the boto3 client for invoking the lambda function
 config = Config(retries={'max_attempts': 0})
 lambda_client = boto3.client('lambda', region_name=REGION, config=config)
 
 
 @pytest.fixture(scope='function')
-def create_a_single_game():
+def client(backend):
+    # the live backend sends the requests to the deployed lambdas, the memory backend to their handlers
+    if backend == "live":
+        return requests
+
+    return HandlerClient({
+        GAME_CREATOR_LAMBDA: game_creator.handler,
+        PLAYER_ADDER_LAMBDA: player_adder.handler,
+        STATUS_SETTER_LAMBDA: status_setter.handler,
+        STATUS_GETTER_LAMBDA: status_getter.handler,
+        PLAYERS_GETTER_LAMBDA: players_getter.handler,
+        WORD_ADDER_LAMBDA: word_adder.handler,
+        WORDS_GETTER_LAMBDA: words_getter.handler,
+        WORD_DRAWER_LAMBDA: word_drawer.handler,
+        WORD_RETURNER_LAMBDA: word_returner.handler,
+        SCORE_ADDER_LAMBDA: score_adder.handler,
+        SCOREBOARD_GETTER_LAMBDA: scoreboard_getter.handler,
+        CHANGES_GETTER_LAMBDA: changes_getter.handler,
+        SNAPSHOT_GETTER_LAMBDA: snapshot_getter.handler,
+    })
+
+
+def put_game(table, status, players, words=None):
+    # a game is stored as a small header item and a content item holding its words
     game = {
         'game_id': 'test',
-        'status': 'adding_players',
-        'players': set(['TestAdmin'])
+        'status': status,
+        'players': players,
+        'version': 1,
+        'word_count': len(words or ())
     }
+    content = {'game_id': 'test#content'}
+    if words:
+        content['words'] = words
 
     table.put_item(Item=game)
+    table.put_item(Item=content)
 
 
 @pytest.fixture(scope='function')
-def create_a_game_with_2_players():
-    game = {
-        'game_id': 'test',
-        'status': 'adding_players',
-        'players': {'TestAdmin', 'TestUser'}
-    }
+def create_a_single_game(table):
+    put_game(table, 'adding_players', {'TestAdmin'})
 
-    table.put_item(Item=game)
+
+@pytest.fixture(scope='function')
+def create_a_game_with_2_players(table):
+    put_game(table, 'adding_players', {'TestAdmin', 'TestUser'})
 
 
 @pytest.fixture(scope='function')
-def create_a_game_with_2_players_in_adding_words_status():
-    game = {
-        'game_id': 'test',
-        'status': 'adding_words',
-        'players': {'TestAdmin', 'TestUser'}
-    }
+def create_a_game_with_2_players_in_adding_words_status(table):
+    put_game(table, 'adding_words', {'TestAdmin', 'TestUser'})
 
-    table.put_item(Item=game)
+
+@pytest.fixture(scope='function')
+def create_a_game_with_2_players_and_5_words(table):
+    put_game(table, 'in_game', {'TestAdmin', 'TestUser'}, {"one", "two", "three", "four", "five"})
 
 
 @pytest.fixture(scope='function')
-def create_a_game_with_2_players_and_5_words():
-    game = {
-        'game_id': 'test',
-        'status': 'in_game',
-        'players': {'TestAdmin', 'TestUser'},
-        'words': {"one", "two", "three", "four", "five"}
-    }
+def create_a_game_with_2_players_and_5_words_in_adding_words_status(table):
+    put_game(table, 'adding_words', {'TestAdmin', 'TestUser'}, {"one", "two", "three", "four", "five"})
 
-    table.put_item(Item=game)
+
+@pytest.fixture(scope='function')
+def create_a_started_game(client, create_a_game_with_2_players_and_5_words_in_adding_words_status):
+    # starting the game shuffles its words into its deck
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'in_game'}))
+    assert response.status_code == 200
 
 
 @pytest.fixture(scope='function')
-def clear_dynamodb_table(request):
+def create_a_game_with_word_items(table, words_table):
+    # a game keeping its words as separate items, under a partition of its own
+    put_game(table, 'adding_words', {'TestAdmin', 'TestUser'}, {"one", "two", "three", "four", "five"})
+    table.update_item(
+        Key={'game_id': 'test'},
+        UpdateExpression='SET words_partition = :val REMOVE word_count',
+        ExpressionAttributeValues={':val': 'test-partition'}
+    )
+    table.update_item(
+        Key={'game_id': 'test#content'},
+        UpdateExpression='REMOVE words'
+    )
+    yield
+    for item in words_table.query(KeyConditionExpression='#p = :p', ExpressionAttributeNames={'#p': 'partition'},
+                                  ExpressionAttributeValues={':p': 'test-partition'})['Items']:
+        words_table.delete_item(Key={'partition': item['partition'], 'word': item['word']})
+
+
+@pytest.fixture(scope='function')
+def clear_dynamodb_table(request, table):
     # Before the test, save all the existing items in the table
     existing_items = table.scan()['Items']
 
@@ -87,7 +157,7 @@ def clear_dynamodb_table(request):
     request.addfinalizer(delete_inserted_items)
 
 
-def change_game_status_to_game_ended():
+def change_game_status_to_game_ended(table):
     table.update_item(
         Key={'game_id': 'test'},
         UpdateExpression='SET #s = :val',
@@ -96,94 +166,188 @@ def change_game_status_to_game_ended():
     )
 
 
+def change_game_expiry_to_the_past(table):
+    # DynamoDB deletes expired items lazily, so an expired game may still be in the table
+    table.update_item(
+        Key={'game_id': 'test'},
+        UpdateExpression='SET expires_at = :val',
+        ExpressionAttributeValues={':val': int(time.time()) - 60}
+    )
+
+
 # ----------------------------------------------------- Tests ------------------------------------------------------
 
 
 # --------------------------------------------------- game creator -------------------------------------------------
 @pytest.mark.usefixtures("clear_dynamodb_table")
-def test_valid_game_creation():
-    response = requests.post(GAME_CREATOR_LAMBDA,
-                             headers={'Content-Type': 'application/json'},
-                             data=json.dumps({'nickName': 'TestUser'}))
+def test_valid_game_creation(client, table):
+    response = client.post(GAME_CREATOR_LAMBDA,
+                           headers={'Content-Type': 'application/json'},
+                           data=json.dumps({'nickName': 'TestUser'}))
     assert response.status_code == 201
     response_data = response.json()
     assert len(response_data["gameId"]) == 4
+    item = table.get_item(Key={'game_id': response_data["gameId"]})['Item']
+    assert item['expires_at'] > time.time()
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table")
-def test_game_creation_with_wrong_method():
-    response = requests.put(GAME_CREATOR_LAMBDA,
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'nickName': 'TestUser'}))
+def test_game_creation_with_wrong_method(client):
+    response = client.put(GAME_CREATOR_LAMBDA,
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'nickName': 'TestUser'}))
     assert response.status_code == 405
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table")
-def test_create_game_without_admin_nickname():
-    response = requests.post(GAME_CREATOR_LAMBDA,
-                             headers={'Content-Type': 'application/json'},
-                             data=json.dumps({}))
+def test_create_game_without_admin_nickname(client):
+    response = client.post(GAME_CREATOR_LAMBDA,
+                           headers={'Content-Type': 'application/json'},
+                           data=json.dumps({}))
     assert response.status_code == 400
 
 
 # --------------------------------------------------- player-adder -------------------------------------------------
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_player_addition():
-    response = requests.put(PLAYER_ADDER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'nickName': 'TestUser'}))
+def test_player_addition(client, table):
+    response = client.put(PLAYER_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'nickName': 'TestUser'}))
     assert response.status_code == 200
     item = table.get_item(Key={'game_id': 'test'})['Item']
     assert 'TestUser' in item['players']
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_player_addition_with_wrong_method():
-    response = requests.post(PLAYER_ADDER_LAMBDA,
-                             params={'gameId': 'test'},
-                             headers={'Content-Type': 'application/json'},
-                             data=json.dumps({'nickName': 'TestUser'}))
+def test_player_addition_to_expired_game(client, table):
+    change_game_expiry_to_the_past(table)
+    response = client.put(PLAYER_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'nickName': 'TestUser'}))
+    assert response.status_code == 404
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_player_addition_with_wrong_method(client):
+    response = client.post(PLAYER_ADDER_LAMBDA,
+                           params={'gameId': 'test'},
+                           headers={'Content-Type': 'application/json'},
+                           data=json.dumps({'nickName': 'TestUser'}))
     assert response.status_code == 405
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_player_addition_without_game_id():
-    response = requests.put(PLAYER_ADDER_LAMBDA,
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'nickName': 'TestUser'}))
+def test_player_addition_without_game_id(client):
+    response = client.put(PLAYER_ADDER_LAMBDA,
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'nickName': 'TestUser'}))
+    assert response.status_code == 400
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_player_addition_without_nickname(client):
+    response = client.put(PLAYER_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({}))
     assert response.status_code == 400
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_player_addition_without_nickname():
-    response = requests.put(PLAYER_ADDER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({}))
+def test_player_addition_without_body(client):
+    response = client.put(PLAYER_ADDER_LAMBDA,
+                          params={'gameId': 'test'})
     assert response.status_code == 400
+    assert response.json() == {'error': 'Nickname must be provided to add a player'}
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_player_addition_with_invalid_game_id():
-    response = requests.put(PLAYER_ADDER_LAMBDA,
-                            params={'gameId': 'tst1'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'nickName': 'TestUser'}))
+def test_player_addition_with_malformed_body(client):
+    response = client.put(PLAYER_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data='{"nickName": ')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("nickname", [5, ['TestUser'], {'name': 'TestUser'}])
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_player_addition_with_non_string_nickname(client, table, nickname):
+    response = client.put(PLAYER_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'nickName': nickname}))
+    assert response.status_code == 400
+    assert response.json() == {'error': 'nickName must be a string'}
+    assert table.get_item(Key={'game_id': 'test'})['Item']['players'] == {'TestAdmin'}
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
+def test_failed_writes_are_mapped_by_the_pipeline(client, backend, monkeypatch):
+    if backend == "live":
+        pytest.skip("DynamoDB can only be made to fail in memory")
+
+    def failing_write(*_, **__):
+        raise TransactWriteError("Failed to write")
+
+    # a write that failed for any reason but its condition gets the same status from every handler
+    monkeypatch.setattr("models.game_session.commit_transaction", failing_write)
+    monkeypatch.setattr("models.game_session.GameSession.update", failing_write)
+    for url, body in ((PLAYER_ADDER_LAMBDA, {'nickName': 'TestUser3'}), (WORD_ADDER_LAMBDA, {'word': 'one'}),
+                      (STATUS_SETTER_LAMBDA, {'status': 'game_ended'})):
+        response = client.put(url,
+                              params={'gameId': 'test'},
+                              headers={'Content-Type': 'application/json'},
+                              data=json.dumps(body))
+        assert response.status_code == 503
+        assert response.json() == {'error': 'Failed to connect. Please try again'}
+
+
+def cancelled_transaction(message, reasons=None):
+    response = {'Error': {'Code': 'TransactionCanceledException', 'Message': message}}
+    if reasons is not None:
+        response['CancellationReasons'] = [{'Code': reason} for reason in reasons]
+    return TransactWriteError("Failed to write transaction items", ClientError(response, 'TransactWriteItems'))
+
+
+def test_cancellation_reasons_are_read_from_the_response():
+    error = cancelled_transaction("Transaction cancelled", ['None', 'ConditionalCheckFailed', 'TransactionConflict'])
+    assert LambdaExceptionHandler.cancellation_reasons(error) == ['None', 'ConditionalCheckFailed',
+                                                                  'TransactionConflict']
+    assert LambdaExceptionHandler.failed_conditions(error) == [False, True, False]
+
+
+def test_cancellation_reasons_without_a_structured_response():
+    # PynamoDB 5.3 keeps only the error's message
+    error = cancelled_transaction("Transaction cancelled, please refer cancellation reasons for specific reasons "
+                                  "[ConditionalCheckFailed, None]")
+    assert LambdaExceptionHandler.failed_conditions(error) == [True, False]
+    assert LambdaExceptionHandler.cancellation_reasons(cancelled_transaction("Transaction cancelled")) == []
+    assert LambdaExceptionHandler.cancellation_reasons(TransactWriteError("Failed to write")) == []
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_player_addition_with_invalid_game_id(client):
+    response = client.put(PLAYER_ADDER_LAMBDA,
+                          params={'gameId': 'tst1'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'nickName': 'TestUser'}))
     assert response.status_code == 404
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_player_addition_with_existing_nickname():
-    response = requests.put(PLAYER_ADDER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'nickName': 'TestAdmin'}))
+def test_player_addition_with_existing_nickname(client):
+    response = client.put(PLAYER_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'nickName': 'TestAdmin'}))
     assert response.status_code == 409
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_player_addition_while_in_invalid_game_status():
+def test_player_addition_while_in_invalid_game_status(client, table):
     table.update_item(
         Key={'game_id': 'test'},
         UpdateExpression='SET #s = :val',
@@ -191,207 +355,349 @@ def test_player_addition_while_in_invalid_game_status():
         ExpressionAttributeValues={':val': 'in_game'}
     )
 
-    response = requests.put(PLAYER_ADDER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'nickName': 'TestUser'}))
+    response = client.put(PLAYER_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'nickName': 'TestUser'}))
     assert response.status_code == 409
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_player_addition_while_in_game_ended_status():
-    change_game_status_to_game_ended()
+def test_player_addition_while_in_game_ended_status(client, table):
+    change_game_status_to_game_ended(table)
 
-    response = requests.put(PLAYER_ADDER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'nickName': 'TestUser'}))
+    response = client.put(PLAYER_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'nickName': 'TestUser'}))
     assert response.status_code == 409
 
 
 # --------------------------------------------------- status-setter -------------------------------------------------
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
-def test_valid_status_set():
-    response = requests.put(STATUS_SETTER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'status': 'adding_words'}))
+def test_valid_status_set(client, table):
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'adding_words'}))
     assert response.status_code == 200
     item = table.get_item(Key={'game_id': 'test'})['Item']
     assert item['status'] == "adding_words"
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
-def test_status_set_with_wrong_method():
-    response = requests.post(STATUS_SETTER_LAMBDA,
-                             params={'gameId': 'test'},
-                             headers={'Content-Type': 'application/json'},
-                             data=json.dumps({'status': 'adding_words'}))
+def test_status_set_with_wrong_method(client):
+    response = client.post(STATUS_SETTER_LAMBDA,
+                           params={'gameId': 'test'},
+                           headers={'Content-Type': 'application/json'},
+                           data=json.dumps({'status': 'adding_words'}))
     assert response.status_code == 405
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
-def test_status_set_without_game_id():
-    response = requests.put(STATUS_SETTER_LAMBDA,
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'status': 'adding_words'}))
+def test_status_set_without_game_id(client):
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'adding_words'}))
     assert response.status_code == 400
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
-def test_status_set_with_invalid_game_id():
-    response = requests.put(STATUS_SETTER_LAMBDA,
-                            params={'gameId': 'tst1'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'status': 'adding_words'}))
+def test_status_set_with_invalid_game_id(client):
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'tst1'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'adding_words'}))
     assert response.status_code == 404
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
-def test_status_set_without_status():
-    response = requests.put(STATUS_SETTER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({}))
+def test_status_set_without_status(client):
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({}))
     assert response.status_code == 400
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_status_set_with_less_than_2_players():
-    response = requests.put(STATUS_SETTER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'status': 'adding_words'}))
+def test_status_set_with_less_than_2_players(client):
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'adding_words'}))
+    assert response.status_code == 400
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
+def test_status_set_to_in_game_with_less_than_5_words(client):
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'in_game'}))
     assert response.status_code == 400
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
-def test_status_set_to_in_game_with_less_than_5_words():
-    response = requests.put(STATUS_SETTER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'status': 'in_game'}))
+def test_status_set_with_game_ended_status(client, table):
+    change_game_status_to_game_ended(table)
+
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'adding_words'}))
+    assert response.status_code == 409
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
+def test_status_set_with_invalid_status(client):
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'not_a_status'}))
     assert response.status_code == 400
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
-def test_status_set_with_game_ended_status():
-    change_game_status_to_game_ended()
+def test_status_set_with_non_string_status(client):
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': {'status': 'adding_words'}}))
+    assert response.status_code == 400
+    assert response.json() == {'error': 'status must be a string'}
+
 
-    response = requests.put(STATUS_SETTER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'status': 'adding_words'}))
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
+def test_status_set_backwards(client, table):
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'adding_players'}))
+    assert response.status_code == 400
+    item = table.get_item(Key={'game_id': 'test'})['Item']
+    assert item['status'] == "adding_words"
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_and_5_words")
+def test_status_set_to_same_status(client):
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'in_game'}))
     assert response.status_code == 409
 
 
 # --------------------------------------------------- status-getter -------------------------------------------------
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_valid_get_status():
-    response = requests.get(STATUS_GETTER_LAMBDA,
-                            params={'gameId': 'test'})
+def test_valid_get_status(client):
+    response = client.get(STATUS_GETTER_LAMBDA,
+                          params={'gameId': 'test'})
     assert response.status_code == 200
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_get_status_with_wrong_method():
-    response = requests.post(STATUS_GETTER_LAMBDA,
-                             params={'gameId': 'test'})
+def test_get_status_with_wrong_method(client):
+    response = client.post(STATUS_GETTER_LAMBDA,
+                           params={'gameId': 'test'})
     assert response.status_code == 405
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_get_status_without_game_id():
-    response = requests.get(STATUS_GETTER_LAMBDA)
+def test_get_status_without_game_id(client):
+    response = client.get(STATUS_GETTER_LAMBDA)
     assert response.status_code == 400
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_get_status_with_invalid_game_id():
-    response = requests.get(STATUS_GETTER_LAMBDA,
-                            params={'gameId': 'tst1'})
+def test_get_status_with_invalid_game_id(client):
+    response = client.get(STATUS_GETTER_LAMBDA,
+                          params={'gameId': 'tst1'})
     assert response.status_code == 404
 
 
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_get_status_of_expired_game(client, table):
+    change_game_expiry_to_the_past(table)
+    response = client.get(STATUS_GETTER_LAMBDA,
+                          params={'gameId': 'test'})
+    assert response.status_code == 404
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_cached_ended_game_is_dropped_after_the_ttl(table):
+    now = [0.0]
+    cache = GameCache(ttl_seconds=1, clock=lambda: now[0])
+    change_game_status_to_game_ended(table)
+    assert cache.get_game('test').status == 'game_ended'
+
+    # another container gives the ended game's PIN to a new game, and only invalidates its own cache
+    put_game(table, 'adding_players', {'NewAdmin'})
+    assert cache.get_game('test').status == 'game_ended'
+    now[0] = 1.5
+    assert cache.get_game('test').status == 'adding_players'
+
+
 # --------------------------------------------------- players-getter -------------------------------------------------
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
-def test_valid_get_players():
-    response = requests.get(PLAYERS_GETTER_LAMBDA,
-                            params={'gameId': 'test'})
+def test_valid_get_players(client):
+    response = client.get(PLAYERS_GETTER_LAMBDA,
+                          params={'gameId': 'test'})
     assert response.status_code == 200
     expected_players = ['TestAdmin', 'TestUser']
     assert set(expected_players) == set(response.json()['players'])
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_get_players_with_wrong_method():
-    response = requests.put(PLAYERS_GETTER_LAMBDA,
-                            params={'gameId': 'test'})
+def test_get_players_with_wrong_method(client):
+    response = client.put(PLAYERS_GETTER_LAMBDA,
+                          params={'gameId': 'test'})
     assert response.status_code == 405
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_get_players_without_game_id():
-    response = requests.get(PLAYERS_GETTER_LAMBDA)
+def test_get_players_without_game_id(client):
+    response = client.get(PLAYERS_GETTER_LAMBDA)
     assert response.status_code == 400
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
-def test_get_players_with_invalid_game_id():
-    response = requests.get(PLAYERS_GETTER_LAMBDA,
-                            params={'gameId': 'tst1'})
+def test_get_players_with_invalid_game_id(client):
+    response = client.get(PLAYERS_GETTER_LAMBDA,
+                          params={'gameId': 'tst1'})
     assert response.status_code == 404
 
 
+# -------------------------------------------------- snapshot-getter ------------------------------------------------
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
+def test_snapshot_not_modified(client):
+    response = client.get(SNAPSHOT_GETTER_LAMBDA,
+                          params={'gameId': 'test'})
+    assert response.status_code == 200
+    response = client.get(SNAPSHOT_GETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
+def test_snapshot_of_a_game_that_reused_the_pin(client, table):
+    table.update_item(Key={'game_id': 'test'}, UpdateExpression='SET created_at = :val',
+                      ExpressionAttributeValues={':val': 1000})
+    etag = client.get(SNAPSHOT_GETTER_LAMBDA, params={'gameId': 'test'}).headers['ETag']
+
+    # a new game with the same PIN and version is a different game
+    table.put_item(Item={'game_id': 'test', 'status': 'adding_players', 'players': {'NewAdmin'}, 'version': 1,
+                         'word_count': 0, 'created_at': 2000})
+    game_cache.clear()
+    response = client.get(SNAPSHOT_GETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json()['players'] == ['NewAdmin']
+
+
 # --------------------------------------------------- word-adder -------------------------------------------------
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
-def test_valid_word_addition():
-    response = requests.put(WORD_ADDER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'word': 'addedWord'}))
+def test_valid_word_addition(client, table):
+    response = client.put(WORD_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'word': 'addedWord'}))
     assert response.status_code == 200
-    item = table.get_item(Key={'game_id': 'test'})['Item']
+    item = table.get_item(Key={'game_id': 'test#content'})['Item']
     assert "addedWord" in item['words']
+    game = table.get_item(Key={'game_id': 'test'})['Item']
+    assert game['word_count'] == 1
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
+def test_existing_word_addition(client, table):
+    for _ in range(2):
+        response = client.put(WORD_ADDER_LAMBDA,
+                              params={'gameId': 'test'},
+                              headers={'Content-Type': 'application/json'},
+                              data=json.dumps({'word': 'addedWord'}))
+        assert response.status_code == 200
+    game = table.get_item(Key={'game_id': 'test'})['Item']
+    assert game['word_count'] == 1
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
+def test_batch_word_addition(client, table):
+    response = client.put(WORD_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'words': ['one', 'two', 'one']}))
+    assert response.status_code == 200
+    assert response.json() == {'added': ['one', 'two'], 'duplicates': []}
+
+    response = client.put(WORD_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'words': ['two', 'three']}))
+    assert response.status_code == 200
+    assert response.json() == {'added': ['three'], 'duplicates': ['two']}
+    game = table.get_item(Key={'game_id': 'test'})['Item']
+    assert game['word_count'] == 3
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
+def test_batch_word_addition_with_invalid_words(client):
+    response = client.put(WORD_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'words': ['one', 2]}))
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("body", [{'words': {'word': 'one'}}, {'words': 'one'}, {'word': ['one']}])
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
+def test_word_addition_with_wrongly_typed_words(client, body):
+    response = client.put(WORD_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps(body))
+    assert response.status_code == 400
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
-def test_word_addition_with_wrong_method():
-    response = requests.post(WORD_ADDER_LAMBDA,
-                             params={'gameId': 'test'},
-                             headers={'Content-Type': 'application/json'},
-                             data=json.dumps({'word': 'addedWord'}))
+def test_word_addition_with_wrong_method(client):
+    response = client.post(WORD_ADDER_LAMBDA,
+                           params={'gameId': 'test'},
+                           headers={'Content-Type': 'application/json'},
+                           data=json.dumps({'word': 'addedWord'}))
     assert response.status_code == 405
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
-def test_word_addition_without_game_id():
-    response = requests.put(WORD_ADDER_LAMBDA,
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'word': 'addedWord'}))
+def test_word_addition_without_game_id(client):
+    response = client.put(WORD_ADDER_LAMBDA,
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'word': 'addedWord'}))
     assert response.status_code == 400
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
-def test_word_addition_with_invalid_game_id():
-    response = requests.put(WORD_ADDER_LAMBDA,
-                            params={'gameId': 'tst1'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'word': 'addedWord'}))
+def test_word_addition_with_invalid_game_id(client):
+    response = client.put(WORD_ADDER_LAMBDA,
+                          params={'gameId': 'tst1'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'word': 'addedWord'}))
     assert response.status_code == 404
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
-def test_word_addition_without_word():
-    response = requests.put(WORD_ADDER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({}))
+def test_word_addition_without_word(client):
+    response = client.put(WORD_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({}))
     assert response.status_code == 400
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
-def test_word_addition_while_in_invalid_status():
+def test_word_addition_while_in_invalid_status(client, table):
     table.update_item(
         Key={'game_id': 'test'},
         UpdateExpression='SET #s = :val',
@@ -399,48 +705,902 @@ def test_word_addition_while_in_invalid_status():
         ExpressionAttributeValues={':val': 'adding_players'}
     )
 
-    response = requests.put(WORD_ADDER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'word': 'addedWord'}))
+    response = client.put(WORD_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'word': 'addedWord'}))
     assert response.status_code == 409
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
-def test_word_addition_with_game_ended_status():
-    change_game_status_to_game_ended()
-    response = requests.put(WORD_ADDER_LAMBDA,
-                            params={'gameId': 'test'},
-                            headers={'Content-Type': 'application/json'},
-                            data=json.dumps({'word': 'addedWord'}))
+def test_word_addition_with_game_ended_status(client, table):
+    change_game_status_to_game_ended(table)
+    response = client.put(WORD_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'word': 'addedWord'}))
     assert response.status_code == 409
 
 
 # --------------------------------------------------- words-getter -------------------------------------------------
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_and_5_words")
-def test_valid_get_words():
-    response = requests.get(WORDS_GETTER_LAMBDA,
-                            params={'gameId': 'test'})
+def test_valid_get_words(client):
+    response = client.get(WORDS_GETTER_LAMBDA,
+                          params={'gameId': 'test'})
     assert response.status_code == 200
     expected_words = {"one", "two", "three", "four", "five"}
     assert expected_words == set(response.json()['words'])
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_and_5_words")
-def test_get_words_with_wrong_method():
-    response = requests.put(WORDS_GETTER_LAMBDA,
-                            params={'gameId': 'test'})
+def test_get_words_with_wrong_method(client):
+    response = client.put(WORDS_GETTER_LAMBDA,
+                          params={'gameId': 'test'})
     assert response.status_code == 405
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_and_5_words")
-def test_get_words_without_game_id():
-    response = requests.get(WORDS_GETTER_LAMBDA)
+def test_get_words_without_game_id(client):
+    response = client.get(WORDS_GETTER_LAMBDA)
     assert response.status_code == 400
 
 
 @pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_and_5_words")
-def test_get_words_with_invalid_game_id():
-    response = requests.get(WORDS_GETTER_LAMBDA,
-                            params={'gameId': 'tst1'})
+def test_get_words_with_invalid_game_id(client):
+    response = client.get(WORDS_GETTER_LAMBDA,
+                          params={'gameId': 'tst1'})
     assert response.status_code == 404
+
+
+# ---------------------------------------------------- pagination --------------------------------------------------
+def get_all_pages(client, url, key, limit):
+    pages, cursor = [], None
+    while True:
+        params = {'gameId': 'test', 'limit': str(limit)}
+        if cursor:
+            params['cursor'] = cursor
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        pages.append(response.json()[key])
+        cursor = response.json()['nextCursor']
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_and_5_words")
+def test_get_words_in_pages(client):
+    pages = get_all_pages(client, WORDS_GETTER_LAMBDA, 'words', 2)
+    assert pages == [["five", "four"], ["one", "three"], ["two"]]
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_and_5_words")
+def test_get_players_in_pages(client):
+    pages = get_all_pages(client, PLAYERS_GETTER_LAMBDA, 'players', 1)
+    assert pages == [["TestAdmin"], ["TestUser"]]
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_word_items")
+def test_get_word_items_in_pages(client):
+    client.put(WORD_ADDER_LAMBDA,
+               params={'gameId': 'test'},
+               headers={'Content-Type': 'application/json'},
+               data=json.dumps({'words': ["one", "two", "three", "four", "five"]}))
+    pages = get_all_pages(client, WORDS_GETTER_LAMBDA, 'words', 2)
+    assert pages == [["five", "four"], ["one", "three"], ["two"]]
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_and_5_words")
+def test_get_words_with_invalid_page(client):
+    response = client.get(WORDS_GETTER_LAMBDA,
+                          params={'gameId': 'test', 'limit': '0'})
+    assert response.status_code == 400
+    response = client.get(WORDS_GETTER_LAMBDA,
+                          params={'gameId': 'test', 'cursor': 'not-a-cursor'})
+    assert response.status_code == 400
+
+
+# ---------------------------------------------------- word items --------------------------------------------------
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_word_items")
+def test_word_addition_as_items(client, table, words_table):
+    response = client.put(WORD_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'words': ['one', 'two']}))
+    assert response.status_code == 200
+    assert response.json() == {'added': ['one', 'two'], 'duplicates': []}
+    assert words_table.get_item(Key={'partition': 'test-partition', 'word': 'one'})['Item']
+    assert 'words' not in table.get_item(Key={'game_id': 'test#content'})['Item']
+    assert table.get_item(Key={'game_id': 'test'})['Item']['word_count'] == 2
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_word_items")
+def test_existing_word_addition_as_items(client, table):
+    client.put(WORD_ADDER_LAMBDA,
+               params={'gameId': 'test'},
+               headers={'Content-Type': 'application/json'},
+               data=json.dumps({'words': ['one', 'two']}))
+    response = client.put(WORD_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'words': ['two', 'three']}))
+    assert response.status_code == 200
+    assert response.json() == {'added': ['three'], 'duplicates': ['two']}
+    assert table.get_item(Key={'game_id': 'test'})['Item']['word_count'] == 3
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_word_items")
+def test_get_words_as_items(client):
+    words = ["one", "two", "three", "four", "five"]
+    client.put(WORD_ADDER_LAMBDA,
+               params={'gameId': 'test'},
+               headers={'Content-Type': 'application/json'},
+               data=json.dumps({'words': words}))
+    response = client.get(WORDS_GETTER_LAMBDA,
+                          params={'gameId': 'test'})
+    assert response.status_code == 200
+    assert set(response.json()['words']) == set(words)
+
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'in_game'}))
+    assert response.status_code == 200
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table")
+def test_game_creation_with_word_items(client, table, monkeypatch):
+    monkeypatch.setattr("models.game_word.WORD_STORAGE", "items")
+    response = client.post(GAME_CREATOR_LAMBDA,
+                           headers={'Content-Type': 'application/json'},
+                           data=json.dumps({'nickName': 'TestUser'}))
+    assert response.status_code == 201
+    item = table.get_item(Key={'game_id': response.json()["gameId"]})['Item']
+    assert item['words_partition']
+
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table")
+def test_word_items_follow_the_game_expiry(client, backend, table, words_table, stream, monkeypatch):
+    if backend == "live":
+        pytest.skip("the deployed lambdas are configured by the template")
+
+    monkeypatch.setattr("models.game_word.WORD_STORAGE", "items")
+    game_id = create_game_with_changes(client, stream)
+    header = table.get_item(Key={'game_id': game_id})['Item']
+
+    def word_expiries():
+        return [item['expires_at'] for item in words_table.query(
+            KeyConditionExpression='#p = :p', ExpressionAttributeNames={'#p': 'partition'},
+            ExpressionAttributeValues={':p': header['words_partition']})['Items']]
+
+    assert len(word_expiries()) == 2
+    assert all(abs(expires_at - header['expires_at']) <= 1 for expires_at in word_expiries())
+
+    # an ended game is kept for a shorter time, and so are its words
+    client.put(STATUS_SETTER_LAMBDA,
+               params={'gameId': game_id},
+               headers={'Content-Type': 'application/json'},
+               data=json.dumps({'status': 'game_ended'}))
+    stream()
+    ended_at = table.get_item(Key={'game_id': game_id})['Item']['expires_at']
+    assert ended_at < header['expires_at']
+    assert word_expiries() == [ended_at, ended_at]
+
+
+def create_game(client):
+    return client.post(GAME_CREATOR_LAMBDA,
+                       headers={'Content-Type': 'application/json'},
+                       data=json.dumps({'nickName': 'TestAdmin'})).json()['gameId']
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table")
+def test_ended_game_pin_is_pooled(client, backend, table, stream, monkeypatch):
+    if backend == "live":
+        pytest.skip("the deployed lambdas are configured by the template")
+
+    monkeypatch.setattr(pin_allocator, "pool", PinPool(1))
+    game_id = create_game(client)
+    client.put(STATUS_SETTER_LAMBDA,
+               params={'gameId': game_id},
+               headers={'Content-Type': 'application/json'},
+               data=json.dumps({'status': 'game_ended'}))
+    stream()
+    assert table.get_item(Key={'game_id': 'pins#0'})['Item']['pins'] == [game_id]
+
+    # the next game is given the ended game's PIN, and the pool is empty again
+    assert create_game(client) == game_id
+    assert table.get_item(Key={'game_id': 'pins#0'})['Item']['pins'] == []
+    assert create_game(client) != game_id
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table")
+def test_expired_game_pin_is_pooled(table, monkeypatch):
+    monkeypatch.setattr(pin_allocator, "pool", PinPool(1))
+    response = change_recorder.handler({'Records': [stream_record('100', {'game_id': 'abcd'}, event_name='REMOVE')]},
+                                       None)
+    assert response == {'batchItemFailures': []}
+    assert pin_allocator.pool.acquire() == 'abcd'
+    assert pin_allocator.pool.acquire() is None
+
+
+# ---------------------------------------------------- word deck ---------------------------------------------------
+def draw_word(client, nickname):
+    return client.put(WORD_DRAWER_LAMBDA,
+                      params={'gameId': 'test'},
+                      headers={'Content-Type': 'application/json'},
+                      data=json.dumps({'nickName': nickname}))
+
+
+def active_player(table):
+    return table.get_item(Key={'game_id': 'test#content'})['Item']['active_player']
+
+
+def return_word(client, nickname, word):
+    return client.put(WORD_RETURNER_LAMBDA,
+                      params={'gameId': 'test'},
+                      headers={'Content-Type': 'application/json'},
+                      data=json.dumps({'nickName': nickname, 'word': word}))
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_game_start_freezes_the_deck(table):
+    content = table.get_item(Key={'game_id': 'test#content'})['Item']
+    assert sorted(content['deck']) == sorted(content['words'])
+    assert content['deck_size'] == 5
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_valid_word_draw(client, table):
+    response = draw_word(client, active_player(table))
+    assert response.status_code == 200
+    assert response.json()['word'] in {"one", "two", "three", "four", "five"}
+    assert response.json()['remaining'] == 4
+    content = table.get_item(Key={'game_id': 'test#content'})['Item']
+    assert response.json()['word'] not in content['deck']
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_word_draw_extends_the_game(client, table):
+    table.update_item(Key={'game_id': 'test'}, UpdateExpression='SET expires_at = :val',
+                      ExpressionAttributeValues={':val': int(time.time()) + 60})
+    assert draw_word(client, active_player(table)).status_code == 200
+    assert table.get_item(Key={'game_id': 'test'})['Item']['expires_at'] > time.time() + 60 * 60
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_word_draw_from_an_expired_game(client, table):
+    nickname = active_player(table)
+    table.update_item(Key={'game_id': 'test'}, UpdateExpression='SET expires_at = :val',
+                      ExpressionAttributeValues={':val': int(time.time()) - 60})
+    assert draw_word(client, nickname).status_code == 404
+    assert table.get_item(Key={'game_id': 'test#content'})['Item']['deck_size'] == 5
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_word_draws_never_repeat_a_word(client, table):
+    nickname = active_player(table)
+    words = [draw_word(client, nickname).json()['word'] for _ in range(5)]
+    assert set(words) == {"one", "two", "three", "four", "five"}
+    assert draw_word(client, nickname).status_code == 409
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_word_draw_out_of_turn(client, table):
+    nickname = ({'TestAdmin', 'TestUser'} - {active_player(table)}).pop()
+    assert draw_word(client, nickname).status_code == 409
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_and_5_words_in_adding_words_status")
+def test_word_draw_before_game_started(client):
+    assert draw_word(client, 'TestUser').status_code == 409
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_word_draw_with_invalid_game_id(client):
+    response = client.put(WORD_DRAWER_LAMBDA,
+                          params={'gameId': 'tst1'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'nickName': 'TestUser'}))
+    assert response.status_code == 404
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_word_draw_without_nickname(client):
+    response = client.put(WORD_DRAWER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({}))
+    assert response.status_code == 400
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_valid_word_return(client, table):
+    nickname = active_player(table)
+    word = draw_word(client, nickname).json()['word']
+    response = return_word(client, nickname, word)
+    assert response.status_code == 200
+    assert response.json()['remaining'] == 5
+    content = table.get_item(Key={'game_id': 'test#content'})['Item']
+    assert content['deck'][-1] == word
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_word_return_by_another_player(client, table):
+    nickname = active_player(table)
+    word = draw_word(client, nickname).json()['word']
+    assert return_word(client, ({'TestAdmin', 'TestUser'} - {nickname}).pop(), word).status_code == 409
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_word_return_twice(client, table):
+    nickname = active_player(table)
+    word = draw_word(client, nickname).json()['word']
+    assert return_word(client, nickname, word).status_code == 200
+    assert return_word(client, nickname, word).status_code == 409
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_game_end_drops_the_deck(client, table):
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'game_ended'}))
+    assert response.status_code == 200
+    assert 'deck' not in table.get_item(Key={'game_id': 'test#content'})['Item']
+    assert draw_word(client, 'TestUser').status_code == 409
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_game_end_drops_the_deck_with_the_status(client, backend, table, capsys):
+    if backend == "live":
+        pytest.skip("the deployed lambdas print their metrics to CloudWatch")
+
+    capsys.readouterr()
+    client.put(STATUS_SETTER_LAMBDA,
+               params={'gameId': 'test'},
+               headers={'Content-Type': 'application/json'},
+               data=json.dumps({'status': 'game_ended'}))
+    # the header and the content are written by a single transaction
+    assert json.loads(capsys.readouterr().out.splitlines()[-1])['DynamoDBOperations'] == {'TransactWriteItems': 1}
+    assert table.get_item(Key={'game_id': 'test'})['Item']['status'] == 'game_ended'
+    assert 'deck' not in table.get_item(Key={'game_id': 'test#content'})['Item']
+
+
+# ------------------------------------------------- teams and scores ------------------------------------------------
+def add_score(client, nickname, **body):
+    return client.put(SCORE_ADDER_LAMBDA,
+                      params={'gameId': 'test'},
+                      headers={'Content-Type': 'application/json'},
+                      data=json.dumps({'nickName': nickname, **body}))
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_game_start_assigns_teams(client, table):
+    response = client.get(SCOREBOARD_GETTER_LAMBDA,
+                          params={'gameId': 'test'})
+    assert response.status_code == 200
+    scoreboard = response.json()
+    assert sorted(len(team['players']) for team in scoreboard['teams']) == [1, 1]
+    assert {player for team in scoreboard['teams'] for player in team['players']} == {'TestAdmin', 'TestUser'}
+    assert [team['score'] for team in scoreboard['teams']] == [0, 0]
+    assert scoreboard['turn'] == 0
+    assert scoreboard['activeTeam'] == 0
+    assert scoreboard['activePlayer'] == scoreboard['teams'][0]['players'][0] == active_player(table)
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_valid_score_addition(client, table):
+    nickname = active_player(table)
+    assert add_score(client, nickname, points=2).status_code == 200
+    assert add_score(client, nickname, points=1).status_code == 200
+    scoreboard = client.get(SCOREBOARD_GETTER_LAMBDA, params={'gameId': 'test'}).json()
+    assert [team['score'] for team in scoreboard['teams']] == [3, 0]
+    assert scoreboard['activePlayer'] == nickname
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_turn_end_passes_the_turn(client, table):
+    nickname = active_player(table)
+    response = add_score(client, nickname, points=1, endTurn=True)
+    assert response.status_code == 200
+    next_player = ({'TestAdmin', 'TestUser'} - {nickname}).pop()
+    assert response.json() == {'turn': 1, 'activePlayer': next_player}
+    assert active_player(table) == next_player
+    assert draw_word(client, nickname).status_code == 409
+    assert draw_word(client, next_player).status_code == 200
+    scoreboard = client.get(SCOREBOARD_GETTER_LAMBDA, params={'gameId': 'test'}).json()
+    assert [team['score'] for team in scoreboard['teams']] == [1, 0]
+    assert scoreboard['activeTeam'] == 1
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_score_addition_out_of_turn(client, table):
+    nickname = ({'TestAdmin', 'TestUser'} - {active_player(table)}).pop()
+    assert add_score(client, nickname, points=1).status_code == 409
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_score_addition_with_invalid_points(client, table):
+    nickname = active_player(table)
+    assert add_score(client, nickname, points=-1).status_code == 400
+    assert add_score(client, nickname, points="1").status_code == 400
+    assert add_score(client, nickname).status_code == 400
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
+def test_score_addition_before_game_started(client):
+    assert add_score(client, 'TestUser', points=1).status_code == 409
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
+def test_scoreboard_before_game_started(client):
+    response = client.get(SCOREBOARD_GETTER_LAMBDA,
+                          params={'gameId': 'test'})
+    assert response.status_code == 200
+    assert response.json()['teams'] == []
+    assert response.json()['activePlayer'] is None
+
+
+# ---------------------------------------------------- change log ---------------------------------------------------
+def get_changes(client, game_id, since, **params):
+    return client.get(CHANGES_GETTER_LAMBDA,
+                      params={'gameId': game_id, 'since': str(since), **params})
+
+
+def create_game_with_changes(client, stream):
+    # a new game, followed by a change of every kind the lobby makes, recorded in the game's log
+    game_id = client.post(GAME_CREATOR_LAMBDA,
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'nickName': 'TestAdmin'})).json()['gameId']
+    for method, url, body in ((client.put, PLAYER_ADDER_LAMBDA, {'nickName': 'TestUser'}),
+                              (client.put, STATUS_SETTER_LAMBDA, {'status': 'adding_words'}),
+                              (client.put, WORD_ADDER_LAMBDA, {'words': ['one', 'two']})):
+        response = method(url,
+                          params={'gameId': game_id},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps(body))
+        assert response.status_code == 200
+    stream()
+    return game_id
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table")
+def test_game_creation_starts_the_change_log(client, stream):
+    game_id = client.post(GAME_CREATOR_LAMBDA,
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'nickName': 'TestAdmin'})).json()['gameId']
+    stream()
+    response = get_changes(client, game_id, 0)
+    assert response.status_code == 200
+    assert response.json() == {
+        'changes': [{'seq': 1, 'kind': 'game_created', 'data': {'nickName': 'TestAdmin', 'status': 'adding_players'}}],
+        'version': 1,
+    }
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table")
+def test_changes_since_a_version(client, stream):
+    game_id = create_game_with_changes(client, stream)
+    response = get_changes(client, game_id, 1)
+    assert response.status_code == 200
+    assert response.json() == {
+        'changes': [
+            {'seq': 2, 'kind': 'player_added', 'data': {'nickName': 'TestUser'}},
+            {'seq': 3, 'kind': 'status_changed', 'data': {'status': 'adding_words'}},
+            {'seq': 4, 'kind': 'words_added', 'data': {'words': ['one', 'two']}},
+        ],
+        'version': 4,
+    }
+    assert get_changes(client, game_id, 4).json() == {'changes': [], 'version': 4}
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table")
+def test_changes_in_pages(client, stream):
+    game_id = create_game_with_changes(client, stream)
+    response = get_changes(client, game_id, 1, limit=2)
+    assert [change['seq'] for change in response.json()['changes']] == [2, 3]
+    assert response.json()['version'] == 3
+    assert [change['seq'] for change in get_changes(client, game_id, 3, limit=2).json()['changes']] == [4]
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table")
+def test_rejected_change_is_not_logged(client, stream):
+    game_id = create_game_with_changes(client, stream)
+    response = client.put(WORD_ADDER_LAMBDA,
+                          params={'gameId': game_id},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'words': ['one']}))
+    assert response.json()['added'] == []
+    stream()
+    assert get_changes(client, game_id, 4).json() == {'changes': [], 'version': 4}
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table")
+def test_game_end_compacts_the_change_log(client, changes_table, stream):
+    game_id = create_game_with_changes(client, stream)
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': game_id},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'game_ended'}))
+    assert response.status_code == 200
+    stream()
+    assert get_changes(client, game_id, 1).status_code == 410
+    assert get_changes(client, game_id, 4).json() == {
+        'changes': [{'seq': 5, 'kind': 'status_changed', 'data': {'status': 'game_ended'}}],
+        'version': 5,
+    }
+    assert len(changes_table.scan()['Items']) == 1
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_concurrent_joins(client, backend, stream, request):
+    # every join is a single conditional update of the game, so joins that race each other all succeed
+    if backend == "memory":
+        request.getfixturevalue("memory_connection").latency = 0.01
+
+    nicknames = [f'TestUser{index}' for index in range(12)]
+    with ThreadPoolExecutor(max_workers=len(nicknames)) as executor:
+        responses = list(executor.map(lambda nickname: client.put(PLAYER_ADDER_LAMBDA,
+                                                                  params={'gameId': 'test'},
+                                                                  headers={'Content-Type': 'application/json'},
+                                                                  data=json.dumps({'nickName': nickname})),
+                                      nicknames))
+    assert [response.status_code for response in responses] == [200] * len(nicknames)
+
+    # the log holds a change for every join, in the order they were made
+    stream()
+    response = get_changes(client, 'test', 1)
+    assert [change['seq'] for change in response.json()['changes']] == list(range(2, 2 + len(nicknames)))
+    assert {change['data']['nickName'] for change in response.json()['changes']} == set(nicknames)
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table")
+def test_changes_trail_the_game(client, backend, stream):
+    if backend == "live":
+        pytest.skip("the deployed change recorder consumes the stream on its own")
+
+    game_id = create_game_with_changes(client, stream)
+    # the change recorder has not appended the addition to the log yet
+    response = client.put(WORD_ADDER_LAMBDA,
+                          params={'gameId': game_id},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'word': 'three'}))
+    assert response.status_code == 200
+    assert get_changes(client, game_id, 4).json() == {'changes': [], 'version': 4}
+    stream()
+    assert get_changes(client, game_id, 4).json()['changes'] == \
+        [{'seq': 5, 'kind': 'words_added', 'data': {'words': ['three']}}]
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_changes_of_a_game_created_before_the_log(client):
+    # the game's first version was never logged
+    assert get_changes(client, 'test', 0).status_code == 410
+    assert get_changes(client, 'test', 1).json() == {'changes': [], 'version': 1}
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_changes_with_invalid_since(client):
+    assert get_changes(client, 'test', -1).status_code == 400
+    assert get_changes(client, 'test', 'a').status_code == 400
+    assert client.get(CHANGES_GETTER_LAMBDA, params={'gameId': 'test'}).status_code == 400
+
+
+def test_changes_of_missing_game(client, table):
+    assert get_changes(client, 'missing', 0).status_code == 404
+
+
+# ------------------------------------------------------ pushes -----------------------------------------------------
+def connect(connection_id, game_id='test', route_key='$connect'):
+    # WebSocket API events reach the push connector directly, rather than through a URL
+    return push_connector.handler({'requestContext': {'routeKey': route_key, 'connectionId': connection_id},
+                                   'queryStringParameters': {'gameId': game_id}}, None)
+
+
+def pushed(transport, connection_id):
+    return [json.loads(message) for message in transport.messages[connection_id]]
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_changes_are_pushed_to_connected_players(client, transport, stream):
+    assert connect('first')['statusCode'] == 200
+    assert connect('second')['statusCode'] == 200
+    response = client.put(PLAYER_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'nickName': 'TestUser'}))
+    assert response.status_code == 200
+    stream()
+    change = {'seq': 2, 'kind': 'player_added', 'data': {'nickName': 'TestUser'}}
+    assert pushed(transport, 'first') == pushed(transport, 'second') == [change]
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_redelivered_change_is_recorded_once(client, transport, memory_connection):
+    connect('first')
+    client.put(PLAYER_ADDER_LAMBDA,
+               params={'gameId': 'test'},
+               headers={'Content-Type': 'application/json'},
+               data=json.dumps({'nickName': 'TestUser'}))
+    records = memory_connection.read_stream(TABLE_NAME)
+    # the stream delivers a batch again if its consumer failed on it
+    for _ in range(2):
+        assert change_recorder.handler({'Records': records}, None) == {'batchItemFailures': []}
+    assert [change['seq'] for change in get_changes(client, 'test', 1).json()['changes']] == [2]
+    assert pushed(transport, 'first') == [{'seq': 2, 'kind': 'player_added', 'data': {'nickName': 'TestUser'}}]
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
+def test_added_words_are_pushed(client, transport, stream):
+    connect('first')
+    client.put(WORD_ADDER_LAMBDA,
+               params={'gameId': 'test'},
+               headers={'Content-Type': 'application/json'},
+               data=json.dumps({'words': ['one', 'two']}))
+    client.put(WORD_ADDER_LAMBDA,
+               params={'gameId': 'test'},
+               headers={'Content-Type': 'application/json'},
+               data=json.dumps({'words': ['one']}))
+    stream()
+    assert pushed(transport, 'first') == [{'seq': 2, 'kind': 'words_added', 'data': {'words': ['one', 'two']}}]
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_gone_connection_is_removed(client, transport, connections_table, stream):
+    connect('first')
+    connect('second')
+    transport.gone.add('first')
+    client.put(PLAYER_ADDER_LAMBDA,
+               params={'gameId': 'test'},
+               headers={'Content-Type': 'application/json'},
+               data=json.dumps({'nickName': 'TestUser'}))
+    stream()
+    assert [item['connection_id'] for item in connections_table.scan()['Items']] == ['second']
+    assert len(pushed(transport, 'second')) == 1
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
+def test_game_end_closes_the_push_channel(client, transport, connections_table, stream):
+    connect('first')
+    response = client.put(STATUS_SETTER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=json.dumps({'status': 'game_ended'}))
+    assert response.status_code == 200
+    stream()
+    assert pushed(transport, 'first') == [{'seq': 2, 'kind': 'status_changed', 'data': {'status': 'game_ended'}}]
+    assert 'first' in transport.gone
+    assert connections_table.scan()['Items'] == []
+    assert connect('second')['statusCode'] == 409
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_invalid_connections(transport, connections_table):
+    assert connect('first', game_id='missing')['statusCode'] == 404
+    assert connect('first', game_id='')['statusCode'] == 400
+    assert push_connector.handler({'requestContext': {}}, None)['statusCode'] == 400
+    assert connect('first', route_key='$disconnect')['statusCode'] == 200
+    assert connections_table.scan()['Items'] == []
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_connection_with_failing_dynamodb(transport, connections_table, monkeypatch):
+    def unreachable(*_, **__):
+        raise PynamoDBConnectionError("Failed to connect")
+
+    def failing_register(*_, **__):
+        raise PynamoDBException("Failed to register the connection")
+
+    monkeypatch.setattr(GameCache, "get_game", unreachable)
+    assert connect('first')['statusCode'] == 503
+    monkeypatch.undo()
+
+    monkeypatch.setattr(broadcaster, "register", failing_register)
+    assert connect('first')['statusCode'] == 500
+    assert connections_table.scan()['Items'] == []
+
+
+def test_api_gateway_transport():
+    transport = ApiGatewayTransport("https://push.execute-api.us-west-2.amazonaws.com/live")
+    with Stubber(transport._management_client()) as stubber:
+        stubber.add_response('post_to_connection', {}, {'ConnectionId': 'first', 'Data': b'{"seq":2}'})
+        stubber.add_client_error('post_to_connection', 'GoneException', http_status_code=410)
+        assert transport.send('first', '{"seq":2}')
+        assert not transport.send('second', '{"seq":2}')
+
+
+# ------------------------------------------------- materialized views ----------------------------------------------
+def stream_record(sequence_number, image, event_name='MODIFY'):
+    # a record of the table's stream, as DynamoDB sends it with a NEW_IMAGE view type
+    serializer = TypeSerializer()
+    keys = {'game_id': serializer.serialize(image['game_id'])}
+    record = {'eventName': event_name, 'dynamodb': {'Keys': keys, 'SequenceNumber': sequence_number}}
+    if event_name != 'REMOVE':
+        record['dynamodb']['NewImage'] = {name: serializer.serialize(value) for name, value in image.items()}
+    return record
+
+
+def materialize(*records):
+    return view_materializer.handler({'Records': list(records)}, None)
+
+
+def header(table, game_id='test', **changes):
+    return {**table.get_item(Key={'game_id': game_id})['Item'], **changes}
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_started_game")
+def test_stream_materializes_the_game_views(client, table, views_table):
+    assert materialize(stream_record('100', header(table))) == {'batchItemFailures': []}
+    view = views_table.get_item(Key={'game_id': 'test'})['Item']
+    assert view['version'] == header(table)['version']
+    # the views are the responses the getters build from the game
+    assert json.loads(view['lobby']) == client.get(PLAYERS_GETTER_LAMBDA, params={'gameId': 'test'}).json()
+    assert json.loads(view['scoreboard']) == client.get(SCOREBOARD_GETTER_LAMBDA, params={'gameId': 'test'}).json()
+    assert json.loads(view['counts']) == client.get(STATUS_GETTER_LAMBDA, params={'gameId': 'test'}).json()
+    assert json.loads(view['counts'])['playerCount'] == 2
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
+def test_getters_serve_the_materialized_views(client, backend, table, views_table, monkeypatch):
+    if backend == "live":
+        pytest.skip("the deployed lambdas are configured by the template")
+
+    monkeypatch.setattr(game_view, "MATERIALIZED_VIEWS", True)
+    # without views the getters build their responses from the game
+    assert client.get(PLAYERS_GETTER_LAMBDA, params={'gameId': 'test'}).json()['players'] == ['TestAdmin', 'TestUser']
+
+    materialize(stream_record('100', header(table, players={'Materialized'})))
+    game_cache.clear()
+    for url, view in ((PLAYERS_GETTER_LAMBDA, 'lobby'), (SCOREBOARD_GETTER_LAMBDA, 'scoreboard'),
+                      (STATUS_GETTER_LAMBDA, 'counts')):
+        response = client.get(url, params={'gameId': 'test'})
+        assert response.status_code == 200
+        assert response.text == views_table.get_item(Key={'game_id': 'test'})['Item'][view]
+    assert client.get(PLAYERS_GETTER_LAMBDA, params={'gameId': 'test'}).json()['players'] == ['Materialized']
+
+    # pages and long polls are built from the game itself
+    paged = client.get(PLAYERS_GETTER_LAMBDA, params={'gameId': 'test', 'limit': '1'}).json()
+    assert paged['players'] == ['TestAdmin']
+    polled = client.get(PLAYERS_GETTER_LAMBDA, params={'gameId': 'test', 'knownVersion': '0', 'waitSeconds': '1'})
+    assert polled.json()['players'] == ['TestAdmin', 'TestUser']
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
+def test_stream_batch_keeps_each_game_latest_view(table, views_table):
+    content = stream_record('101', {'game_id': 'test#content', 'words': {'one'}})
+    response = materialize(stream_record('100', header(table, version=2)), content,
+                           stream_record('102', header(table, version=3, players={'TestAdmin'})))
+    assert response == {'batchItemFailures': []}
+    view = views_table.get_item(Key={'game_id': 'test'})['Item']
+    assert view['version'] == 3
+    assert json.loads(view['lobby'])['players'] == ['TestAdmin']
+    assert views_table.get_item(Key={'game_id': 'test#content'}).get('Item') is None
+
+    # a record replayed after a newer one was applied does not regress the views
+    assert materialize(stream_record('100', header(table, version=2))) == {'batchItemFailures': []}
+    assert views_table.get_item(Key={'game_id': 'test'})['Item']['version'] == 3
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
+def test_new_game_replaces_the_views_of_its_pin(table, views_table):
+    # the ended game's views show a later version than the new game that reuses its PIN starts at
+    materialize(stream_record('100', header(table, status='game_ended', version=12, created_at=1000)))
+    new_game = header(table, players={'NewAdmin'}, version=1, created_at=2000)
+    assert materialize(stream_record('101', new_game, event_name='INSERT')) == {'batchItemFailures': []}
+    view = views_table.get_item(Key={'game_id': 'test'})['Item']
+    assert (view['created_at'], view['version']) == (2000, 1)
+    assert json.loads(view['lobby'])['players'] == ['NewAdmin']
+
+    # a record of the ended game replayed after the new game's does not bring its views back
+    materialize(stream_record('100', header(table, status='game_ended', version=12, created_at=1000)))
+    assert views_table.get_item(Key={'game_id': 'test'})['Item']['created_at'] == 2000
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
+def test_stream_batch_reports_failed_games(table, views_table, monkeypatch):
+    save = game_view.GameView.save
+
+    def failing_save(view, *args, **kwargs):
+        if view.game_id == 'other':
+            raise PutError("Failed to put item")
+        return save(view, *args, **kwargs)
+
+    monkeypatch.setattr(game_view.GameView, "save", failing_save)
+    other = {**header(table), 'game_id': 'other'}
+    response = materialize(stream_record('100', other), stream_record('101', header(table)),
+                           stream_record('102', {**other, 'version': 2}))
+    # the failed game is retried from its first record in the batch, the other game's view is kept
+    assert response == {'batchItemFailures': [{'itemIdentifier': '100'}]}
+    assert views_table.get_item(Key={'game_id': 'test'})['Item']['version'] == 1
+    assert views_table.get_item(Key={'game_id': 'other'}).get('Item') is None
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players")
+def test_removed_game_drops_its_views(table, views_table):
+    materialize(stream_record('100', header(table)))
+    assert materialize(stream_record('101', {'game_id': 'test'}, event_name='REMOVE')) == {'batchItemFailures': []}
+    assert views_table.get_item(Key={'game_id': 'test'}).get('Item') is None
+
+
+# ---------------------------------------------------- Cold start ----------------------------------------------------
+@pytest.mark.parametrize("handler_name", handler_names())
+def test_rejected_request_does_not_import_dynamodb(handler_name):
+    assert not loads_dynamodb_on_rejection(handler_name)
+
+
+# ----------------------------------------------------- Metrics -----------------------------------------------------
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_2_players_in_adding_words_status")
+def test_word_addition_does_not_read_the_game(client, backend, capsys):
+    if backend == "live":
+        pytest.skip("the deployed lambdas print their metrics to CloudWatch")
+
+    capsys.readouterr()
+    client.put(WORD_ADDER_LAMBDA,
+               params={'gameId': 'test'},
+               headers={'Content-Type': 'application/json'},
+               data=json.dumps({'words': ['one', 'two']}))
+    record = json.loads(capsys.readouterr().out.splitlines()[-1])
+    assert record['StatusCode'] == 200
+    assert record['DynamoDBOperations'] == {'TransactWriteItems': 1}
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_game_with_word_items")
+def test_word_items_addition_reads_the_game_once(client, backend, capsys):
+    if backend == "live":
+        pytest.skip("the deployed lambdas print their metrics to CloudWatch")
+
+    operations = []
+    for words in (['one'], ['two']):
+        capsys.readouterr()
+        response = client.put(WORD_ADDER_LAMBDA,
+                              params={'gameId': 'test'},
+                              headers={'Content-Type': 'application/json'},
+                              data=json.dumps({'words': words}))
+        assert response.json() == {'added': words, 'duplicates': []}
+        operations.append(json.loads(capsys.readouterr().out.splitlines()[-1])['DynamoDBOperations'])
+    # the container learns where the game keeps its words from its first addition's failed condition
+    assert operations == [{'TransactWriteItems': 2, 'GetItem': 1}, {'TransactWriteItems': 1}]
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_metrics_record_of_get_status(client, backend, capsys):
+    if backend == "live":
+        pytest.skip("the deployed lambdas print their metrics to CloudWatch")
+
+    capsys.readouterr()
+    client.get(STATUS_GETTER_LAMBDA,
+               params={'gameId': 'test'})
+    record = json.loads(capsys.readouterr().out.splitlines()[-1])
+    assert record['Endpoint'] == "status_getter"
+    assert record['StatusCode'] == 200
+    assert record['DynamoDBOperations'] == {'GetItem': 1}
+    assert record['ConsumedCapacity'] > 0
+    assert record['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['Endpoint']]
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_dynamodb_is_instrumented_once(client, backend, capsys):
+    if backend == "live":
+        pytest.skip("the deployed lambdas print their metrics to CloudWatch")
+
+    instrument_dynamodb()
+    capsys.readouterr()
+    client.get(STATUS_GETTER_LAMBDA,
+               params={'gameId': 'test'})
+    assert json.loads(capsys.readouterr().out.splitlines()[-1])['DynamoDBOperations'] == {'GetItem': 1}
+
+
+@pytest.mark.usefixtures("clear_dynamodb_table", "create_a_single_game")
+def test_metrics_record_counts_bytes_of_non_ascii_bodies(client, backend, capsys):
+    if backend == "live":
+        pytest.skip("the deployed lambdas print their metrics to CloudWatch")
+
+    capsys.readouterr()
+    data = json.dumps({'nickName': 'שחקן'}, ensure_ascii=False)
+    response = client.put(PLAYER_ADDER_LAMBDA,
+                          params={'gameId': 'test'},
+                          headers={'Content-Type': 'application/json'},
+                          data=data)
+    record = json.loads(capsys.readouterr().out.splitlines()[-1])
+    assert record['RequestBytes'] == len(data.encode('utf-8')) > len(data)
+    assert record['ResponseBytes'] == len(response.text.encode('utf-8'))
@@ -0,0 +1,508 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from os.path import abspath, join
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+BASE_DIRECTORY = abspath(join(abspath(__file__), "..", ".."))
+sys.path.insert(0, BASE_DIRECTORY)
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+from lambdas import game_creator, player_adder, status_setter, status_getter, players_getter, word_adder, \
+    words_getter, snapshot_getter, push_connector, change_recorder  # noqa: E402
+from models.broadcaster import Connection  # noqa: E402
+from models.change_log import ChangeEvent, log_key  # noqa: E402
+from models.game_cache import game_cache  # noqa: E402
+from models.game_content import GameContent  # noqa: E402
+from models.game_session import GameSession, GAME_ENDED  # noqa: E402
+from models import game_word  # noqa: E402
+from models.game_word import GameWord, read_words  # noqa: E402
+from models.pin_allocator import PinPoolShard  # noqa: E402
+from tools.memory_backend import MemoryConnection, use_memory_backend  # noqa: E402
+from utils.push_transport import InProcessTransport, current_transport, use_transport  # noqa: E402
+
+# the endpoints a game lifecycle goes through, as method, path and handler
+ENDPOINTS: Dict[str, Tuple[str, str, Callable[[Dict[str, Any], Any], Dict[str, Any]]]] = {
+    "create_game": ("POST", "/", game_creator.handler),
+    "add_player": ("PUT", "/players", player_adder.handler),
+    "set_status": ("PUT", "/status", status_setter.handler),
+    "add_words": ("PUT", "/words", word_adder.handler),
+    "get_status": ("GET", "/status", status_getter.handler),
+    "get_players": ("GET", "/players", players_getter.handler),
+    "get_words": ("GET", "/words", words_getter.handler),
+    "get_snapshot": ("GET", "/snapshot", snapshot_getter.handler),
+}
+POLL_ENDPOINTS = ("get_status", "get_players", "get_words", "get_snapshot")
+# the change recorder gets the stream of the games' table in batches of up to this many records, like the deployed one
+STREAM_BATCH_SIZE = 100
+# players connect to their game's push channel through the WebSocket API, rather than a REST endpoint
+CONNECT_ENDPOINT = "connect"
+CONFLICT_MESSAGE = "The game has changed, please try again"
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class BenchmarkConfig:
+    games: int = 50
+    players: int = 6
+    words_per_player: int = 5
+    words_per_request: int = 1
+    duplicate_rate: float = 0.1
+    polls_per_request: int = 3
+    concurrency: int = 8
+    pool: str = "thread"
+    seed: int = 0
+    word_storage: str = "set"
+    push: bool = False
+    dynamodb_latency_ms: float = 0.0
+
+
+@dataclass
+class Request:
+    endpoint: str
+    game: int
+    params: Dict[str, str] = field(default_factory=dict)
+    body: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class GameLedger:
+    """
+    The state a game should end up in, according to the responses the benchmark got.
+    """
+    game_id: Optional[str] = None
+    players: Set[str] = field(default_factory=set)
+    words: Set[str] = field(default_factory=set)
+    changes: int = 0
+    # the version of the game when its players connected to its push channel
+    connected_at: Optional[int] = None
+
+
+@dataclass
+class Samples:
+    """
+    Raw measurements of a run, which can be merged across worker processes.
+    """
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    status_codes: Dict[str, Counter] = field(default_factory=lambda: defaultdict(Counter))
+    dynamodb_calls: Counter = field(default_factory=Counter)
+    conflicts: int = 0
+    lost_updates: int = 0
+    phantom_updates: int = 0
+    games: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    pushes: int = 0
+    missed_pushes: int = 0
+    reordered_pushes: int = 0
+
+    def merge(self, other: "Samples") -> None:
+        for endpoint, latencies in other.latencies.items():
+            self.latencies[endpoint].extend(latencies)
+        for endpoint, codes in other.status_codes.items():
+            self.status_codes[endpoint].update(codes)
+        self.dynamodb_calls.update(other.dynamodb_calls)
+        self.conflicts += other.conflicts
+        self.lost_updates += other.lost_updates
+        self.phantom_updates += other.phantom_updates
+        self.games += other.games
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        self.pushes += other.pushes
+        self.missed_pushes += other.missed_pushes
+        self.reordered_pushes += other.reordered_pushes
+
+
+def _event(method: str, path: str, params: Dict[str, str], body: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    # the event a Lambda Function URL delivers for the request
+    event: Dict[str, Any] = {
+        'version': '2.0',
+        'rawPath': path,
+        'headers': {'content-type': 'application/json'},
+        'requestContext': {'http': {'method': method, 'path': path}},
+        'isBase64Encoded': False,
+    }
+    if params:
+        event['queryStringParameters'] = params
+    if body is not None:
+        event['body'] = json.dumps(body)
+    return event
+
+
+def _connect_event(connection_id: str, params: Dict[str, str]) -> Dict[str, Any]:
+    # the event a WebSocket API delivers when a connection opens
+    return {
+        'requestContext': {'routeKey': '$connect', 'connectionId': connection_id},
+        'queryStringParameters': params,
+    }
+
+
+def _invoke(request: Request) -> Tuple[Request, Dict[str, Any], float]:
+    if request.endpoint == CONNECT_ENDPOINT:
+        handler = push_connector.handler
+        event = _connect_event(f"{request.game}-{request.body['nickName']}", request.params)
+    else:
+        method, path, handler = ENDPOINTS[request.endpoint]
+        event = _event(method, path, request.params, request.body)
+    start = time.perf_counter()
+    response = handler(event, None)
+    return request, response, time.perf_counter() - start
+
+
+class GameLifecycles:
+    """
+    Replays the lifecycles of a set of games phase by phase- creation, joins, word submissions and status changes,
+     with polls mixed into every phase. The requests of a phase are shuffled across games and sent concurrently,
+     so requests of the same game race each other like they do with real players.
+    Once the requests of a batch were answered, the change recorder gets the stream of the games' table.
+    With pushes, the players connect to their game's push channel once they joined, instead of polling.
+    """
+    def __init__(self, config: BenchmarkConfig, executor: Executor, connection: MemoryConnection, games: int,
+                 seed: int):
+        self.config = config
+        self.executor = executor
+        self.connection = connection
+        self.random = random.Random(seed)
+        self.ledgers = [GameLedger() for _ in range(games)]
+        self.samples = Samples(games=games)
+
+    def run(self) -> Samples:
+        self._run_phase([Request("create_game", game, body={'nickName': "player-0"})
+                         for game in range(len(self.ledgers))])
+        self._run_phase([Request("add_player", game, body={'nickName': f"player-{player}"})
+                         for game in self._live_games() for player in range(1, self.config.players)])
+        if self.config.push:
+            self._run_phase(self._connections())
+        self._run_phase(self._status_changes("adding_words"))
+        self._run_phase(self._word_submissions())
+        self._run_phase(self._status_changes("in_game"))
+        self._run_phase([])
+        self._run_phase(self._status_changes("game_ended"))
+        self._check_final_state()
+        return self.samples
+
+    def _live_games(self) -> List[int]:
+        return [game for game, ledger in enumerate(self.ledgers) if ledger.game_id]
+
+    def _connections(self) -> List[Request]:
+        for game in self._live_games():
+            self.ledgers[game].connected_at = 1 + self.ledgers[game].changes
+        return [Request(CONNECT_ENDPOINT, game, body={'nickName': player})
+                for game in self._live_games() for player in sorted(self.ledgers[game].players)]
+
+    def _status_changes(self, status: str) -> List[Request]:
+        return [Request("set_status", game, body={'status': status}) for game in self._live_games()]
+
+    def _word_submissions(self) -> List[Request]:
+        # each game draws its words from a vocabulary somewhat smaller than the number of submitted words,
+        # so some of the submissions are duplicates
+        submissions = self.config.players * self.config.words_per_player
+        vocabulary_size = max(1, math.ceil(submissions * (1 - self.config.duplicate_rate)))
+        requests = []
+        for game in self._live_games():
+            vocabulary = [f"word-{game}-{index}" for index in range(vocabulary_size)]
+            words = vocabulary + [self.random.choice(vocabulary) for _ in range(submissions - vocabulary_size)]
+            self.random.shuffle(words)
+            for start in range(0, len(words), self.config.words_per_request):
+                requests.append(Request("add_words", game, body={'words': words[start:start + self.config.words_per_request]}))
+        return requests
+
+    def _run_phase(self, requests: List[Request]) -> None:
+        # every request comes with polls of its game, and a phase without requests is a phase of polling only.
+        # Players that get pushes don't poll
+        polled_games = [request.game for request in requests] or \
+            [game for game in self._live_games() for _ in range(self.config.players)]
+        polls = 0 if self.config.push else self.config.polls_per_request
+        poll_requests = [Request(self.random.choice(POLL_ENDPOINTS), game)
+                         for game in polled_games for _ in range(polls)]
+
+        # a game's polls need its PIN, so the polls of games that are being created are only sent once their
+        # creation was recorded, and only for the games that were created
+        created = {request.game for request in requests if request.endpoint == "create_game"}
+        self._send(requests + [poll for poll in poll_requests if poll.game not in created])
+        self._send([poll for poll in poll_requests if poll.game in created and self.ledgers[poll.game].game_id])
+
+    def _send(self, requests: List[Request]) -> None:
+        self.random.shuffle(requests)
+        for request in requests:
+            if request.endpoint != "create_game":
+                request.params = {'gameId': self.ledgers[request.game].game_id}
+
+        for request, response, latency in self.executor.map(_invoke, requests):
+            self._record(request, response, latency)
+        self._record_changes()
+
+    def _record_changes(self) -> None:
+        records = self.connection.read_stream(GameSession.Meta.table_name)
+        for start in range(0, len(records), STREAM_BATCH_SIZE):
+            begin = time.perf_counter()
+            result = change_recorder.handler({'Records': records[start:start + STREAM_BATCH_SIZE]}, None)
+            self.samples.latencies["change_recorder"].append(time.perf_counter() - begin)
+            self.samples.status_codes["change_recorder"]["failed" if result['batchItemFailures'] else "ok"] += 1
+
+    def _record(self, request: Request, response: Dict[str, Any], latency: float) -> None:
+        status_code = response['statusCode']
+        self.samples.latencies[request.endpoint].append(latency)
+        self.samples.status_codes[request.endpoint][str(status_code)] += 1
+        body = json.loads(response.get('body') or '{}')
+        if body.get('error') == CONFLICT_MESSAGE:
+            self.samples.conflicts += 1
+
+        ledger = self.ledgers[request.game]
+        if status_code >= 300:
+            return
+        if request.endpoint == "create_game":
+            ledger.game_id = body['gameId']
+            ledger.players.add(request.body['nickName'])
+        elif request.endpoint == "add_player":
+            ledger.players.add(request.body['nickName'])
+            ledger.changes += 1
+        elif request.endpoint == "set_status":
+            ledger.changes += 1
+        elif request.endpoint == "add_words":
+            ledger.words.update(body['added'])
+            ledger.changes += 1 if body['added'] else 0
+
+    def _check_final_state(self) -> None:
+        # every acknowledged change must be in the stored game, and nothing else
+        for game_index, ledger in enumerate(self.ledgers):
+            if not ledger.game_id:
+                continue
+            game = GameSession.get(ledger.game_id, consistent_read=True)
+            players, words = set(game.players or ()), read_words(ledger.game_id, game.words_partition, True)
+            expected_version = 1 + ledger.changes
+
+            self.samples.lost_updates += len(ledger.players - players) + len(ledger.words - words) + \
+                max(0, expected_version - int(game.version or 0))
+            self.samples.phantom_updates += len(players - ledger.players) + len(words - ledger.words) + \
+                max(0, int(game.version or 0) - expected_version) + abs(int(game.word_count or 0) - len(words))
+
+            # the change log holds an event for every version of the game, and only the last one once it ended
+            version = int(game.version or 0)
+            seqs = {int(event.seq) for event in ChangeEvent.query(log_key(game), consistent_read=True)}
+            logged = {version} if game.status == GAME_ENDED else set(range(1, version + 1))
+            self.samples.lost_updates += len(logged - seqs)
+            self.samples.phantom_updates += len(seqs - logged)
+
+            # every player connected to the game got each of its later changes. The change recorder pushes a game's
+            # changes in the order of its stream, so they are never reordered
+            transport = current_transport()
+            if ledger.connected_at is None or not isinstance(transport, InProcessTransport):
+                continue
+            expected = list(range(ledger.connected_at + 1, version + 1))
+            for player in ledger.players:
+                received = [json.loads(message)['seq'] for message in transport.messages[f"{game_index}-{player}"]]
+                self.samples.pushes += len(received)
+                self.samples.missed_pushes += len(set(expected) - set(received))
+                self.samples.reordered_pushes += sum(1 for previous, seq in zip(received, received[1:])
+                                                     if seq < previous)
+
+
+def _run_games(config: BenchmarkConfig, games: int, seed: int, threads: int,
+               connection: Optional[MemoryConnection] = None) -> Samples:
+    """
+    Replays the given number of games against an in-memory backend.
+    """
+    connection = use_memory_backend(GameSession, GameContent, GameWord, ChangeEvent, Connection, PinPoolShard,
+                                    connection=connection)
+    connection.reset()
+    connection.latency = config.dynamodb_latency_ms / 1000
+    connection.enable_stream(GameSession.Meta.table_name)
+    # changes are pushed to the players' connections in memory
+    use_transport(InProcessTransport() if config.push else None)
+    # the games created by this run keep their words the way the configuration asks
+    game_word.WORD_STORAGE = config.word_storage
+    game_cache.clear()
+
+    # the handlers log every game they create
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            samples = GameLifecycles(config, executor, connection, games, seed).run()
+
+    samples.dynamodb_calls.update(connection.calls)
+    cache = game_cache.stats()
+    samples.cache_hits, samples.cache_misses = cache['hits'], cache['misses']
+    return samples
+
+
+def _run_process_shard(config: BenchmarkConfig, games: int, seed: int) -> Samples:
+    return _run_games(config, games, seed, threads=1)
+
+
+def run_benchmark(config: BenchmarkConfig) -> Tuple[Samples, float]:
+    """
+    Runs the benchmark described by the given configuration.
+    With a thread pool, all the games share one process and one in-memory backend.
+    With a process pool, the games are split between the processes, each replaying its games with its own backend.
+    :return: The run's measurements, and its duration in seconds
+    """
+    start = time.perf_counter()
+    if config.pool == "thread":
+        samples = _run_games(config, config.games, config.seed, threads=config.concurrency)
+    else:
+        shards = [config.games // config.concurrency + (1 if shard < config.games % config.concurrency else 0)
+                  for shard in range(config.concurrency)]
+        samples = Samples()
+        with ProcessPoolExecutor(max_workers=config.concurrency) as executor:
+            futures = [executor.submit(_run_process_shard, config, games, config.seed + shard)
+                       for shard, games in enumerate(shards) if games]
+            for future in futures:
+                samples.merge(future.result())
+    return samples, time.perf_counter() - start
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    index = max(0, math.ceil(percentile / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def _latency_summary(latencies: List[float]) -> Dict[str, float]:
+    values = sorted(latencies)
+    if not values:
+        return {'count': 0}
+    summary = {f"p{percentile}": round(_percentile(values, percentile) * 1000, 3) for percentile in PERCENTILES}
+    summary['max'] = round(values[-1] * 1000, 3)
+    summary['count'] = len(values)
+    return summary
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BASE_DIRECTORY,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(config: BenchmarkConfig, samples: Samples, elapsed: float) -> Dict[str, Any]:
+    """
+    :return: A JSON-serializable report of a run
+    """
+    invocations = sum(len(latencies) for latencies in samples.latencies.values())
+    all_latencies = [latency for latencies in samples.latencies.values() for latency in latencies]
+    games = max(1, samples.games)
+    return {
+        'commit': _git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'config': asdict(config),
+        'elapsed_seconds': round(elapsed, 3),
+        'invocations': invocations,
+        'invocations_per_second': round(invocations / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            'all': _latency_summary(all_latencies),
+            **{endpoint: _latency_summary(samples.latencies[endpoint]) for endpoint in sorted(samples.latencies)},
+        },
+        'status_codes': {endpoint: dict(codes) for endpoint, codes in sorted(samples.status_codes.items())},
+        'per_game': {
+            'invocations': round(invocations / games, 2),
+            'dynamodb_calls': round(sum(samples.dynamodb_calls.values()) / games, 2),
+            'dynamodb_calls_by_operation': {operation: round(calls / games, 2)
+                                            for operation, calls in sorted(samples.dynamodb_calls.items())},
+        },
+        'conflicts': samples.conflicts,
+        'lost_updates': samples.lost_updates,
+        'phantom_updates': samples.phantom_updates,
+        'cache': {'hits': samples.cache_hits, 'misses': samples.cache_misses},
+        'pushes': {'delivered': samples.pushes, 'missed': samples.missed_pushes,
+                   'reordered': samples.reordered_pushes},
+    }
+
+
+def compare_reports(baseline: Dict[str, Any], report: Dict[str, Any]) -> List[str]:
+    """
+    :return: Lines describing how a report differs from a baseline report
+    """
+    lines = [f"baseline commit {baseline.get('commit')}, current commit {report.get('commit')}"]
+    for endpoint, summary in report['latency_ms'].items():
+        base = baseline.get('latency_ms', {}).get(endpoint, {})
+        changes = []
+        for key in [f"p{percentile}" for percentile in PERCENTILES]:
+            if key in summary and base.get(key):
+                changes.append(f"{key} {base[key]:.3f} -> {summary[key]:.3f} ms "
+                               f"({(summary[key] - base[key]) / base[key] * 100:+.1f}%)")
+        if changes:
+            lines.append(f"{endpoint}: {', '.join(changes)}")
+    for key in ('dynamodb_calls', 'invocations'):
+        lines.append(f"{key} per game: {baseline.get('per_game', {}).get(key)} -> {report['per_game'][key]}")
+    for key in ('conflicts', 'lost_updates', 'phantom_updates'):
+        lines.append(f"{key}: {baseline.get(key)} -> {report[key]}")
+    if 'pushes' in report:
+        lines.append(f"pushes: {baseline.get('pushes')} -> {report['pushes']}")
+    return lines
+
+
+def main() -> None:
+    # tell this script how to handle arguments
+    description = "Script for benchmarking the Pitkiot lambdas, by replaying game lifecycles against an " \
+                  "in-memory DynamoDB"
+    parser = argparse.ArgumentParser(description=description)
+    defaults = BenchmarkConfig()
+    parser.add_argument("--games", type=int, default=defaults.games, help="The number of games to replay")
+    parser.add_argument("--players", type=int, default=defaults.players, help="The number of players in a game")
+    parser.add_argument("--words-per-player", type=int, default=defaults.words_per_player,
+                        help="The number of words each player submits")
+    parser.add_argument("--words-per-request", type=int, default=defaults.words_per_request,
+                        help="The number of words submitted in each request")
+    parser.add_argument("--duplicate-rate", type=float, default=defaults.duplicate_rate,
+                        help="The share of submitted words that were already submitted to the game")
+    parser.add_argument("--polls-per-request", type=int, default=defaults.polls_per_request,
+                        help="The number of polls sent along with every other request")
+    parser.add_argument("--concurrency", type=int, default=defaults.concurrency,
+                        help="The number of threads or processes sending requests")
+    parser.add_argument("--pool", choices=("thread", "process"), default=defaults.pool,
+                        help="thread- all games share one backend, and requests of a game run concurrently. "
+                             "process- games are split between processes, each with its own backend")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="The seed of the random choices")
+    parser.add_argument("--word-storage", choices=("set", "items"), default=defaults.word_storage,
+                        help="set- games keep their words in a single item. items- in an item per word")
+    parser.add_argument("--push", action="store_true",
+                        help="Players connect to their game's push channel once they joined, and don't poll")
+    parser.add_argument("--dynamodb-latency-ms", type=float, default=defaults.dynamodb_latency_ms,
+                        help="The round trip of every call to the in-memory DynamoDB, so concurrent requests of a "
+                             "game can race between their reads and writes")
+    parser.add_argument("--output", help="A path to write the JSON report to, instead of printing it")
+    parser.add_argument("--baseline", help="A path of an earlier JSON report to compare the results to")
+    args = parser.parse_args()
+
+    config = BenchmarkConfig(
+        games=args.games,
+        players=args.players,
+        words_per_player=args.words_per_player,
+        words_per_request=args.words_per_request,
+        duplicate_rate=args.duplicate_rate,
+        polls_per_request=args.polls_per_request,
+        concurrency=args.concurrency,
+        pool=args.pool,
+        seed=args.seed,
+        word_storage=args.word_storage,
+        push=args.push,
+        dynamodb_latency_ms=args.dynamodb_latency_ms,
+    )
+    samples, elapsed = run_benchmark(config)
+    report = build_report(config, samples, elapsed)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"Report written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            for line in compare_reports(json.load(baseline_file), report):
+                print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import ast
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import dataclass, field
+from os.path import abspath, join
+from typing import Dict, List
+
+BASE_DIRECTORY = abspath(join(abspath(__file__), "..", ".."))
+LAMBDAS_DIRECTORY = join(BASE_DIRECTORY, "lambdas")
+
+# a line of python's -X importtime output- "import time: <self us> | <cumulative us> | <indented module name>"
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+# the modules a request rejected before reaching DynamoDB must not load
+DYNAMODB_PACKAGES = ("pynamodb", "botocore", "boto3")
+# the request every handler rejects before its first lazy import
+REJECTED_EVENT = {'requestContext': {'http': {'method': 'OPTIONS', 'path': '/'}}, 'rawPath': '/'}
+
+
+@dataclass
+class ImportProfile:
+    """
+    The import times of a single interpreter run, in microseconds.
+    """
+    self_times: Dict[str, int] = field(default_factory=dict)
+    cumulative_times: Dict[str, int] = field(default_factory=dict)
+    # the modules imported directly by the measured statements, rather than by other modules
+    top_level: List[str] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return sum(self.cumulative_times[module] for module in self.top_level)
+
+    def by_package(self) -> Dict[str, int]:
+        packages: Dict[str, int] = defaultdict(int)
+        for module, self_time in self.self_times.items():
+            packages[module.split('.')[0]] += self_time
+        return dict(packages)
+
+
+def handler_names() -> List[str]:
+    """
+    :return: The names of the modules in the lambdas package that define a handler
+    """
+    names = []
+    for file_name in sorted(os.listdir(LAMBDAS_DIRECTORY)):
+        if file_name.endswith(".py") and file_name != "__init__.py":
+            with open(join(LAMBDAS_DIRECTORY, file_name)) as source_file:
+                if re.search(r"^def handler\(", source_file.read(), re.MULTILINE):
+                    names.append(file_name[:-3])
+    return names
+
+
+def deferred_imports(handler_name: str) -> List[str]:
+    """
+    Finds the modules a handler imports inside its functions, which are only loaded by requests that reach them.
+    Imports of other handlers are followed, so the router's deferred imports include those of the handlers it routes to.
+    :param handler_name: The name of a module in the lambdas package
+    :return: The names of the deferred modules
+    """
+    modules: List[str] = []
+    pending, seen = [handler_name], set()
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        with open(join(LAMBDAS_DIRECTORY, f"{name}.py")) as source_file:
+            tree = ast.parse(source_file.read())
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ImportFrom) and node.module == "lambdas":
+                pending += [alias.name for alias in node.names]
+
+        for function in [node for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]:
+            for node in ast.walk(function):
+                if isinstance(node, ast.Import):
+                    modules += [alias.name for alias in node.names]
+                elif isinstance(node, ast.ImportFrom) and node.module:
+                    modules.append(node.module)
+    return sorted(set(modules))
+
+
+def profile_imports(statements: str) -> ImportProfile:
+    """
+    Runs the given statements in a fresh interpreter with -X importtime, and parses its report.
+    :param statements: Python statements to run from the repository's root
+    :return: The import times of the modules the statements loaded
+    """
+    environment = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    environment.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statements], cwd=BASE_DIRECTORY,
+                            env=environment, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+
+    profile = ImportProfile()
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        self_time, cumulative_time, indent, module = match.groups()
+        profile.self_times[module] = int(self_time)
+        profile.cumulative_times[module] = int(cumulative_time)
+        # the interpreter's own startup imports are reported before the statements run, unindented like these
+        if len(indent) == 1:
+            profile.top_level.append(module)
+    return profile
+
+
+def loads_dynamodb_on_rejection(handler_name: str) -> bool:
+    """
+    :param handler_name: The name of a module in the lambdas package
+    :return: True if a request the handler rejects makes it import the DynamoDB client
+    """
+    statements = (
+        f"import sys, lambdas.{handler_name} as module; "
+        f"module.handler({REJECTED_EVENT!r}, None); "
+        f"print(any(name.split('.')[0] in {DYNAMODB_PACKAGES!r} for name in sys.modules))"
+    )
+    environment = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    environment.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+    result = subprocess.run([sys.executable, "-c", statements], cwd=BASE_DIRECTORY, env=environment,
+                            stdout=subprocess.PIPE, text=True, check=True)
+    return result.stdout.strip() == "True"
+
+
+def _median_profile(statements: str, repeat: int, startup: ImportProfile) -> Dict[str, object]:
+    """
+    Measures the statements repeatedly, leaving out the modules the interpreter imports on startup.
+    :return: The median total, and the median time of each package
+    """
+    totals: List[int] = []
+    packages: Dict[str, List[int]] = defaultdict(list)
+    for _ in range(repeat):
+        profile = profile_imports(statements)
+        for module in startup.self_times:
+            profile.self_times.pop(module, None)
+        profile.top_level = [module for module in profile.top_level if module not in startup.self_times]
+        totals.append(profile.total)
+        for package, package_time in profile.by_package().items():
+            packages[package].append(package_time)
+
+    return {
+        'total_ms': round(statistics.median(totals) / 1000, 2),
+        'packages_ms': {package: round(statistics.median(times + [0] * (repeat - len(times))) / 1000, 2)
+                        for package, times in sorted(packages.items(), key=lambda item: -sum(item[1]))},
+    }
+
+
+def build_report(handlers: List[str], repeat: int) -> Dict[str, object]:
+    """
+    Measures, for each handler, the imports of loading its module- paid by every cold start,
+     and the imports it defers- paid by the first request that passes its validation.
+    :return: A JSON-serializable report
+    """
+    startup = profile_imports("pass")
+    report: Dict[str, object] = {'python': sys.version.split()[0], 'repeat': repeat, 'handlers': {}}
+    for handler_name in handlers:
+        deferred = deferred_imports(handler_name)
+        module_import = f"import lambdas.{handler_name}"
+        report['handlers'][handler_name] = {
+            'module': _median_profile(module_import, repeat, startup),
+            'first_request': _median_profile("; ".join([module_import] + [f"import {module}" for module in deferred]),
+                                             repeat, startup),
+            'deferred_imports': deferred,
+            'loads_dynamodb_on_rejection': loads_dynamodb_on_rejection(handler_name),
+        }
+    return report
+
+
+def format_report(report: Dict[str, object], top: int) -> str:
+    lines = [f"python {report['python']}, median of {report['repeat']} runs"]
+    for handler_name, result in report['handlers'].items():
+        lines.append("")
+        lines.append(f"{handler_name}: module {result['module']['total_ms']} ms, "
+                     f"with deferred imports {result['first_request']['total_ms']} ms, "
+                     f"rejected requests load DynamoDB- {result['loads_dynamodb_on_rejection']}")
+        for stage in ('module', 'first_request'):
+            packages = list(result[stage]['packages_ms'].items())[:top]
+            lines.append(f"  {stage}: " + ", ".join(f"{package} {package_time}" for package, package_time in packages))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    # tell this script how to handle arguments
+    description = "Script for measuring the time the Pitkiot lambdas spend on imports, per package, " \
+                  "by aggregating python's -X importtime report"
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("handlers", nargs="*", help="The lambdas to measure, all of them by default")
+    parser.add_argument("--repeat", type=int, default=5, help="The number of runs to take the median of")
+    parser.add_argument("--top", type=int, default=8, help="The number of packages to list per handler")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--output", help="A path to write the JSON report to")
+    args = parser.parse_args()
+
+    report = build_report(args.handlers or handler_names(), args.repeat)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    print(json.dumps(report, indent=2) if args.json else format_report(report, args.top))
+
+    # a handler that loads DynamoDB for requests it rejects has regressed
+    if any(result['loads_dynamodb_on_rejection'] for result in report['handlers'].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1011 @@
+import copy
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from pynamodb.connection import Connection
+from pynamodb.connection.base import MetaTable
+from pynamodb.exceptions import VerboseClientError
+from pynamodb.models import Model
+from pynamodb.settings import OperationSettings
+
+CONDITIONAL_CHECK_FAILED = "ConditionalCheckFailedException"
+TRANSACTION_CANCELED = "TransactionCanceledException"
+VALIDATION_ERROR = "ValidationException"
+RESOURCE_NOT_FOUND = "ResourceNotFoundException"
+
+TOKEN_PATTERN = re.compile(r"\s*(?:(?P<name>#\w+)|(?P<value>:\w+)|(?P<number>\d+)|(?P<word>[A-Za-z_]\w*)"
+                           r"|(?P<op><>|<=|>=|[=<>(),.\[\]+-]))")
+COMPARATORS = ("=", "<>", "<", "<=", ">", ">=")
+CONDITION_FUNCTIONS = ("attribute_exists", "attribute_not_exists", "attribute_type", "begins_with", "contains")
+UPDATE_CLAUSES = ("SET", "REMOVE", "ADD", "DELETE")
+SET_TYPES = ("SS", "NS", "BS")
+# the DynamoDB operations the memory backend answers, and the methods answering them
+OPERATIONS = {
+    "DescribeTable": "_describe_table",
+    "GetItem": "_get_item",
+    "PutItem": "_put_item",
+    "UpdateItem": "_update_item",
+    "DeleteItem": "_delete_item",
+    "BatchGetItem": "_batch_get_item",
+    "BatchWriteItem": "_batch_write_item",
+    "TransactGetItems": "_transact_get_items",
+    "TransactWriteItems": "_transact_write_items",
+    "Query": "_query",
+    "Scan": "_scan",
+}
+
+# a typed DynamoDB value, e.g. {'S': 'word'} or {'N': '3'}
+Value = Dict[str, Any]
+Item = Dict[str, Value]
+Path = Tuple[Tuple[str, Any], ...]
+
+
+class _ExpressionError(Exception):
+    """
+    Raised for requests DynamoDB would reject as invalid.
+    """
+
+
+class _ConditionFailed(Exception):
+    """
+    Raised when the condition of a single item write does not hold.
+    """
+
+
+class _TransactionCanceled(Exception):
+    """
+    Raised when the condition of an item in a write transaction does not hold.
+    """
+    def __init__(self, reasons: List[str]):
+        super().__init__(reasons)
+        self.reasons = reasons
+
+
+class _MissingTable(Exception):
+    """
+    Raised for requests on a table the backend does not have.
+    """
+
+
+class _Parser:
+    """
+    A recursive descent parser for DynamoDB condition, update, projection and key condition expressions.
+    Placeholders are resolved when an expression is evaluated, so a parsed expression can be reused.
+    """
+    def __init__(self, expression: str):
+        self.tokens: List[Tuple[str, str]] = []
+        position = 0
+        expression = expression.rstrip()
+        while position < len(expression):
+            match = TOKEN_PATTERN.match(expression, position)
+            if not match or match.end() == position:
+                raise _ExpressionError(f"Invalid expression: {expression}")
+            self.tokens.append((match.lastgroup, match.group(match.lastgroup)))
+            position = match.end()
+        self.position = 0
+
+    def peek(self, offset: int = 0) -> Tuple[Optional[str], Optional[str]]:
+        if self.position + offset < len(self.tokens):
+            return self.tokens[self.position + offset]
+        return None, None
+
+    def peek_word(self, offset: int = 0) -> Optional[str]:
+        kind, text = self.peek(offset)
+        return text.upper() if kind == "word" else None
+
+    def take(self, text: Optional[str] = None) -> Tuple[str, str]:
+        token = self.peek()
+        if token[0] is None or (text is not None and (token[1] or "").upper() != text):
+            raise _ExpressionError(f"Expected {text or 'a token'}, got {token[1]}")
+        self.position += 1
+        return token
+
+    def done(self) -> bool:
+        return self.position >= len(self.tokens)
+
+    # ---- conditions ----
+    def condition(self):
+        node = self.conjunction()
+        while self.peek_word() == "OR":
+            self.take()
+            node = ("or", node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.peek_word() == "AND":
+            self.take()
+            node = ("and", node, self.negation())
+        return node
+
+    def negation(self):
+        if self.peek_word() == "NOT":
+            self.take()
+            return ("not", self.negation())
+        return self.predicate()
+
+    def predicate(self):
+        if self.peek() == ("op", "("):
+            self.take()
+            node = self.condition()
+            self.take(")")
+            return node
+
+        word = self.peek_word()
+        if word and word.lower() in CONDITION_FUNCTIONS and self.peek(1) == ("op", "("):
+            self.take()
+            self.take("(")
+            arguments = [self.operand()]
+            while self.peek() == ("op", ","):
+                self.take()
+                arguments.append(self.operand())
+            self.take(")")
+            return ("function", word.lower(), arguments)
+
+        left = self.operand()
+        kind, text = self.peek()
+        if kind == "op" and text in COMPARATORS:
+            self.take()
+            return ("compare", text, left, self.operand())
+        if self.peek_word() == "BETWEEN":
+            self.take()
+            low = self.operand()
+            self.take("AND")
+            return ("between", left, low, self.operand())
+        if self.peek_word() == "IN":
+            self.take()
+            self.take("(")
+            options = [self.operand()]
+            while self.peek() == ("op", ","):
+                self.take()
+                options.append(self.operand())
+            self.take(")")
+            return ("in", left, options)
+        raise _ExpressionError(f"Unexpected token {text}")
+
+    # ---- operands ----
+    def operand(self):
+        node = self.term()
+        while self.peek() in (("op", "+"), ("op", "-")):
+            _, operator = self.take()
+            node = (operator, node, self.term())
+        return node
+
+    def term(self):
+        kind, text = self.peek()
+        if kind == "value":
+            self.take()
+            return ("value", text)
+
+        word = self.peek_word()
+        if word in ("SIZE", "IF_NOT_EXISTS", "LIST_APPEND") and self.peek(1) == ("op", "("):
+            self.take()
+            self.take("(")
+            arguments = [self.operand()]
+            while self.peek() == ("op", ","):
+                self.take()
+                arguments.append(self.operand())
+            self.take(")")
+            return (word.lower(), *arguments)
+
+        return ("path", self.path())
+
+    def path(self) -> Tuple[Tuple[str, str], ...]:
+        elements = [("name", self.take()[1])]
+        while self.peek() in (("op", "."), ("op", "[")):
+            if self.take()[1] == ".":
+                elements.append(("name", self.take()[1]))
+            else:
+                elements.append(("index", int(self.take()[1])))
+                self.take("]")
+        return tuple(elements)
+
+    # ---- update expressions ----
+    def update(self) -> List[Tuple[str, Any, Any]]:
+        actions = []
+        while not self.done():
+            clause = self.take()[1].upper()
+            if clause not in UPDATE_CLAUSES:
+                raise _ExpressionError(f"Unknown update clause {clause}")
+            while True:
+                path = self.path()
+                if clause == "SET":
+                    self.take("=")
+                    actions.append((clause, path, self.operand()))
+                elif clause == "REMOVE":
+                    actions.append((clause, path, None))
+                else:
+                    actions.append((clause, path, self.term()))
+                if self.peek() != ("op", ","):
+                    break
+                self.take()
+        return actions
+
+    def paths(self) -> List[Tuple[Tuple[str, str], ...]]:
+        paths = [self.path()]
+        while self.peek() == ("op", ","):
+            self.take()
+            paths.append(self.path())
+        return paths
+
+
+@lru_cache(maxsize=1024)
+def _parse_condition(expression: str):
+    parser = _Parser(expression)
+    node = parser.condition()
+    if not parser.done():
+        raise _ExpressionError(f"Invalid condition: {expression}")
+    return node
+
+
+@lru_cache(maxsize=1024)
+def _parse_update(expression: str):
+    return _Parser(expression).update()
+
+
+@lru_cache(maxsize=1024)
+def _parse_paths(expression: str):
+    return _Parser(expression).paths()
+
+
+def _type(value: Value) -> str:
+    return next(iter(value))
+
+
+def _plain(value: Value) -> Any:
+    """
+    :return: A comparable python value for a typed scalar or set
+    """
+    value_type = _type(value)
+    if value_type == "N":
+        return Decimal(value["N"])
+    if value_type == "NS":
+        return {Decimal(number) for number in value["NS"]}
+    if value_type in ("SS", "BS"):
+        return set(value[value_type])
+    return value[value_type]
+
+
+def _equal(left: Optional[Value], right: Optional[Value]) -> bool:
+    if left is None or right is None or _type(left) != _type(right):
+        return False
+    value_type = _type(left)
+    if value_type == "L":
+        return len(left["L"]) == len(right["L"]) and all(map(_equal, left["L"], right["L"]))
+    if value_type == "M":
+        return left["M"].keys() == right["M"].keys() and all(_equal(v, right["M"][k]) for k, v in left["M"].items())
+    return _plain(left) == _plain(right)
+
+
+def _ordered(left: Optional[Value], right: Optional[Value]) -> bool:
+    return left is not None and right is not None and _type(left) == _type(right) and _type(left) in ("S", "N", "B")
+
+
+def _size(value: Value) -> int:
+    """
+    :return: The approximate number of bytes DynamoDB bills for a typed value
+    """
+    value_type = _type(value)
+    if value_type == "S":
+        return len(value["S"].encode())
+    if value_type == "N":
+        return len(value["N"]) // 2 + 1
+    if value_type == "B":
+        return len(value["B"])
+    if value_type in SET_TYPES:
+        return sum(_size({value_type[0]: element}) for element in value[value_type])
+    if value_type == "L":
+        return 3 + sum(_size(element) + 1 for element in value["L"])
+    if value_type == "M":
+        return 3 + sum(len(key.encode()) + _size(element) + 1 for key, element in value["M"].items())
+    return 1
+
+
+def _item_size(item: Optional[Item]) -> int:
+    return sum(len(name.encode()) + _size(value) for name, value in (item or {}).items())
+
+
+class _Expression:
+    """
+    Evaluates parsed expressions against an item, resolving the request's placeholders.
+    """
+    def __init__(self, names: Optional[Dict[str, str]], values: Optional[Dict[str, Value]]):
+        self.names = names or {}
+        self.values = values or {}
+
+    def resolve(self, path) -> Path:
+        return tuple((kind, self.names.get(key, key) if kind == "name" else key) for kind, key in path)
+
+    # ---- operands ----
+    def operand(self, node, item: Item) -> Optional[Value]:
+        kind = node[0]
+        if kind == "value":
+            if node[1] not in self.values:
+                raise _ExpressionError(f"An expression attribute value used in expression is not defined: {node[1]}")
+            return self.values[node[1]]
+        if kind == "path":
+            return _get(item, self.resolve(node[1]))
+        if kind == "size":
+            value = self.operand(node[1], item)
+            if value is None:
+                return None
+            value_type = _type(value)
+            length = len(value[value_type].encode()) if value_type == "S" else len(value[value_type])
+            return {"N": str(length)}
+        if kind == "if_not_exists":
+            value = self.operand(node[1], item)
+            return value if value is not None else self.operand(node[2], item)
+        if kind == "list_append":
+            left, right = self.operand(node[1], item), self.operand(node[2], item)
+            if left is None or right is None or _type(left) != "L" or _type(right) != "L":
+                raise _ExpressionError("An operand in the update expression has an incorrect data type")
+            return {"L": copy.deepcopy(left["L"] + right["L"])}
+        if kind in ("+", "-"):
+            left, right = self.operand(node[1], item), self.operand(node[2], item)
+            if left is None or right is None or _type(left) != "N" or _type(right) != "N":
+                raise _ExpressionError("An operand in the update expression has an incorrect data type")
+            result = _plain(left) + _plain(right) if kind == "+" else _plain(left) - _plain(right)
+            return {"N": str(result)}
+        raise _ExpressionError(f"Unsupported operand {kind}")
+
+    # ---- conditions ----
+    def holds(self, node, item: Item) -> bool:
+        kind = node[0]
+        if kind == "and":
+            return self.holds(node[1], item) and self.holds(node[2], item)
+        if kind == "or":
+            return self.holds(node[1], item) or self.holds(node[2], item)
+        if kind == "not":
+            return not self.holds(node[1], item)
+        if kind == "compare":
+            return self._compare(node[1], self.operand(node[2], item), self.operand(node[3], item))
+        if kind == "between":
+            value = self.operand(node[1], item)
+            return self._compare(">=", value, self.operand(node[2], item)) and \
+                self._compare("<=", value, self.operand(node[3], item))
+        if kind == "in":
+            value = self.operand(node[1], item)
+            return any(_equal(value, self.operand(option, item)) for option in node[2])
+        if kind == "function":
+            return self._function(node[1], node[2], item)
+        raise _ExpressionError(f"Unsupported condition {kind}")
+
+    @staticmethod
+    def _compare(operator: str, left: Optional[Value], right: Optional[Value]) -> bool:
+        if operator == "=":
+            return _equal(left, right)
+        if operator == "<>":
+            return left is not None and right is not None and not _equal(left, right)
+        if not _ordered(left, right):
+            return False
+        left, right = _plain(left), _plain(right)
+        return {"<": left < right, "<=": left <= right, ">": left > right, ">=": left >= right}[operator]
+
+    def _function(self, name: str, arguments: list, item: Item) -> bool:
+        value = self.operand(arguments[0], item)
+        if name == "attribute_exists":
+            return value is not None
+        if name == "attribute_not_exists":
+            return value is None
+        argument = self.operand(arguments[1], item)
+        if value is None or argument is None:
+            return False
+        value_type = _type(value)
+        if name == "attribute_type":
+            return value_type == argument["S"]
+        if name == "begins_with":
+            return value_type == _type(argument) and value_type in ("S", "B") and \
+                value[value_type].startswith(argument[value_type])
+        if name == "contains":
+            if value_type == "S":
+                return _type(argument) == "S" and argument["S"] in value["S"]
+            if value_type in SET_TYPES:
+                return _type(argument) == value_type[0] and _plain(argument) in _plain(value)
+            if value_type == "L":
+                return any(_equal(element, argument) for element in value["L"])
+            return False
+        raise _ExpressionError(f"Unsupported function {name}")
+
+    # ---- updates ----
+    def update(self, actions, item: Item) -> List[Path]:
+        """
+        Applies the actions of an update expression to an item, in place.
+        :return: The paths the update touched
+        """
+        source = copy.deepcopy(item)
+        touched: List[Path] = []
+        removals = []
+        for clause, path, node in actions:
+            path = self.resolve(path)
+            if any(path[:len(other)] == other or other[:len(path)] == path for other in touched):
+                raise _ExpressionError("Invalid UpdateExpression: Two document paths overlap with each other")
+            touched.append(path)
+            if clause == "SET":
+                _set(item, path, copy.deepcopy(self.operand(node, source)))
+            elif clause == "REMOVE":
+                removals.append(path)
+            elif clause == "ADD":
+                self._add(item, path, self.operand(node, source))
+            elif clause == "DELETE":
+                self._delete(item, path, self.operand(node, source))
+
+        # list elements are removed by their index before the update, so the highest indexes go first
+        for path in sorted(removals, key=lambda p: p[-1][1] if p[-1][0] == "index" else -1, reverse=True):
+            _remove(item, path)
+        return touched
+
+    @staticmethod
+    def _add(item: Item, path: Path, value: Value) -> None:
+        current = _get(item, path)
+        value_type = _type(value)
+        if current is None:
+            _set(item, path, copy.deepcopy(value))
+        elif value_type == "N" and _type(current) == "N":
+            _set(item, path, {"N": str(_plain(current) + _plain(value))})
+        elif value_type in SET_TYPES and _type(current) == value_type:
+            merged = list(current[value_type]) + [e for e in value[value_type] if e not in current[value_type]]
+            _set(item, path, {value_type: merged})
+        else:
+            raise _ExpressionError("An operand in the update expression has an incorrect data type")
+
+    @staticmethod
+    def _delete(item: Item, path: Path, value: Value) -> None:
+        current = _get(item, path)
+        value_type = _type(value)
+        if current is None:
+            return
+        if value_type not in SET_TYPES or _type(current) != value_type:
+            raise _ExpressionError("An operand in the update expression has an incorrect data type")
+        remaining = [element for element in current[value_type] if element not in value[value_type]]
+        if remaining:
+            _set(item, path, {value_type: remaining})
+        else:
+            _remove(item, path)
+
+
+def _get(item: Item, path: Path) -> Optional[Value]:
+    current: Optional[Value] = {"M": item}
+    for kind, key in path:
+        if kind == "name":
+            current = current.get("M", {}).get(key) if "M" in current else None
+        else:
+            elements = current.get("L") if "L" in current else None
+            current = elements[key] if elements is not None and key < len(elements) else None
+        if current is None:
+            return None
+    return current
+
+
+def _set(item: Item, path: Path, value: Value) -> None:
+    parent = _get(item, path[:-1]) if len(path) > 1 else {"M": item}
+    kind, key = path[-1]
+    if parent is None or (kind == "name" and "M" not in parent) or (kind == "index" and "L" not in parent):
+        raise _ExpressionError("The document path provided in the update expression is invalid for update")
+    if kind == "name":
+        parent["M"][key] = value
+    elif key < len(parent["L"]):
+        parent["L"][key] = value
+    else:
+        parent["L"].append(value)
+
+
+def _remove(item: Item, path: Path) -> None:
+    parent = _get(item, path[:-1]) if len(path) > 1 else {"M": item}
+    kind, key = path[-1]
+    if parent is None:
+        return
+    if kind == "name" and "M" in parent:
+        parent["M"].pop(key, None)
+    elif kind == "index" and "L" in parent and key < len(parent["L"]):
+        del parent["L"][key]
+
+
+class _Branch(dict):
+    """
+    An inner node of a projection that is being built.
+    """
+
+
+def _project(item: Item, paths: Iterable[Path]) -> Item:
+    """
+    :return: The parts of the item at the given paths, nested the way DynamoDB returns them
+    """
+    tree = _Branch()
+    for path in paths:
+        value = _get(item, path)
+        if value is None:
+            continue
+        node = tree
+        for element in path[:-1]:
+            node = node.setdefault(element, _Branch())
+            if not isinstance(node, _Branch):
+                break
+        else:
+            node[path[-1]] = copy.deepcopy(value)
+
+    def build(node) -> Value:
+        if not isinstance(node, _Branch):
+            return node
+        if all(kind == "index" for kind, _ in node):
+            return {"L": [build(node[key]) for key in sorted(node, key=lambda element: element[1])]}
+        return {"M": {key: build(child) for (_, key), child in node.items()}}
+
+    return {key: build(child) for (_, key), child in tree.items()}
+
+
+class MemoryConnection(Connection):
+    """
+    A PynamoDB connection that keeps its tables in memory, so the models can run without AWS.
+    It answers the low-level DynamoDB API calls PynamoDB makes- including conditions, update expressions,
+     transactions and queries- with the same responses and errors DynamoDB returns.
+    Each call can be given a latency, which it spends half on its way to the tables and half on its way back.
+     Only applying the call holds the tables, so concurrent calls interleave like they do against DynamoDB.
+    A table can also keep a stream of the changes to its items, for the stream's consumers to be called with.
+    """
+    def __init__(self, latency: float = 0.0):
+        super().__init__(region="local")
+        self.lock = threading.RLock()
+        # the round trip of every call, in seconds
+        self.latency = latency
+        self.items: Dict[str, Dict[Tuple[str, ...], Item]] = {}
+        # the number of calls made to each operation
+        self.calls: Counter = Counter()
+        # the records of the changes to each table with a stream, that were not read yet
+        self.streams: Dict[str, List[Dict[str, Any]]] = {}
+        self.sequence_number = 0
+
+    def add_table(self, meta_table: MetaTable) -> None:
+        """
+        Creates an empty table with the given schema, if it was not created yet.
+        :param meta_table: The table's schema
+        """
+        with self.lock:
+            if meta_table.table_name not in self._tables:
+                self.add_meta_table(meta_table)
+            self.items.setdefault(meta_table.table_name, {})
+
+    def reset(self) -> None:
+        """
+        Deletes all the items from all the tables, and resets the call counters and the latency.
+        """
+        with self.lock:
+            for table in self.items.values():
+                table.clear()
+            for records in self.streams.values():
+                records.clear()
+            self.calls.clear()
+            self.latency = 0.0
+
+    def enable_stream(self, table_name: str) -> None:
+        """
+        Keeps a stream of the changes to the items of the given table, like a DynamoDB stream with a NEW_IMAGE view.
+        :param table_name: The name of a table of this connection
+        """
+        with self.lock:
+            self.streams.setdefault(table_name, [])
+
+    def read_stream(self, table_name: str) -> List[Dict[str, Any]]:
+        """
+        :param table_name: The name of a table with a stream
+        :return: The records of the changes to the table's items since the stream was last read, in order,
+         as DynamoDB delivers them to the stream's consumers
+        """
+        with self.lock:
+            records = list(self.streams[table_name])
+            self.streams[table_name].clear()
+            return records
+
+    def table(self, table_name: str) -> "MemoryTable":
+        """
+        :param table_name: The name of a table of this connection
+        :return: A boto3-like handle for reading and writing the table's items directly
+        """
+        return MemoryTable(self, table_name)
+
+    def _make_api_call(self, operation_name: str, operation_kwargs: Dict,
+                       settings: OperationSettings = OperationSettings.default) -> Dict:
+        operation = OPERATIONS.get(operation_name)
+        if operation is None:
+            self._raise(operation_name, operation_kwargs, VALIDATION_ERROR, f"{operation_name} is not supported")
+
+        self._travel()
+        try:
+            return self._apply(operation_name, operation, operation_kwargs)
+
+        finally:
+            self._travel()
+
+    def _travel(self) -> None:
+        # half of a call's round trip
+        if self.latency > 0:
+            time.sleep(self.latency / 2)
+
+    def _apply(self, operation_name: str, operation: str, operation_kwargs: Dict) -> Dict:
+        # errors are raised the way DynamoDB's responses are turned into errors by PynamoDB
+        with self.lock:
+            self.calls[operation_name] += 1
+            try:
+                return getattr(self, operation)(operation_kwargs)
+
+            except _ConditionFailed:
+                self._raise(operation_name, operation_kwargs, CONDITIONAL_CHECK_FAILED,
+                            "The conditional request failed")
+
+            except _TransactionCanceled as e:
+                self._raise(operation_name, operation_kwargs, TRANSACTION_CANCELED,
+                            "Transaction cancelled, please refer cancellation reasons for specific reasons "
+                            f"[{', '.join(e.reasons)}]")
+
+            except _MissingTable as e:
+                self._raise(operation_name, operation_kwargs, RESOURCE_NOT_FOUND,
+                            f"Requested resource not found: Table: {e} not found")
+
+            except _ExpressionError as e:
+                self._raise(operation_name, operation_kwargs, VALIDATION_ERROR, str(e))
+
+    @staticmethod
+    def _raise(operation_name: str, operation_kwargs: Dict, code: str, message: str) -> None:
+        error = {'Error': {'Message': message, 'Code': code}}
+        raise VerboseClientError(error, operation_name, {'table_name': operation_kwargs.get('TableName')})
+
+    # ---- tables and keys ----
+    def _table(self, table_name: str) -> Dict[Tuple[str, ...], Item]:
+        if table_name not in self.items:
+            raise _MissingTable(table_name)
+        return self.items[table_name]
+
+    def _key_names(self, table_name: str, index_name: Optional[str] = None) -> List[str]:
+        meta_table = self._tables[table_name]
+        if index_name:
+            names = [meta_table.get_index_hash_keyname(index_name), meta_table.get_index_range_keyname(index_name)]
+        else:
+            names = [meta_table.hash_keyname, meta_table.range_keyname]
+        return [name for name in names if name]
+
+    def _key(self, table_name: str, item: Item) -> Tuple[str, ...]:
+        try:
+            return tuple(json.dumps(item[name], sort_keys=True) for name in self._key_names(table_name))
+        except KeyError:
+            raise _ExpressionError("The provided key element does not match the schema")
+
+    def _key_of(self, table_name: str, item: Item, index_name: Optional[str] = None) -> Item:
+        names = self._key_names(table_name) + (self._key_names(table_name, index_name) if index_name else [])
+        return {name: copy.deepcopy(item[name]) for name in names}
+
+    # ---- capacity ----
+    @staticmethod
+    def _capacity(kwargs: Dict, table_name: str, units: float) -> Dict:
+        if kwargs.get('ReturnConsumedCapacity', 'NONE') == 'NONE':
+            return {}
+        return {'ConsumedCapacity': {'TableName': table_name, 'CapacityUnits': units}}
+
+    @staticmethod
+    def _capacities(kwargs: Dict, units: Dict[str, float]) -> Dict:
+        # operations spanning tables report the capacity consumed in each of them
+        if kwargs.get('ReturnConsumedCapacity', 'NONE') == 'NONE':
+            return {}
+        return {'ConsumedCapacity': [{'TableName': name, 'CapacityUnits': total} for name, total in units.items()]}
+
+    @staticmethod
+    def _read_units(item: Optional[Item], consistent: bool) -> float:
+        units = max(1, math.ceil(_item_size(item) / 4096))
+        return units if consistent else units / 2
+
+    @staticmethod
+    def _write_units(*items: Optional[Item]) -> float:
+        return max(1, max(math.ceil(_item_size(item) / 1024) for item in items))
+
+    # ---- single item operations ----
+    def _condition_holds(self, kwargs: Dict, item: Optional[Item]) -> bool:
+        condition = kwargs.get('ConditionExpression')
+        if not condition:
+            return True
+        expression = _Expression(kwargs.get('ExpressionAttributeNames'), kwargs.get('ExpressionAttributeValues'))
+        return expression.holds(_parse_condition(condition), item or {})
+
+    def _projected(self, kwargs: Dict, item: Item) -> Item:
+        projection = kwargs.get('ProjectionExpression')
+        if not projection:
+            return copy.deepcopy(item)
+        expression = _Expression(kwargs.get('ExpressionAttributeNames'), None)
+        return _project(item, [expression.resolve(path) for path in _parse_paths(projection)])
+
+    def _describe_table(self, kwargs: Dict) -> Dict:
+        table_name = kwargs['TableName']
+        if table_name not in self._tables:
+            raise _MissingTable(table_name)
+        return {'Table': self._tables[table_name].data}
+
+    def _get_item(self, kwargs: Dict) -> Dict:
+        table_name = kwargs['TableName']
+        item = self._table(table_name).get(self._key(table_name, kwargs['Key']))
+        response = self._capacity(kwargs, table_name, self._read_units(item, kwargs.get('ConsistentRead', False)))
+        if item is not None:
+            projected = self._projected(kwargs, item)
+            if projected:
+                response['Item'] = projected
+        return response
+
+    def _put_item(self, kwargs: Dict) -> Dict:
+        table_name = kwargs['TableName']
+        table = self._table(table_name)
+        key = self._key(table_name, kwargs['Item'])
+        old = table.get(key)
+        if not self._condition_holds(kwargs, old):
+            raise _ConditionFailed()
+        table[key] = copy.deepcopy(kwargs['Item'])
+        self._record(table_name, old, table[key])
+        return self._write_response(kwargs, table_name, old, table[key], None)
+
+    def _update_item(self, kwargs: Dict) -> Dict:
+        table_name = kwargs['TableName']
+        table = self._table(table_name)
+        key = self._key(table_name, kwargs['Key'])
+        old = table.get(key)
+        if not self._condition_holds(kwargs, old):
+            raise _ConditionFailed()
+
+        new = copy.deepcopy(old) if old is not None else copy.deepcopy(kwargs['Key'])
+        touched = []
+        if kwargs.get('UpdateExpression'):
+            expression = _Expression(kwargs.get('ExpressionAttributeNames'), kwargs.get('ExpressionAttributeValues'))
+            touched = expression.update(_parse_update(kwargs['UpdateExpression']), new)
+        if self._key(table_name, new) != key:
+            raise _ExpressionError("Cannot update attribute in the key")
+        table[key] = new
+        self._record(table_name, old, new)
+        return self._write_response(kwargs, table_name, old, new, touched)
+
+    def _delete_item(self, kwargs: Dict) -> Dict:
+        table_name = kwargs['TableName']
+        table = self._table(table_name)
+        key = self._key(table_name, kwargs['Key'])
+        old = table.get(key)
+        if not self._condition_holds(kwargs, old):
+            raise _ConditionFailed()
+        table.pop(key, None)
+        self._record(table_name, old, None)
+        return self._write_response(kwargs, table_name, old, None, None)
+
+    def _record(self, table_name: str, old: Optional[Item], new: Optional[Item]) -> None:
+        # like DynamoDB, a write that left the item as it was is not streamed
+        records = self.streams.get(table_name)
+        if records is None or old == new:
+            return
+        self.sequence_number += 1
+        record: Dict[str, Any] = {
+            'eventID': str(self.sequence_number),
+            'eventName': "INSERT" if old is None else "MODIFY" if new is not None else "REMOVE",
+            'eventSource': "aws:dynamodb",
+            'dynamodb': {
+                'Keys': self._key_of(table_name, new if new is not None else old),
+                'SequenceNumber': str(self.sequence_number),
+                'StreamViewType': "NEW_IMAGE",
+            },
+        }
+        if new is not None:
+            record['dynamodb']['NewImage'] = copy.deepcopy(new)
+        records.append(record)
+
+    def _write_response(self, kwargs: Dict, table_name: str, old: Optional[Item], new: Optional[Item],
+                        touched: Optional[List[Path]]) -> Dict:
+        response = self._capacity(kwargs, table_name, self._write_units(old, new))
+        return_values = kwargs.get('ReturnValues', 'NONE')
+        if return_values == 'ALL_OLD' and old:
+            response['Attributes'] = copy.deepcopy(old)
+        elif return_values == 'ALL_NEW' and new:
+            response['Attributes'] = copy.deepcopy(new)
+        elif return_values in ('UPDATED_OLD', 'UPDATED_NEW'):
+            source = old if return_values == 'UPDATED_OLD' else new
+            attributes = _project(source or {}, touched or [])
+            if attributes:
+                response['Attributes'] = attributes
+        return response
+
+    # ---- batches and transactions ----
+    def _batch_get_item(self, kwargs: Dict) -> Dict:
+        responses: Dict[str, List[Item]] = {}
+        units: Dict[str, float] = defaultdict(float)
+        for table_name, request in kwargs['RequestItems'].items():
+            table = self._table(table_name)
+            items = [table.get(self._key(table_name, key)) for key in request['Keys']]
+            responses[table_name] = [self._projected(request, item) for item in items if item is not None]
+            units[table_name] += sum(self._read_units(item, request.get('ConsistentRead', False)) for item in items)
+        return {'Responses': responses, 'UnprocessedKeys': {}, **self._capacities(kwargs, units)}
+
+    def _batch_write_item(self, kwargs: Dict) -> Dict:
+        units: Dict[str, float] = defaultdict(float)
+        for table_name, requests in kwargs['RequestItems'].items():
+            table = self._table(table_name)
+            for request in requests:
+                if 'PutRequest' in request:
+                    item = request['PutRequest']['Item']
+                    old = table.get(self._key(table_name, item))
+                    table[self._key(table_name, item)] = copy.deepcopy(item)
+                    self._record(table_name, old, item)
+                    units[table_name] += self._write_units(old, item)
+                else:
+                    old = table.pop(self._key(table_name, request['DeleteRequest']['Key']), None)
+                    self._record(table_name, old, None)
+                    units[table_name] += self._write_units(old)
+        return {'UnprocessedItems': {}, **self._capacities(kwargs, units)}
+
+    def _transact_get_items(self, kwargs: Dict) -> Dict:
+        responses = []
+        units: Dict[str, float] = defaultdict(float)
+        for operation in kwargs['TransactItems']:
+            request = operation['Get']
+            item = self._table(request['TableName']).get(self._key(request['TableName'], request['Key']))
+            responses.append({'Item': self._projected(request, item)} if item is not None else {})
+            # transactional reads cost twice as much as strongly consistent ones
+            units[request['TableName']] += 2 * self._read_units(item, True)
+        return {'Responses': responses, **self._capacities(kwargs, units)}
+
+    def _transact_write_items(self, kwargs: Dict) -> Dict:
+        operations = []
+        for operation in kwargs['TransactItems']:
+            (kind, request), = operation.items()
+            table_name = request['TableName']
+            key = self._key(table_name, request['Item'] if kind == 'Put' else request['Key'])
+            if (table_name, key) in [(t, k) for _, _, t, k in operations]:
+                raise _ExpressionError("Transaction request cannot include multiple operations on one item")
+            operations.append((kind, request, table_name, key))
+
+        # every condition is checked before any item is written, so the transaction is all or nothing
+        reasons = [
+            'None' if self._condition_holds(request, self._table(table_name).get(key)) else 'ConditionalCheckFailed'
+            for _, request, table_name, key in operations
+        ]
+        if 'ConditionalCheckFailed' in reasons:
+            raise _TransactionCanceled(reasons)
+
+        units: Dict[str, float] = defaultdict(float)
+        for kind, request, table_name, key in operations:
+            old = self._table(table_name).get(key)
+            request = {**request, 'ConditionExpression': None}
+            if kind == 'Put':
+                self._put_item(request)
+            elif kind == 'Update':
+                self._update_item(request)
+            elif kind == 'Delete':
+                self._delete_item(request)
+            # transactional writes cost twice as much as standard ones, condition checks as much as a write
+            units[table_name] += 2 * self._write_units(old, self._table(table_name).get(key))
+        return self._capacities(kwargs, units)
+
+    # ---- queries ----
+    def _query(self, kwargs: Dict) -> Dict:
+        return self._read_many(kwargs, kwargs.get('KeyConditionExpression'))
+
+    def _scan(self, kwargs: Dict) -> Dict:
+        return self._read_many(kwargs, None)
+
+    def _read_many(self, kwargs: Dict, key_condition: Optional[str]) -> Dict:
+        table_name = kwargs['TableName']
+        index_name = kwargs.get('IndexName')
+        index_keys = self._key_names(table_name, index_name)
+        expression = _Expression(kwargs.get('ExpressionAttributeNames'), kwargs.get('ExpressionAttributeValues'))
+
+        items = [item for item in self._table(table_name).values() if all(name in item for name in index_keys)]
+        if key_condition:
+            condition = _parse_condition(key_condition)
+            items = [item for item in items if expression.holds(condition, item)]
+            if len(index_keys) > 1:
+                items.sort(key=lambda item: _plain(item[index_keys[1]]), reverse=not kwargs.get('ScanIndexForward', True))
+
+        start_key = kwargs.get('ExclusiveStartKey')
+        if start_key:
+            start = self._key(table_name, start_key)
+            positions = [i for i, item in enumerate(items) if self._key(table_name, item) == start]
+            items = items[positions[0] + 1:] if positions else items
+
+        last_key = None
+        limit = kwargs.get('Limit')
+        if limit is not None and len(items) > limit:
+            items = items[:limit]
+            last_key = self._key_of(table_name, items[-1], index_name)
+
+        scanned = len(items)
+        if kwargs.get('FilterExpression'):
+            condition = _parse_condition(kwargs['FilterExpression'])
+            items = [item for item in items if expression.holds(condition, item)]
+
+        response = {'Count': len(items), 'ScannedCount': scanned}
+        units = max(1, math.ceil(sum(map(_item_size, items)) / 4096))
+        response.update(self._capacity(kwargs, table_name, units if kwargs.get('ConsistentRead') else units / 2))
+        if kwargs.get('Select') != 'COUNT':
+            response['Items'] = [self._projected(kwargs, item) for item in items]
+        if last_key is not None:
+            response['LastEvaluatedKey'] = last_key
+        return response
+
+
+class MemoryTable:
+    """
+    A handle for reading and writing a memory table with plain python values, like boto3's Table resource.
+    """
+    def __init__(self, connection: MemoryConnection, table_name: str):
+        self.connection = connection
+        self.table_name = table_name
+        self._serializer = TypeSerializer()
+        self._deserializer = TypeDeserializer()
+
+    def _serialize(self, values: Optional[Dict[str, Any]]) -> Optional[Item]:
+        if values is None:
+            return None
+        return {key: self._serializer.serialize(value) for key, value in values.items()}
+
+    def _deserialize(self, item: Item) -> Dict[str, Any]:
+        return {key: self._deserializer.deserialize(value) for key, value in item.items()}
+
+    def _call(self, operation_name: str, **kwargs) -> Dict:
+        kwargs = {key: value for key, value in kwargs.items() if value is not None}
+        return self.connection.dispatch(operation_name, {'TableName': self.table_name, **kwargs})
+
+    def put_item(self, Item: Dict[str, Any], **kwargs) -> Dict:
+        return self._call('PutItem', Item=self._serialize(Item), **kwargs)
+
+    def get_item(self, Key: Dict[str, Any], **kwargs) -> Dict:
+        response = self._call('GetItem', Key=self._serialize(Key), **kwargs)
+        if 'Item' in response:
+            response['Item'] = self._deserialize(response['Item'])
+        return response
+
+    def update_item(self, Key: Dict[str, Any], ExpressionAttributeValues: Optional[Dict[str, Any]] = None,
+                    **kwargs) -> Dict:
+        return self._call('UpdateItem', Key=self._serialize(Key),
+                          ExpressionAttributeValues=self._serialize(ExpressionAttributeValues), **kwargs)
+
+    def delete_item(self, Key: Dict[str, Any], **kwargs) -> Dict:
+        return self._call('DeleteItem', Key=self._serialize(Key), **kwargs)
+
+    def scan(self, **kwargs) -> Dict:
+        response = self._call('Scan', **kwargs)
+        response['Items'] = [self._deserialize(item) for item in response.get('Items', [])]
+        return response
+
+    def query(self, ExpressionAttributeValues: Optional[Dict[str, Any]] = None, **kwargs) -> Dict:
+        response = self._call('Query', ExpressionAttributeValues=self._serialize(ExpressionAttributeValues), **kwargs)
+        response['Items'] = [self._deserialize(item) for item in response.get('Items', [])]
+        return response
+
+    def batch_writer(self) -> "MemoryTable":
+        return self
+
+    def __enter__(self) -> "MemoryTable":
+        return self
+
+    def __exit__(self, *_) -> None:
+        return None
+
+
+def use_memory_backend(*models: Type[Model], connection: Optional[MemoryConnection] = None) -> MemoryConnection:
+    """
+    Points the given models at an in-memory backend, creating their tables in it.
+    :param models: The model classes to serve from memory
+    :param connection: A memory connection to share, or None to create a new one
+    :return: The memory connection now used by the models
+    """
+    connection = connection or MemoryConnection()
+    for model in models:
+        table_connection = model._get_connection()
+        connection.add_table(table_connection.get_meta_table())
+        table_connection.connection = connection
+    return connection
+
+
+def use_live_backend(*models: Type[Model]) -> None:
+    """
+    Points the given models back at DynamoDB.
+    :param models: The model classes to serve from DynamoDB
+    """
+    for model in models:
+        model._connection = None
@@ -0,0 +1,38 @@
+from typing import Dict, Any, Optional
+
+
+def game_etag(created_at: Optional[int], version: Optional[int]) -> str:
+    """
+    Builds the ETag of a game from its creation time and version.
+    The PIN of an ended game is reused by new games, whose versions start over, so the version alone
+     would give different games the same ETag.
+    :param created_at: The game's creation time, None for games saved before it was kept
+    :param version: The game's version, None for games saved before versions were introduced
+    :return: A quoted ETag header value
+    """
+    return f'"{int(created_at or 0)}-{int(version or 0)}"'
+
+
+def etag_matches(event: Dict[str, Any], etag: str) -> bool:
+    """
+    Checks whether a request's If-None-Match header already names the given ETag.
+    :param event: An event containing a REST API request
+    :param etag: The current ETag of the requested resource
+    :return: True if the client's copy is up to date
+    """
+    headers = event.get('headers') or {}
+    if_none_match = headers.get('if-none-match') or headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        # weak comparison, as in RFC 7232
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+
+    return False
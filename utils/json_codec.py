@@ -0,0 +1,68 @@
+import functools
+import json
+import os
+from typing import Any, Callable, NamedTuple, Optional, Union
+
+
+class JsonCodec(NamedTuple):
+    """
+    A JSON encoder and decoder pair, so a faster implementation can replace the standard library's.
+    """
+    name: str
+    loads: Callable[[Union[str, bytes]], Any]
+    dumps: Callable[[Any], str]
+
+
+# compact, and without escaping non-ASCII words, so responses with long word and player lists stay small
+STANDARD_CODEC = JsonCodec("json", json.loads, functools.partial(json.dumps, separators=(",", ":"),
+                                                                   ensure_ascii=False))
+
+
+def orjson_codec() -> Optional[JsonCodec]:
+    """
+    :return: A codec using orjson, or None if it is not installed
+    """
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return JsonCodec("orjson", orjson.loads, lambda value: orjson.dumps(value).decode())
+
+
+def _default_codec() -> JsonCodec:
+    # the standard library's codec is the default, since importing orjson adds to every cold start.
+    # JSON_CODEC=orjson switches to orjson, for containers serving games with long word and player lists
+    if os.environ.get("JSON_CODEC", STANDARD_CODEC.name) != "orjson":
+        return STANDARD_CODEC
+
+    codec = orjson_codec()
+    if codec is None:
+        print("JSON_CODEC is orjson, but orjson is not installed. Using the standard library's codec")
+        return STANDARD_CODEC
+    return codec
+
+
+_codec = _default_codec()
+
+
+def use_codec(codec: JsonCodec) -> None:
+    """
+    Makes the handlers decode requests and encode responses with the given codec.
+    """
+    global _codec
+    _codec = codec
+
+
+def current_codec() -> JsonCodec:
+    return _codec
+
+
+def loads(text: Union[str, bytes]) -> Any:
+    """
+    :raises ValueError: if the text is not valid JSON
+    """
+    return _codec.loads(text)
+
+
+def dumps(value: Any) -> str:
+    return _codec.dumps(value)
@@ -1,4 +1,16 @@
-import json
+import re
+
+from utils import json_codec
+
+CONDITIONAL_CHECK_FAILED = "ConditionalCheckFailedException"
+TRANSACTION_CANCELED = "TransactionCanceledException"
+# the per-item reasons of a cancelled transaction
+CONDITIONAL_CHECK_FAILED_REASON = "ConditionalCheckFailed"
+TRANSACTION_CONFLICT = "TransactionConflict"
+NO_REASON = "None"
+# PynamoDB 5.3 drops the structured reasons from the error it raises, leaving only its message-
+# "Transaction cancelled, please refer cancellation reasons for specific reasons [None, ConditionalCheckFailed]"
+CANCELLATION_REASONS_MESSAGE_PATTERN = re.compile(r"reasons \[([A-Za-z]+(?:, [A-Za-z]+)*)\]$")
 
 
 class LambdaExceptionHandler:
@@ -15,5 +27,50 @@ class LambdaExceptionHandler:
         """
         return {
             'statusCode': error_code,
-            'body': json.dumps({'error': error_message})
+            'body': json_codec.dumps({'error': error_message})
         }
+
+    @staticmethod
+    def is_condition_failure(error):
+        """
+        Checks whether a PynamoDB error was caused by a failed condition expression.
+        :param error: The PynamoDB exception raised by a conditional write
+        :return: True if DynamoDB rejected the write because its condition was not met
+        """
+        return getattr(error, 'cause_response_code', None) == CONDITIONAL_CHECK_FAILED
+
+    @staticmethod
+    def cancellation_reasons(error):
+        """
+        Lists the reasons DynamoDB gave for cancelling a write transaction, one per item in the transaction.
+        DynamoDB lists the items in the order it received them-
+         with PynamoDB's TransactWrite that is condition checks, then deletes, then saves, then updates.
+        The reasons are read from the CancellationReasons of the wrapped botocore error's response,
+         or from the error's message if the PynamoDB version in use did not keep them.
+        :param error: The PynamoDB exception raised by a write transaction
+        :return: The reason codes, 'None' for items that did not cause the cancellation.
+         An empty list if the transaction was not cancelled
+        """
+        if getattr(error, 'cause_response_code', None) != TRANSACTION_CANCELED:
+            return []
+
+        reasons = getattr(error.cause, 'response', {}).get('CancellationReasons')
+        if reasons is not None:
+            return [reason.get('Code') or NO_REASON for reason in reasons]
+
+        match = CANCELLATION_REASONS_MESSAGE_PATTERN.search(error.cause_response_message or '')
+        if not match:
+            return []
+
+        return match.group(1).split(', ')
+
+    @staticmethod
+    def failed_conditions(error):
+        """
+        Tells which items of a cancelled write transaction failed their condition.
+        :param error: The PynamoDB exception raised by a write transaction
+        :return: For each item in the transaction, whether its condition failed.
+         An empty list if the transaction was not cancelled
+        """
+        return [reason == CONDITIONAL_CHECK_FAILED_REASON
+                for reason in LambdaExceptionHandler.cancellation_reasons(error)]
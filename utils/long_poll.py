@@ -0,0 +1,84 @@
+import os
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+T = TypeVar('T')
+
+# upper bound for a single long-poll, kept below the lambdas' 25 seconds timeout
+LONG_POLL_MAX_SECONDS = float(os.environ.get("LONG_POLL_MAX_SECONDS", "20"))
+# time kept aside for building the response once a long-poll is over
+LONG_POLL_SAFETY_MARGIN_SECONDS = 1.0
+# re-checks start frequent and back off, but never get further apart than the max interval
+LONG_POLL_INITIAL_INTERVAL_SECONDS = float(os.environ.get("LONG_POLL_INITIAL_INTERVAL_SECONDS", "0.1"))
+LONG_POLL_MAX_INTERVAL_SECONDS = float(os.environ.get("LONG_POLL_MAX_INTERVAL_SECONDS", "0.5"))
+LONG_POLL_BACKOFF_FACTOR = 1.5
+
+
+def requested_wait(query_parameters: Dict[str, str], context: Any) -> float:
+    """
+    Reads how long a request is willing to wait for a change.
+    :param query_parameters: The request's query parameters, which may contain a waitSeconds parameter
+    :param context: The lambda context, used to keep the wait within the invocation's remaining time
+    :return: The number of seconds to wait, 0 if the request does not ask to wait
+    :raises ValueError: if waitSeconds is not a non-negative number
+    """
+    wait_seconds = query_parameters.get("waitSeconds")
+    if not wait_seconds:
+        return 0.0
+
+    try:
+        wait = float(wait_seconds)
+    except ValueError:
+        wait = -1.0
+    if not wait >= 0:
+        raise ValueError(f"waitSeconds must be a non-negative number, got {wait_seconds}")
+
+    wait = min(wait, LONG_POLL_MAX_SECONDS)
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        remaining = context.get_remaining_time_in_millis() / 1000 - LONG_POLL_SAFETY_MARGIN_SECONDS
+        wait = min(wait, max(remaining, 0.0))
+
+    return wait
+
+
+def wait_for_change(fetch: Callable[[], T], has_changed: Callable[[T], bool], timeout: float,
+                    sleep: Callable[[float], None] = time.sleep,
+                    clock: Callable[[], float] = time.monotonic) -> T:
+    """
+    Fetches a value, and re-fetches it with a growing interval until it changes or the timeout passes.
+    :param fetch: Fetches the current value
+    :param has_changed: Tells whether a fetched value differs from what the caller already has
+    :param timeout: The maximal number of seconds to wait for a change
+    :param sleep: Sleeps for the given number of seconds
+    :param clock: Returns a monotonic time in seconds
+    :return: The first changed value, or the last fetched value if nothing changed in time
+    """
+    deadline = clock() + timeout
+    interval = LONG_POLL_INITIAL_INTERVAL_SECONDS
+    value = fetch()
+
+    while not has_changed(value):
+        remaining = deadline - clock()
+        if remaining <= 0:
+            break
+        sleep(min(interval, remaining))
+        interval = min(interval * LONG_POLL_BACKOFF_FACTOR, LONG_POLL_MAX_INTERVAL_SECONDS)
+        value = fetch()
+
+    return value
+
+
+def parse_known_version(query_parameters: Dict[str, str]) -> Optional[int]:
+    """
+    Reads the game version the caller has last seen.
+    :param query_parameters: The request's query parameters, which may contain a knownVersion parameter
+    :return: The version, or None if it was not given
+    :raises ValueError: if knownVersion is not an integer
+    """
+    known_version = query_parameters.get("knownVersion")
+    if known_version is None or known_version == "":
+        return None
+    try:
+        return int(known_version)
+    except ValueError:
+        raise ValueError(f"knownVersion must be an integer, got {known_version}")
@@ -0,0 +1,166 @@
+import contextvars
+import functools
+import json
+import os
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Union
+
+Handler = Callable[[Dict[str, Any], Any], Dict[str, Any]]
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "Pitkiot")
+# the metrics of a record, and their CloudWatch units. The record's other fields are searchable properties
+METRIC_UNITS = {
+    'Latency': "Milliseconds",
+    'ColdStart': "Count",
+    'ClientErrors': "Count",
+    'ServerErrors': "Count",
+    'DynamoDBCalls': "Count",
+    'DynamoDBLatency': "Milliseconds",
+    'ConsumedCapacity': "Count",
+    'RequestBytes': "Bytes",
+    'ResponseBytes': "Bytes",
+}
+DIMENSION = "Endpoint"
+
+
+class Invocation:
+    """
+    The measurements of a single handler invocation.
+    """
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.dynamodb_calls: Counter = Counter()
+        self.dynamodb_seconds = 0.0
+        self.consumed_capacity = 0.0
+
+    def record_dynamodb_call(self, operation_name: str, seconds: float, response: Optional[Dict[str, Any]]) -> None:
+        self.dynamodb_calls[operation_name] += 1
+        self.dynamodb_seconds += seconds
+        self.consumed_capacity += _capacity_units((response or {}).get('ConsumedCapacity'))
+
+
+# the invocation running in the current thread, if any
+_current_invocation: "contextvars.ContextVar[Optional[Invocation]]" = contextvars.ContextVar(
+    "current_invocation", default=None)
+_cold_start = True
+_dynamodb_instrumented = False
+
+
+def instrumented(endpoint: str) -> Callable[[Handler], Handler]:
+    """
+    Wraps a lambda handler so every invocation prints a CloudWatch Embedded Metric Format record-
+     its latency, cold start, status code, payload sizes and DynamoDB calls, latency and consumed capacity,
+     with the endpoint as the dimension.
+    A handler invoked by another instrumented handler, like the router's, adds to its caller's record
+     and names its endpoint, instead of printing a record of its own.
+    :param endpoint: The name of the handler's endpoint
+    :return: A decorator for the handler
+    """
+    def decorator(handler: Handler) -> Handler:
+        @functools.wraps(handler)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            outer = _current_invocation.get()
+            if outer is not None:
+                outer.endpoint = endpoint
+                return handler(event, context)
+
+            if not METRICS_ENABLED:
+                return handler(event, context)
+
+            global _cold_start
+            cold_start, _cold_start = _cold_start, False
+
+            invocation = Invocation(endpoint)
+            token = _current_invocation.set(invocation)
+            start = time.perf_counter()
+            try:
+                response = handler(event, context)
+            except Exception:
+                _emit(invocation, event, context, time.perf_counter() - start, cold_start, None)
+                raise
+            finally:
+                _current_invocation.reset(token)
+
+            _emit(invocation, event, context, time.perf_counter() - start, cold_start, response)
+            return response
+        return wrapper
+    return decorator
+
+
+def instrument_dynamodb() -> None:
+    """
+    Makes PynamoDB's connections report every call to the invocation running in their thread.
+    Called once, by the module of the game's header, so the handlers' validation paths don't import PynamoDB for it.
+    Calling it again does nothing, so a call never counts a DynamoDB call twice.
+    """
+    global _dynamodb_instrumented
+    if _dynamodb_instrumented:
+        return
+    _dynamodb_instrumented = True
+
+    from pynamodb.connection.base import Connection
+
+    dispatch = Connection.dispatch
+
+    @functools.wraps(dispatch)
+    def instrumented_dispatch(self, operation_name: str, operation_kwargs: Dict, *args, **kwargs) -> Dict:
+        invocation = _current_invocation.get()
+        if invocation is None:
+            return dispatch(self, operation_name, operation_kwargs, *args, **kwargs)
+
+        start = time.perf_counter()
+        response = None
+        try:
+            response = dispatch(self, operation_name, operation_kwargs, *args, **kwargs)
+            return response
+        finally:
+            invocation.record_dynamodb_call(operation_name, time.perf_counter() - start, response)
+
+    Connection.dispatch = instrumented_dispatch
+
+
+def _capacity_units(consumed_capacity: Union[None, Dict[str, Any], List[Dict[str, Any]]]) -> float:
+    # transactions and batches report the capacity of each table they touched
+    if isinstance(consumed_capacity, list):
+        return sum(_capacity_units(capacity) for capacity in consumed_capacity)
+    if isinstance(consumed_capacity, dict):
+        return float(consumed_capacity.get('CapacityUnits') or 0)
+    return 0.0
+
+
+def _body_bytes(message: Dict[str, Any]) -> int:
+    # a body is a string, whose size is that of its UTF-8 encoding. A base64 encoded body is all ASCII
+    body = message.get('body') or ''
+    return len(body) if message.get('isBase64Encoded') else len(body.encode('utf-8'))
+
+
+def _emit(invocation: Invocation, event: Dict[str, Any], context: Any, seconds: float, cold_start: bool,
+          response: Optional[Dict[str, Any]]) -> None:
+    # a handler that raised is reported as the 502 its caller gets
+    status_code = 502 if response is None else response.get('statusCode', 200)
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [[DIMENSION]],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, unit in METRIC_UNITS.items()],
+            }],
+        },
+        DIMENSION: invocation.endpoint,
+        'Latency': round(seconds * 1000, 3),
+        'ColdStart': int(cold_start),
+        'ClientErrors': int(400 <= status_code < 500),
+        'ServerErrors': int(status_code >= 500),
+        'DynamoDBCalls': sum(invocation.dynamodb_calls.values()),
+        'DynamoDBLatency': round(invocation.dynamodb_seconds * 1000, 3),
+        'ConsumedCapacity': invocation.consumed_capacity,
+        'RequestBytes': _body_bytes(event),
+        'ResponseBytes': _body_bytes(response or {}),
+        'StatusCode': status_code,
+        'DynamoDBOperations': dict(invocation.dynamodb_calls),
+        'RequestId': getattr(context, 'aws_request_id', None),
+    }
+    print(json.dumps(record))
@@ -0,0 +1,86 @@
+import base64
+import binascii
+import bisect
+import json
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# a request without a limit gets pages of the maximal size, so responses stay bounded however large the game is
+MAX_PAGE_LIMIT = int(os.environ.get("MAX_PAGE_LIMIT", "500"))
+
+
+class Page(NamedTuple):
+    """
+    A page a request asks for- at most limit entries, starting after the entry named by the request's cursor.
+    """
+    limit: int
+    after: Optional[str]
+
+
+def parse_page(query_parameters: Dict[str, str]) -> Page:
+    """
+    Reads the page a request asks for.
+    :param query_parameters: The request's query parameters, which may contain a limit and a cursor parameter
+    :return: The page, starting from the first entry if no cursor was given
+    :raises ValueError: if limit is not a positive integer, or cursor is not a cursor this module made
+    """
+    limit = query_parameters.get("limit")
+    if limit is None or limit == "":
+        limit = MAX_PAGE_LIMIT
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            raise ValueError(f"limit must be a positive integer, got {query_parameters['limit']}")
+
+    cursor = query_parameters.get("cursor")
+    return Page(min(limit, MAX_PAGE_LIMIT), decode_cursor(cursor) if cursor else None)
+
+
+def encode_cursor(last: str) -> str:
+    """
+    :param last: The last entry of a page
+    :return: An opaque cursor for the page that follows it
+    """
+    return base64.urlsafe_b64encode(json.dumps({'after': last}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    """
+    :param cursor: A cursor made by encode_cursor
+    :return: The entry the cursor's page starts after
+    :raises ValueError: if the cursor was not made by encode_cursor
+    """
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))['after']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        after = None
+    if not isinstance(after, str):
+        raise ValueError("cursor is invalid")
+    return after
+
+
+def paginate(entries: Iterable[str], page: Page) -> Tuple[List[str], Optional[str]]:
+    """
+    Cuts a page out of a collection of entries, ordered by their text.
+    The order doesn't depend on when the entries were added, so pages stay consistent as entries are added-
+     an entry added behind the cursor is only missed by the pages already fetched.
+    :param entries: All of the collection's entries
+    :param page: The page to cut
+    :return: The page's entries, and the cursor of the next page, or None if this page is the last
+    """
+    ordered = sorted(entries)
+    start = bisect.bisect_right(ordered, page.after) if page.after is not None else 0
+    entries = ordered[start:start + page.limit]
+    return entries, next_cursor(entries, start + page.limit < len(ordered))
+
+
+def next_cursor(entries: List[str], has_more: bool) -> Optional[str]:
+    """
+    :param entries: The entries of a page, in order
+    :param has_more: Whether there are entries after the page's
+    :return: The cursor of the next page, or None if this page is the last
+    """
+    return encode_cursor(entries[-1]) if has_more and entries else None
@@ -0,0 +1,96 @@
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+
+# the management endpoint of the game's WebSocket API, https://{api-id}.execute-api.{region}.amazonaws.com/{stage}.
+# Without it nothing is pushed, and clients keep polling
+PUSH_ENDPOINT = os.environ.get("PUSH_ENDPOINT", "")
+
+
+class PushTransport:
+    """
+    Sends messages to clients connected to the game's push channel, by their connection IDs.
+    """
+    def send(self, connection_id: str, message: str) -> bool:
+        """
+        :param connection_id: The connection to send to
+        :param message: The JSON-formatted message
+        :return: False if the connection is gone, so it should no longer be sent to
+        :raises Exception: if sending failed for any other reason
+        """
+        raise NotImplementedError
+
+    def disconnect(self, connection_id: str) -> None:
+        """
+        Closes a connection, e.g. once its game has ended.
+        :param connection_id: The connection to close
+        """
+        raise NotImplementedError
+
+
+class InProcessTransport(PushTransport):
+    """
+    A transport that keeps the messages sent to each connection in memory, so pushes can be checked
+     without a WebSocket API, e.g. in tests and benchmarks.
+    """
+    def __init__(self):
+        self.messages: Dict[str, List[str]] = defaultdict(list)
+        self.gone: Set[str] = set()
+
+    def send(self, connection_id: str, message: str) -> bool:
+        if connection_id in self.gone:
+            return False
+        self.messages[connection_id].append(message)
+        return True
+
+    def disconnect(self, connection_id: str) -> None:
+        self.gone.add(connection_id)
+
+
+class ApiGatewayTransport(PushTransport):
+    """
+    A transport posting to the connections of an API Gateway WebSocket API, through its management API.
+    """
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self._client: Any = None
+
+    def send(self, connection_id: str, message: str) -> bool:
+        client = self._management_client()
+        try:
+            client.post_to_connection(ConnectionId=connection_id, Data=message.encode())
+
+        except client.exceptions.GoneException:
+            return False
+
+        return True
+
+    def disconnect(self, connection_id: str) -> None:
+        client = self._management_client()
+        try:
+            client.delete_connection(ConnectionId=connection_id)
+
+        except client.exceptions.GoneException:
+            pass
+
+    def _management_client(self) -> Any:
+        # boto3 is only imported once there is something to push
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('apigatewaymanagementapi', endpoint_url=self.endpoint)
+        return self._client
+
+
+_transport: Optional[PushTransport] = ApiGatewayTransport(PUSH_ENDPOINT) if PUSH_ENDPOINT else None
+
+
+def use_transport(transport: Optional[PushTransport]) -> None:
+    """
+    Makes the handlers push changes through the given transport, or stop pushing if it is None.
+    """
+    global _transport
+    _transport = transport
+
+
+def current_transport() -> Optional[PushTransport]:
+    return _transport
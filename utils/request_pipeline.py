@@ -0,0 +1,209 @@
+import base64
+import functools
+import sys
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, get_args, get_origin
+
+from utils import json_codec
+from utils.lambda_exception_handler import LambdaExceptionHandler
+
+Handler = Callable[[Dict[str, Any], Any], Dict[str, Any]]
+
+
+class RequestError(Exception):
+    """
+    Raised while handling a request, to respond with the given error.
+    """
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class Parameter(NamedTuple):
+    """
+    A query parameter a request must have.
+    """
+    name: str
+    missing_error: str
+
+
+class Field(NamedTuple):
+    """
+    A field of a request's JSON body, and the type of JSON value it holds- a string, unless declared otherwise.
+    A field with a missing error must be present, and a field without one is optional.
+    """
+    name: str
+    missing_error: Optional[str]
+    kind: Any = str
+
+
+# the names of the types a field can hold, for the errors of fields holding another type
+KIND_NAMES = {str: "a string", List[str]: "a list of strings"}
+
+
+class Route(NamedTuple):
+    method: str
+    path: str
+    query: Sequence[Parameter]
+    body: Sequence[Field]
+
+
+GAME_ID = Parameter("gameId", "Failed to process game PIN")
+
+
+class Request:
+    """
+    A request that passed its route's checks- its required query parameters and body fields are all present,
+     and its body fields hold the types they were declared with.
+    """
+    def __init__(self, event: Dict[str, Any], query: Dict[str, str], body: Dict[str, Any]):
+        self.event = event
+        self.query = query
+        self.body = body
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return self.event.get('headers') or {}
+
+
+Action = Callable[[Request, Any], Dict[str, Any]]
+
+
+def route(method: str, path: str, query: Sequence[Parameter] = (), body: Sequence[Field] = ()) -> Callable[[Action], Handler]:
+    """
+    Turns a function handling a parsed request into a lambda handler. The handler checks the request's method,
+     decodes its query parameters and body, and checks the required ones are present and the body's fields hold
+     their types, before calling the function.
+    Errors the function raises are mapped to responses in one place- a RequestError to its own status,
+     a missing item to 404, a failed DynamoDB connection or write to 503 and any other DynamoDB error to 500.
+    Handlers import the DynamoDB models inside the function, after their own checks, rather than at the top of
+     their module, so a request rejected by the pipeline or the handler is answered without loading boto3 and
+     PynamoDB on a cold start. The stream consumers follow the same pattern, for their empty batches.
+    :param method: The REST method the handler accepts
+    :param path: The path the handler serves, under the router
+    :param query: The query parameters the request must have
+    :param body: The fields the request's body may have
+    :return: A decorator for the function
+    """
+    declared = Route(method, path, tuple(query), tuple(body))
+
+    def decorator(action: Action) -> Handler:
+        @functools.wraps(action)
+        def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            if event.get('requestContext', {}).get('http', {}).get('method', '') != method:
+                return LambdaExceptionHandler.handle_error(405, f"Only {method} request allowed")
+
+            try:
+                return action(_parse(event, declared), context)
+
+            except Exception as error:
+                response = error_response(error)
+                if response is None:
+                    raise
+                return response
+
+        handler.route = declared
+        return handler
+    return decorator
+
+
+def routes(handlers: Iterable[Handler]) -> Dict[str, Dict[str, Handler]]:
+    """
+    :param handlers: Handlers created by route
+    :return: A map from each path to the handlers of the REST methods it supports
+    """
+    table: Dict[str, Dict[str, Handler]] = {}
+    for handler in handlers:
+        table.setdefault(handler.route.path, {})[handler.route.method] = handler
+    return table
+
+
+def json_response(status_code: int, body: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    :return: A REST response with the given body, encoded by the current JSON codec
+    """
+    response: Dict[str, Any] = {'statusCode': status_code}
+    if headers:
+        response['headers'] = headers
+    response['body'] = json_codec.dumps(body)
+    return response
+
+
+def serialized_response(status_code: int, body: str, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    :return: A REST response with the given body, which is already JSON-formatted
+    """
+    response: Dict[str, Any] = {'statusCode': status_code}
+    if headers:
+        response['headers'] = headers
+    response['body'] = body
+    return response
+
+
+def error_response(error: Exception) -> Optional[Dict[str, Any]]:
+    """
+    :return: The response for an error raised while handling a request, or None for unexpected errors
+    """
+    if isinstance(error, RequestError):
+        return LambdaExceptionHandler.handle_error(error.status_code, error.message)
+
+    # a DynamoDB error can only be raised once PynamoDB was imported
+    exceptions = sys.modules.get("pynamodb.exceptions")
+    if exceptions is None:
+        return None
+
+    if isinstance(error, exceptions.DoesNotExist):
+        return LambdaExceptionHandler.handle_error(404, 'Given PIN does not belong to an existing game')
+
+    # handlers only catch the failed conditions of their writes. A write that failed otherwise, including a transaction
+    # DynamoDB cancelled over conflicts or throttling, is worth retrying
+    if isinstance(error, (exceptions.PynamoDBConnectionError, exceptions.TransactWriteError)):
+        return LambdaExceptionHandler.handle_error(503, 'Failed to connect. Please try again')
+
+    if isinstance(error, exceptions.PynamoDBException):
+        return LambdaExceptionHandler.handle_error(500, 'Internal Server Error')
+
+    return None
+
+
+def _parse(event: Dict[str, Any], declared: Route) -> Request:
+    query = event.get("queryStringParameters") or {}
+    for parameter in declared.query:
+        if not query.get(parameter.name):
+            raise RequestError(400, parameter.missing_error)
+
+    body = _decode_body(event)
+    for field in declared.body:
+        value = body.get(field.name)
+        # a null field is a missing one
+        if value is not None and not _holds(value, field.kind):
+            raise RequestError(400, f"{field.name} must be {KIND_NAMES[field.kind]}")
+        if not value and field.missing_error is not None:
+            raise RequestError(400, field.missing_error)
+
+    return Request(event, query, body)
+
+
+def _holds(value: Any, kind: Any) -> bool:
+    if get_origin(kind) is list:
+        item_kind, = get_args(kind)
+        return isinstance(value, list) and all(_holds(item, item_kind) for item in value)
+    return isinstance(value, kind)
+
+
+def _decode_body(event: Dict[str, Any]) -> Dict[str, Any]:
+    # Function URLs leave the body out of requests that have none
+    raw_body = event.get('body')
+    if not raw_body:
+        return {}
+
+    try:
+        if event.get('isBase64Encoded'):
+            raw_body = base64.b64decode(raw_body)
+        body = json_codec.loads(raw_body)
+    except ValueError:
+        raise RequestError(400, "Body must be a JSON object")
+
+    if not isinstance(body, dict):
+        raise RequestError(400, "Body must be a JSON object")
+    return body